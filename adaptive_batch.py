@@ -0,0 +1,123 @@
+"""
+Módulo: adaptive_batch.py
+Descripción: Ajuste automático del tamaño de batch de los clasificadores según la
+             latencia medida por comentario y la tasa de respuestas incompletas.
+
+Regla: mientras el p95 de latencia por comentario resuelto baje, el batch crece. Dos
+respuestas sin ningún id válido (JSON inválido o truncado) con el mismo tamaño lo
+reducen a la mitad y ese tamaño pasa a ser el techo; una falla aislada no, porque un
+JSON roto ocasional no depende del tamaño del batch. Los ids sueltos que faltan tampoco:
+ya se reencolan y su costo entra en la latencia por comentario resuelto. Tras
+`reprobe_after` batches sin reducciones el techo sube un 25% y se vuelve a probar crecer.
+"""
+
+import math
+import logging
+import threading
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100.0 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class AdaptiveBatchController:
+    def __init__(self, initial: int, min_size: int = 1, max_size: int = 25, window: int = 5,
+                 reprobe_after: int = 20, fail_limit: int = 2):
+        self.min_size = max(1, min_size)
+        self.max_size = max(self.min_size, max_size)
+        self.initial = min(max(initial, self.min_size), self.max_size)
+        self.window = window
+        self.reprobe_after = reprobe_after
+        # Batches desde la última reducción del techo
+        self._since_shrink = 0
+        # Respuestas inválidas con el tamaño vigente; al llegar a fail_limit se reduce el batch
+        self.fail_limit = max(1, fail_limit)
+        self._failures = 0
+        self._size = self.initial
+        self._ceiling = self.max_size
+        self._samples: List[float] = []
+        # p95 de latencia por comentario de cada tamaño ya evaluado
+        self._p95_by_size: Dict[int, float] = {}
+        self._previous_size: Optional[int] = None
+        self._lock = threading.Lock()
+        self.history: List[int] = [self._size]
+        self.batches = 0
+        self.partial_batches = 0
+        self.failed_batches = 0
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+    def _set_size(self, new_size: int):
+        if new_size != self._size:
+            self._previous_size = self._size
+            self._size = new_size
+            self._samples = []
+            self._failures = 0
+            self.history.append(new_size)
+
+    def record(self, batch_size: int, latency: float, resolved: int):
+        """Registra un batch: cuántos comentarios tenía, cuánto tardó y cuántos volvieron válidos."""
+        with self._lock:
+            self.batches += 1
+            if batch_size > 0 and resolved == 0:
+                self.failed_batches += 1
+                if batch_size == self._size:
+                    self._failures += 1
+                if self._failures < self.fail_limit:
+                    return
+                # El tamaño que volvió a fallar marca el techo; se vuelve a la mitad
+                self._ceiling = max(self.min_size, min(self._ceiling, batch_size - 1))
+                shrunk = max(self.min_size, min(batch_size // 2, self._ceiling))
+                logging.info(f"Respuesta inválida o truncada (0/{batch_size}); batch reducido a {shrunk}.")
+                self._since_shrink = 0
+                self._set_size(shrunk)
+                return
+            if resolved < batch_size:
+                # Ids faltantes: se reencolan en main(), no son motivo para achicar el batch
+                self.partial_batches += 1
+
+            self._since_shrink += 1
+            if self._ceiling < self.max_size and self._since_shrink >= self.reprobe_after:
+                raised = min(self.max_size, max(self._ceiling + 1, math.ceil(self._ceiling * 1.25)))
+                logging.info(f"{self._since_shrink} batches sin reducir el batch; techo de {self._ceiling} a {raised}.")
+                self._ceiling = raised
+                self._since_shrink = 0
+                self._p95_by_size = {}
+
+            # Solo cuentan las muestras del tamaño vigente
+            if batch_size != self._size or batch_size == 0:
+                return
+            self._samples.append(latency / resolved)
+            if len(self._samples) < self.window:
+                return
+
+            p95 = percentile(self._samples, 95)
+            self._p95_by_size[self._size] = p95
+            previous = self._p95_by_size.get(self._previous_size) if self._previous_size else None
+            if previous is not None and self._previous_size < self._size and p95 >= previous:
+                # Crecer dejó de mejorar la latencia por comentario: volver y fijar el techo
+                self._ceiling = self._size - 1
+                self._set_size(self._previous_size)
+                return
+
+            grown = min(self._ceiling, max(self._size + 1, math.ceil(self._size * 1.5)))
+            if grown > self._size:
+                self._set_size(grown)
+            else:
+                self._samples = []
+
+    def summary(self) -> str:
+        with self._lock:
+            return (
+                f"batch adaptativo: inicial {self.initial}, final {self._size}, "
+                f"recorrido {self.history}, {self.partial_batches}/{self.batches} batches con ids faltantes, "
+                f"{self.failed_batches} con respuesta inválida"
+            )
@@ -0,0 +1,192 @@
+"""
+Script: benchmark_classifiers.py
+Descripción: Mide de punta a punta classify_apoyo.py, classify_apoyo_carol.py y classify_topics.py
+             contra el Ollama simulado (fake_ollama_server.py) con datasets sintéticos de varios
+             tamaños. Reporta comentarios/seg, requests/comentario y latencia de cola (p50/p95/p99)
+             para detectar regresiones en batching, cache o concurrencia, y los tokens de prompt
+             evaluados por request (eval/req) con la fracción reutilizada del prefijo (reuso).
+
+Uso:
+    python benchmark_classifiers.py --sizes 460,10000,100000 --latency lognormal:0.2:0.5 --slots 4
+    python benchmark_classifiers.py --sizes 460 --scripts apoyo,topics --malformed 0.05 --throttle 0.02 --json bench.json
+
+Cada corrida usa un directorio temporal nuevo (cache vacía), así se mide el costo en frío.
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import logging
+import tempfile
+import subprocess
+from typing import Any, Dict, List
+
+import requests
+
+from adaptive_batch import percentile
+from fake_ollama_server import add_server_arguments, fake_from_args, serve
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRIPTS = {
+    "apoyo": "classify_apoyo.py",
+    "carol": "classify_apoyo_carol.py",
+    "topics": "classify_topics.py",
+}
+
+VOCABULARY = (
+    "el doctor salvó muchas vidas dejen trabajar al intendente la denuncia es política barata "
+    "la constitución no permite cobrar dos sueldos carol tiene razón daniel es un gran médico "
+    "que vergüenza esta gestión municipal pacientes sanatorio ley jutep circo oportunismo "
+    "resentimiento ética humanidad cirujano privado público honestidad campaña votos"
+).split()
+
+
+def generate_dataset(path: str, size: int, dup_rate: float, seed: int = 7):
+    """CSV con el formato de Analítica_Datos_Daniel_Carol.csv; una fracción de comentarios se repite."""
+    rng = random.Random(seed)
+    comments: List[str] = []
+    with open(path, mode="w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["#", "Autor", "Comentario"])
+        for i in range(1, size + 1):
+            if comments and rng.random() < dup_rate:
+                text = rng.choice(comments)
+            else:
+                words = rng.choices(VOCABULARY, k=rng.randint(8, 40))
+                text = " ".join(words).capitalize() + f" ({i})"
+                comments.append(text)
+            writer.writerow([i, f"Usuario {i}", text])
+
+
+def build_command(script: str, workdir: str, input_csv: str, host: str, args: argparse.Namespace):
+    """Comando y variables de entorno para correr un clasificador contra el servidor simulado."""
+    output_csv = os.path.join(workdir, f"salida_{script}.csv")
+    cache_file = os.path.join(workdir, f"cache_{script}.json")
+    env = dict(os.environ)
+    if script == "topics":
+        cmd = [
+            sys.executable, os.path.join(BASE_DIR, SCRIPTS[script]),
+            "--input", input_csv, "--output", output_csv, "--host", host,
+            "--cache_file", cache_file, "--batch_size", str(args.topic_batch_size),
+            "--checkpoint_every", str(args.checkpoint_every),
+        ]
+        if args.stream:
+            cmd.append("--stream")
+        return cmd, env
+
+    env.update({
+        "OLLAMA_HOST": host,
+        "INPUT_CSV": input_csv,
+        "OUTPUT_CSV": output_csv,
+        "LABEL_CACHE_FILE": cache_file,
+        "BATCH_SIZE": str(args.batch_size),
+        "MAX_WORKERS": str(args.workers),
+        "OLLAMA_STREAM": "1" if args.stream else "0",
+        "ADAPTIVE_BATCH": "1" if args.adaptive else "0",
+        "CHECKPOINT_FILE": os.path.join(workdir, f"journal_{script}.jsonl"),
+    })
+    return [sys.executable, os.path.join(BASE_DIR, SCRIPTS[script])], env
+
+
+def run_one(script: str, size: int, input_csv: str, host: str, args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix=f"bench_{script}_") as workdir:
+        cmd, env = build_command(script, workdir, input_csv, host, args)
+        requests.post(f"{host}/stats/reset", timeout=10)
+        log_path = os.path.join(workdir, "run.log")
+        started = time.perf_counter()
+        with open(log_path, "w", encoding="utf-8") as log:
+            proc = subprocess.run(cmd, env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        elapsed = time.perf_counter() - started
+        stats = requests.get(f"{host}/stats", timeout=10).json()
+        if proc.returncode != 0:
+            with open(log_path, encoding="utf-8") as log:
+                logging.error(f"{SCRIPTS[script]} terminó con código {proc.returncode}:\n{log.read()[-2000:]}")
+
+    latencies = stats.pop("latencies")
+    return {
+        "script": script,
+        "size": size,
+        "ok": proc.returncode == 0,
+        "seconds": round(elapsed, 2),
+        "comments_per_sec": round(size / elapsed, 2) if elapsed else 0.0,
+        "requests_per_comment": round(stats["requests"] / size, 3) if size else 0.0,
+        "p50": round(percentile(latencies, 50), 3),
+        "p95": round(percentile(latencies, 95), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        # Tokens de prompt evaluados por request y fracción reutilizada del prefijo anterior
+        "prompt_eval_per_request": round(stats["prompt_tokens"] / stats["requests"], 1) if stats["requests"] else 0.0,
+        "prefix_reuse": round(1 - stats["prompt_tokens"] / stats["prompt_tokens_total"], 3) if stats["prompt_tokens_total"] else 0.0,
+        **stats,
+    }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f"{'script':<8}{'tamaño':>9}{'seg':>9}{'com/s':>9}{'req/com':>9}{'p50':>8}{'p95':>8}{'p99':>8}{'429':>6}{'malf.':>7}{'eval/req':>10}{'reuso':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        flag = "" if r["ok"] else "  (ERROR)"
+        print(
+            f"{r['script']:<8}{r['size']:>9}{r['seconds']:>9.1f}{r['comments_per_sec']:>9.1f}"
+            f"{r['requests_per_comment']:>9.3f}{r['p50']:>8.3f}{r['p95']:>8.3f}{r['p99']:>8.3f}"
+            f"{r['throttled']:>6}{r['malformed']:>7}{r['prompt_eval_per_request']:>10.1f}{r['prefix_reuse']:>8.1%}{flag}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de los clasificadores contra un Ollama simulado")
+    parser.add_argument("--sizes", default="460,10000,100000", help="Tamaños de dataset separados por coma")
+    parser.add_argument("--scripts", default="apoyo,carol,topics", help="Clasificadores a medir (apoyo,carol,topics)")
+    parser.add_argument("--port", type=int, default=11500, help="Puerto del servidor simulado")
+    parser.add_argument("--batch_size", type=int, default=5, help="BATCH_SIZE de los clasificadores de postura")
+    parser.add_argument("--workers", type=int, default=4, help="MAX_WORKERS de los clasificadores de postura")
+    parser.add_argument("--adaptive", action="store_true", help="Activar ADAPTIVE_BATCH")
+    parser.add_argument("--topic_batch_size", type=int, default=10, help="--batch_size de classify_topics.py")
+    parser.add_argument("--checkpoint_every", type=int, default=1000, help="--checkpoint_every de classify_topics.py")
+    parser.add_argument("--stream", action="store_true", help="Usar respuestas en streaming")
+    parser.add_argument("--dup_rate", type=float, default=0.05, help="Fracción de comentarios repetidos")
+    parser.add_argument("--json", default="", help="Guardar los resultados en este archivo JSON")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    scripts = [s.strip() for s in args.scripts.split(",") if s.strip()]
+    unknown = [s for s in scripts if s not in SCRIPTS]
+    if unknown:
+        parser.error(f"Clasificadores desconocidos: {unknown}")
+
+    server = serve("127.0.0.1", args.port, fake_from_args(args))
+    host = f"http://127.0.0.1:{server.server_address[1]}"
+    logging.info(f"Ollama simulado en {host} (latencia {args.latency}, {args.slots} slots)")
+
+    results = []
+    try:
+        with tempfile.TemporaryDirectory(prefix="bench_data_") as data_dir:
+            for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+                input_csv = os.path.join(data_dir, f"sinteticos_{size}.csv")
+                generate_dataset(input_csv, size, args.dup_rate)
+                for script in scripts:
+                    logging.info(f"Midiendo {SCRIPTS[script]} con {size} comentarios...")
+                    result = run_one(script, size, input_csv, host, args)
+                    logging.info(
+                        f"{script}/{size}: {result['comments_per_sec']} com/s, "
+                        f"{result['requests_per_comment']} req/com, p95 {result['p95']}s"
+                    )
+                    results.append(result)
+    finally:
+        server.shutdown()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        logging.info(f"Resultados guardados en: {os.path.abspath(args.json)}")
+
+
+if __name__ == "__main__":
+    main()
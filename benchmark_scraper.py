@@ -0,0 +1,193 @@
+"""
+Script: benchmark_scraper.py
+Descripción: Mide el tiempo de extracción por pasada de playwright_real_profile.py sobre
+             hilos largos guardados como HTML local, sin abrir Facebook. Compara la extracción
+             anterior (un text_content() por nodo de texto de cada artículo, recorriendo todos
+             en cada pasada) con extract_articles() (un solo page.evaluate que solo procesa los
+             artículos todavía no marcados).
+
+El hilo se va mostrando de a --step artículos por pasada, como cuando el scraper hace
+scroll y expande respuestas. Sin --fixture se generan hilos sintéticos con la estructura
+de Facebook (artículo con autor, cuerpo, fecha y botones) en --fixtures_dir; también se
+puede pasar una página guardada con el navegador.
+
+Uso:
+    python benchmark_scraper.py --articles 500,2000 --step 100
+    python benchmark_scraper.py --fixture hilo_guardado.html --step 200 --skip_legacy
+
+Requiere playwright y su Chromium (python -m playwright install chromium).
+"""
+
+import os
+import html
+import time
+import random
+import asyncio
+import argparse
+import logging
+from typing import Any, Dict, List, Tuple
+
+from playwright.async_api import async_playwright
+
+from adaptive_batch import percentile
+from playwright_real_profile import ARTICLE_SELECTOR, TEXT_SELECTOR, extract_articles
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+AUTHORS = ["María Benítez", "Juan Pérez", "Carla Giménez", "Diego Sosa", "Lucía Fernández", "Pablo Acosta"]
+SENTENCES = [
+    "El doctor salvó muchas vidas, dejen trabajar al intendente.",
+    "La constitución no permite cobrar dos sueldos del Estado.",
+    "Esto es política barata en plena campaña.",
+    "Carol tiene razón, la ley es para todos.",
+    "Que vergüenza esta gestión municipal.",
+    "Daniel es un gran médico y una gran persona.",
+]
+
+# Saca del DOM los artículos de primer nivel (las respuestas viajan dentro de su comentario)
+# para volver a mostrarlos de a poco en cada pasada
+DETACH_JS = """
+(articleSelector) => {
+    const top = [...document.querySelectorAll(articleSelector)]
+        .filter(a => !a.parentElement.closest(articleSelector));
+    window.__thread = top.length ? top[0].parentElement : document.body;
+    window.__pending = top;
+    top.forEach(a => a.remove());
+    return top.length;
+}
+"""
+
+REVEAL_JS = """
+(count) => {
+    const next = window.__pending.splice(0, count);
+    next.forEach(a => window.__thread.appendChild(a));
+    return window.__pending.length;
+}
+"""
+
+
+def article_html(rng: random.Random, index: int, replies: int) -> str:
+    author = html.escape(rng.choice(AUTHORS))
+    body = html.escape(" ".join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 4))) + f" #{index}")
+    nested = "".join(article_html(rng, index * 100 + r, 0) for r in range(replies))
+    return (
+        '<div role="article"><div>'
+        f'<span dir="auto"><a href="#">{author}</a></span>'
+        f'<div dir="auto"><div dir="auto">{body}</div></div>'
+        f'<span dir="auto">{rng.randint(1, 9)} sem</span>'
+        '<div role="button"><span dir="auto">Me gusta</span></div>'
+        '<div role="button"><span dir="auto">Responder</span></div>'
+        f'</div><div>{nested}</div></div>'
+    )
+
+
+def generate_fixture(path: str, articles: int, reply_rate: float, seed: int = 7):
+    """Hilo con `articles` comentarios de primer nivel; una fracción trae 1-3 respuestas anidadas."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<!DOCTYPE html><html><head><meta charset="utf-8"></head><body><div role="main"><div>')
+        for i in range(1, articles + 1):
+            replies = rng.randint(1, 3) if rng.random() < reply_rate else 0
+            f.write(article_html(rng, i, replies))
+        f.write("</div></div></body></html>")
+
+
+async def legacy_extract(page) -> List[Tuple[str, str]]:
+    """Extracción anterior: recorre todos los artículos con un round-trip por nodo de texto."""
+    rows = []
+    for el in await page.locator(ARTICLE_SELECTOR).all():
+        text_nodes = el.locator(TEXT_SELECTOR)
+        parts = []
+        for i in range(await text_nodes.count()):
+            content = await text_nodes.nth(i).text_content()
+            if content:
+                parts.append(content.strip())
+        if len(parts) >= 2:
+            rows.append((parts[0], max(parts[1:], key=len)))
+    return rows
+
+
+async def run_fixture(browser, path: str, step: int, skip_legacy: bool) -> List[Dict[str, Any]]:
+    page = await browser.new_page()
+    await page.goto(f"file://{os.path.abspath(path)}")
+    await page.evaluate(DETACH_JS, ARTICLE_SELECTOR)
+
+    passes = []
+    seen = set()
+    remaining = 1
+    while remaining:
+        remaining = await page.evaluate(REVEAL_JS, step)
+        visible = await page.locator(ARTICLE_SELECTOR).count()
+        result: Dict[str, Any] = {"pass": len(passes) + 1, "visible": visible}
+        if not skip_legacy:
+            started = time.perf_counter()
+            legacy_rows = await legacy_extract(page)
+            result["legacy_s"] = time.perf_counter() - started
+            result["legacy_rows"] = len(legacy_rows)
+        started = time.perf_counter()
+        rows = await extract_articles(page)
+        result["evaluate_s"] = time.perf_counter() - started
+        result["new_rows"] = len(rows)
+        seen.update(rows)
+        result["total_rows"] = len(seen)
+        passes.append(result)
+    await page.close()
+    return passes
+
+
+def print_report(name: str, passes: List[Dict[str, Any]]):
+    legacy = "legacy_s" in passes[0]
+    print(f"\n{name}")
+    header = f"{'pasada':>7}{'visibles':>10}{'nuevos':>8}{'evaluate':>11}"
+    if legacy:
+        header += f"{'anterior':>11}{'mejora':>9}"
+    print(header)
+    for p in passes:
+        line = f"{p['pass']:>7}{p['visible']:>10}{p['new_rows']:>8}{p['evaluate_s'] * 1000:>9.1f}ms"
+        if legacy:
+            line += f"{p['legacy_s'] * 1000:>9.0f}ms{p['legacy_s'] / max(p['evaluate_s'], 1e-6):>8.0f}x"
+        print(line)
+    evaluate_times = [p["evaluate_s"] for p in passes]
+    summary = (
+        f"total evaluate {sum(evaluate_times):.2f}s (p50 {percentile(evaluate_times, 50) * 1000:.1f}ms, "
+        f"p95 {percentile(evaluate_times, 95) * 1000:.1f}ms por pasada), {passes[-1]['total_rows']} comentarios"
+    )
+    if legacy:
+        summary += f"; total anterior {sum(p['legacy_s'] for p in passes):.2f}s"
+    print(summary)
+
+
+async def run(args: argparse.Namespace):
+    fixtures = []
+    if args.fixture:
+        fixtures.append(args.fixture)
+    else:
+        os.makedirs(args.fixtures_dir, exist_ok=True)
+        for size in [int(s) for s in args.articles.split(",") if s.strip()]:
+            path = os.path.join(args.fixtures_dir, f"hilo_{size}.html")
+            if not os.path.exists(path):
+                generate_fixture(path, size, args.reply_rate)
+                logging.info(f"Fixture generado: {path}")
+            fixtures.append(path)
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        for path in fixtures:
+            print_report(os.path.basename(path), await run_fixture(browser, path, args.step, args.skip_legacy))
+        await browser.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de la extracción del scraper sobre hilos guardados en HTML")
+    parser.add_argument("--fixture", default="", help="Página HTML guardada (vacío = generar hilos sintéticos)")
+    parser.add_argument("--fixtures_dir", default="scraper_fixtures", help="Directorio de los hilos sintéticos")
+    parser.add_argument("--articles", default="500,2000", help="Comentarios de primer nivel por hilo sintético")
+    parser.add_argument("--reply_rate", type=float, default=0.3, help="Fracción de comentarios con respuestas anidadas")
+    parser.add_argument("--step", type=int, default=100, help="Comentarios que aparecen por pasada")
+    parser.add_argument("--skip_legacy", action="store_true", help="No medir la extracción anterior (lenta en hilos grandes)")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Módulo: checkpoint_journal.py
+Descripción: Journal de checkpoints append-only (JSONL id -> etiqueta) para reanudar
+             clasificaciones interrumpidas, escritura atómica del CSV final y un CSV
+             append-only para el scraper.
+"""
+
+import os
+import csv
+import json
+import time
+import codecs
+import logging
+from typing import Dict, Iterable, List
+
+
+class CheckpointJournal:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def load(self) -> Dict[str, str]:
+        """Lee las etiquetas ya guardadas. Una última línea truncada (corte a mitad de escritura) se ignora."""
+        done: Dict[str, str] = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                    done[str(entry["id"])] = entry["label"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    logging.warning(f"Línea {line_number} del journal ilegible; se ignora.")
+        return done
+
+    def append(self, labels: Dict[str, str]):
+        """Agrega las etiquetas de un batch y fuerza el volcado a disco."""
+        if not labels:
+            return
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        for rid, label in labels.items():
+            self._file.write(json.dumps({"id": rid, "label": label}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def write_csv_atomic(path: str, fieldnames: List[str], rows: Iterable[Dict[str, str]]):
+    """Escribe el CSV en un temporal junto al destino y lo renombra al terminar."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, mode="w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class AppendOnlyCsv:
+    """
+    CSV que solo crece: el archivo queda abierto, cada pasada agrega sus filas y hace flush,
+    y el fsync se hace cada `fsync_interval` segundos (y al cerrar). Al reabrir un archivo
+    existente, load() devuelve las filas ya guardadas y descarta una última fila truncada
+    por un corte a mitad de escritura.
+    """
+
+    def __init__(self, path: str, fieldnames: List[str], fsync_interval: float = 30.0):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.fsync_interval = fsync_interval
+        self._file = None
+        self._writer = None
+        self._last_fsync = time.monotonic()
+
+    def load(self) -> List[Dict[str, str]]:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return []
+        with open(self.path, "rb") as f:
+            raw = f.read()
+        bom = len(codecs.BOM_UTF8) if raw.startswith(codecs.BOM_UTF8) else 0
+        content = raw[bom:].decode("utf-8", errors="replace")
+
+        # Un registro está completo si termina en salto de línea (los comentarios pueden
+        # tener saltos de línea entre comillas, por eso se parsea en vez de cortar por línea)
+        parts = content.split("\n")
+        lines = [part + "\n" for part in parts[:-1]] + ([parts[-1]] if parts[-1] else [])
+        consumed = 0
+        exhausted = False
+
+        def feed():
+            nonlocal consumed, exhausted
+            for line in lines:
+                consumed += len(line)
+                yield line
+            exhausted = True
+
+        records: List[List[str]] = []
+        complete = 0
+        try:
+            for record in csv.reader(feed()):
+                # Si el lector tuvo que pedir más líneas de las que hay, el registro quedó
+                # cortado (por ejemplo, con comillas sin cerrar)
+                if exhausted or content[consumed - 1 : consumed] != "\n":
+                    break
+                records.append(record)
+                complete = consumed
+        except csv.Error as e:
+            logging.warning(f"{self.path}: registro ilegible al final ({e}); se descarta.")
+
+        if complete < len(content):
+            logging.warning(f"{self.path}: última fila incompleta; se descarta y se trunca el archivo.")
+            with open(self.path, "r+b") as f:
+                # Sin ningún registro completo (ni el encabezado) se vacía para empezar de cero
+                f.truncate(bom + len(content[:complete].encode("utf-8")) if complete else 0)
+        if not records:
+            return []
+        header, rows = records[0], records[1:]
+        if header != self.fieldnames:
+            raise ValueError(f"{self.path} tiene columnas {header}, se esperaban {self.fieldnames}")
+        return [dict(zip(header, row)) for row in rows if row]
+
+    def _open(self):
+        new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        # Al agregar a un archivo existente no se repite el BOM ni el encabezado
+        self._file = open(self.path, "w" if new_file else "a", encoding="utf-8-sig" if new_file else "utf-8", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=self.fieldnames, extrasaction="ignore")
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows: Iterable[Dict[str, str]]):
+        if self._file is None:
+            self._open()
+        self._writer.writerows(rows)
+
+    def flush(self, force_fsync: bool = False):
+        """Vacía el buffer; fsync solo si pasó fsync_interval desde el último (o si se fuerza)."""
+        if self._file is None:
+            return
+        self._file.flush()
+        if force_fsync or time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.flush(force_fsync=True)
+            self._file.close()
+            self._file = None
+            self._writer = None
@@ -8,15 +8,24 @@ Ejecución:
 """
 
 import os
-import csv
 import json
 import time
 import re
 import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Dict, Any
-import requests
 from dotenv import load_dotenv
 
+from adaptive_batch import AdaptiveBatchController
+from label_cache import LabelCache, open_label_cache
+from llm_metrics import METRICS
+from ollama_client import REQUEST_ERRORS, STREAM_STATS, get_client, retry_delay
+from prompt_builder import DEFAULT_KEEP_ALIVE, PromptBuilder, comment_lines, parse_keep_alive
+from local_model import model_preclassify
+from rule_classifier import preclassify
+from table_io import RowWriter, read_rows
+
 # Configuración de Logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -33,6 +42,12 @@ def load_config() -> Dict[str, Any]:
         "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "gpt-oss:20b-cloud"),
         "CLASSIFIER_CONTEXT": contexto_manual,
         "BATCH_SIZE": int(os.getenv("BATCH_SIZE", "5")),
+        # Batch adaptativo: BATCH_SIZE es el tamaño inicial y se ajusta entre MIN y MAX
+        "ADAPTIVE_BATCH": os.getenv("ADAPTIVE_BATCH", "0").lower() in ("1", "true", "yes"),
+        "MIN_BATCH_SIZE": int(os.getenv("MIN_BATCH_SIZE", "1")),
+        "MAX_BATCH_SIZE": int(os.getenv("MAX_BATCH_SIZE", "25")),
+        # Veces que un id sin respuesta válida se vuelve a encolar antes de marcarlo UNRESOLVED
+        "MAX_ATTEMPTS": max(1, int(os.getenv("MAX_ATTEMPTS", "3"))),
         "TEMPERATURE": float(os.getenv("TEMPERATURE", "0.0")),
         "TOP_P": float(os.getenv("TOP_P", "0.9")),
         "INPUT_CSV": os.getenv("INPUT_CSV", "input.csv"),
@@ -40,8 +55,27 @@ def load_config() -> Dict[str, Any]:
         "COMMENT_COLUMN": os.getenv("COMMENT_COLUMN", "Comentario"),
         "ID_COLUMN": os.getenv("ID_COLUMN", "#"),
         "APOYO_COLUMN": os.getenv("APOYO_COLUMN", "Apoyo Daniel"),
-        "SLEEP_MS": int(os.getenv("SLEEP_BETWEEN_BATCHES_MS", "200")),
-        "TIMEOUT": 180,
+        # Ritmo compartido por todas las llamadas (0 = sin límite); reemplaza la pausa fija entre batches
+        "RPS": float(os.getenv("OLLAMA_RPS", "0")),
+        "MAX_CONCURRENCY": int(os.getenv("OLLAMA_MAX_CONCURRENCY", "0")),
+        # Batches en vuelo simultáneamente (1 = modo secuencial original)
+        "MAX_WORKERS": max(1, int(os.getenv("MAX_WORKERS", "1"))),
+        # Streaming: corta la generación apenas se cierra el JSON de respuesta
+        "STREAM": os.getenv("OLLAMA_STREAM", "0").lower() in ("1", "true", "yes"),
+        "CACHE_FILE": os.getenv("LABEL_CACHE_FILE", "labels_cache.json"),
+        "POOL_SIZE": int(os.getenv("OLLAMA_POOL_SIZE", "10")),
+        "TIMEOUT": float(os.getenv("TIMEOUT", "180")),
+        # Tiempo que el modelo queda cargado tras cada request ("30m", "1h", -1 = siempre)
+        "KEEP_ALIVE": parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE)),
+        # Métricas por request en JSONL (vacío = solo el resumen final)
+        "METRICS_FILE": os.getenv("METRICS_FILE", "llm_metrics.jsonl"),
+        # Pre-clasificador por reglas: los comentarios obvios no llegan al LLM
+        "PRECLASSIFY": os.getenv("PRECLASSIFY", "0").lower() in ("1", "true", "yes"),
+        "PRECLASSIFY_THRESHOLD": float(os.getenv("PRECLASSIFY_THRESHOLD", "0.9")),
+        "PRECLASSIFY_AUDIT_FILE": os.getenv("PRECLASSIFY_AUDIT_FILE", "rule_labels.jsonl"),
+        # Modelo local entrenado con local_model.py (vacío = desactivado)
+        "LOCAL_MODEL_FILE": os.getenv("LOCAL_MODEL_FILE_DANIEL", ""),
+        "LOCAL_MODEL_THRESHOLD": float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.9")),
     }
 
 
@@ -79,24 +113,56 @@ def extract_json_array(text: str) -> List[Dict[str, Any]]:
     return []
 
 
-def call_ollama(
-    config: Dict[str, Any], messages: List[Dict[str, str]]
-) -> List[Dict[str, Any]]:
-    """Llamada a Ollama con reintentos y backoff exponencial."""
-    url = f"{config['OLLAMA_HOST']}/api/chat"
-    payload = {
-        "model": config["OLLAMA_MODEL"],
-        "messages": messages,
-        "stream": False,
-        "options": {"temperature": config["TEMPERATURE"], "top_p": config["TOP_P"]},
-    }
+VALID_LABELS = {"FAVORABLE", "CONTRARIO", "NEUTRAL"}
+# Marca explícita para los ids que agotaron sus intentos sin una etiqueta válida
+UNRESOLVED_LABEL = "UNRESOLVED"
+
+# Instrucciones fijas; van al final del prefijo invariante y forman parte de la clave de cache
+USER_INSTRUCTIONS = (
+    "Devolvé SOLO JSON válido, sin texto extra.\n"
+    'Formato: [{"id":"<id>","apoyo":"FAVORABLE|CONTRARIO|NEUTRAL"}, ...]\n'
+    "Evitá NEUTRAL: usalo SOLO si el comentario no tiene postura sobre Ximénez. Si hay defensa/justificación aunque sea indirecta => FAVORABLE.\n\n"
+    "Comentarios:\n"
+)
+
+
+def sampling_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {"temperature": config["TEMPERATURE"], "top_p": config["TOP_P"]}
+
 
+def prompt_builder(config: Dict[str, Any]) -> PromptBuilder:
+    """Prefijo idéntico en todas las llamadas: contexto + instrucciones + formato."""
+    return PromptBuilder(config["CLASSIFIER_CONTEXT"] + "\n\n" + USER_INSTRUCTIONS, config["KEEP_ALIVE"])
+
+
+def cache_key(config: Dict[str, Any], text: str) -> str:
+    return LabelCache.make_key(
+        config["OLLAMA_MODEL"],
+        config["CLASSIFIER_CONTEXT"] + USER_INSTRUCTIONS,
+        sampling_options(config),
+        text,
+    )
+
+
+def call_ollama(config: Dict[str, Any], payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Llamada a Ollama con reintentos ante errores de red o del servidor; el backoff ante
+    429/503 lo coordina el rate limiter del cliente y el resto espera un backoff
+    exponencial acotado (ollama_client.retry_delay). Una respuesta sin JSON utilizable no se
+    reintenta acá: main() vuelve a encolar los ids que quedaron sin etiqueta.
+    """
+    client = get_client(
+        config["OLLAMA_HOST"], config["POOL_SIZE"], config["TIMEOUT"],
+        config["RPS"], config["MAX_CONCURRENCY"]
+    )
     retries = 3
     for i in range(retries):
         try:
-            response = requests.post(url, json=payload, timeout=config["TIMEOUT"])
-            response.raise_for_status()
-            content = response.json().get("message", {}).get("content", "")
+            with METRICS.context(attempt=i + 1):
+                if config["STREAM"]:
+                    content = client.stream("/api/chat", payload, "message")["content"]
+                else:
+                    content = client.post("/api/chat", payload).get("message", {}).get("content", "")
 
             results = extract_json_array(content)
             if results:
@@ -104,15 +170,18 @@ def call_ollama(
 
             # Si no hay array, intentar parsear directamente por si es JSON puro
             try:
-                return json.loads(content)
-            except:
-                pass
-        except (requests.exceptions.RequestException, Exception) as e:
-            wait_time = 2**i
-            logging.warning(
-                f"Error en intento {i+1}/{retries}: {e}. Reintentando en {wait_time}s..."
-            )
-            time.sleep(wait_time)
+                parsed = json.loads(content)
+                return [parsed] if isinstance(parsed, dict) else parsed
+            except (json.JSONDecodeError, ValueError):
+                METRICS.parse_failure(content)
+                return []
+        except REQUEST_ERRORS as e:
+            if i + 1 == retries:
+                logging.warning(f"Error en intento {i+1}/{retries}: {e}. Sin más reintentos.")
+                break
+            delay = retry_delay(e, i + 1)
+            logging.warning(f"Error en intento {i+1}/{retries}: {e}. Reintentando en {delay:.0f}s...")
+            time.sleep(delay)
 
     return []
 
@@ -121,33 +190,18 @@ def classify_batch(
     config: Dict[str, Any], batch: List[Dict[str, str]]
 ) -> Dict[str, str]:
     """Prepara el batch y llama al modelo para obtener las clasificaciones."""
-    system_msg = config["CLASSIFIER_CONTEXT"]
-
-    user_msg = (
-        "Devolvé SOLO JSON válido, sin texto extra.\n"
-        'Formato: [{"id":"<id>","apoyo":"FAVORABLE|CONTRARIO|NEUTRAL"}, ...]\n'
-        "Evitá NEUTRAL: usalo SOLO si el comentario no tiene postura sobre Ximénez. Si hay defensa/justificación aunque sea indirecta => FAVORABLE.\n\n"
-        "Comentarios:\n"
+    payload = prompt_builder(config).chat_payload(
+        config["OLLAMA_MODEL"], comment_lines(batch), sampling_options(config)
     )
-
-    for item in batch:
-        user_msg += f"- ID: {item['id']}, Comentario: {item['text']}\n"
-
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": user_msg},
-    ]
-
-    raw_results = call_ollama(config, messages)
+    raw_results = call_ollama(config, payload)
 
     # Mapear resultados por ID para fácil acceso
     classified_data: Dict[str, str] = {}
-    valid_labels = {"FAVORABLE", "CONTRARIO", "NEUTRAL"}
     for res in raw_results:
         if "id" in res and "apoyo" in res:
             res_id = str(res["id"]).strip()
             apoyo = str(res["apoyo"]).strip().upper()
-            if apoyo in valid_labels:
+            if apoyo in VALID_LABELS:
                 classified_data[res_id] = apoyo
 
     return classified_data
@@ -155,6 +209,7 @@ def classify_batch(
 
 def main():
     config = load_config()
+    METRICS.configure(config["METRICS_FILE"], "classify_apoyo")
     if not config["CLASSIFIER_CONTEXT"]:
         logging.error("CLASSIFIER_CONTEXT es obligatorio en el .env")
         return
@@ -163,61 +218,164 @@ def main():
         logging.error(f"No se encuentra el archivo de entrada: {config['INPUT_CSV']}")
         return
 
-    rows = []
-    with open(config["INPUT_CSV"], mode="r", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
-        fieldnames = reader.fieldnames
-        if config["APOYO_COLUMN"] not in fieldnames:
-            fieldnames.append(config["APOYO_COLUMN"])
+    # CSV (`,` o `;`) o Parquet/Arrow según la extensión
+    fieldnames, rows = read_rows(config["INPUT_CSV"])
+    if config["APOYO_COLUMN"] not in fieldnames:
+        fieldnames.append(config["APOYO_COLUMN"])
 
-        for idx, row in enumerate(reader):
-            # Obtener ID estable
-            row_id = row.get(config["ID_COLUMN"], str(idx))
-            row["__internal_id__"] = row_id  # Guardamos para el batch
-            rows.append(row)
+    for idx, row in enumerate(rows):
+        # Obtener ID estable
+        row_id = row.get(config["ID_COLUMN"], str(idx))
+        row["__internal_id__"] = row_id  # Guardamos para el batch
 
     total = len(rows)
     logging.info(f"Total de filas a procesar: {total}")
 
-    batch_size = config["BATCH_SIZE"]
+    labels: Dict[int, str] = {}
+    if config["PRECLASSIFY"]:
+        # Las etiquetas por reglas quedan en el archivo de auditoría, no en el cache del LLM
+        labels.update(preclassify(
+            "apoyo_daniel",
+            ((idx, row["__internal_id__"], row[config["COMMENT_COLUMN"]]) for idx, row in enumerate(rows)),
+            config["PRECLASSIFY_THRESHOLD"],
+            config["PRECLASSIFY_AUDIT_FILE"],
+        ))
+    if config["LOCAL_MODEL_FILE"]:
+        labels.update(model_preclassify(
+            "apoyo_daniel",
+            ((idx, row["__internal_id__"], row[config["COMMENT_COLUMN"]]) for idx, row in enumerate(rows)
+             if idx not in labels),
+            config["LOCAL_MODEL_FILE"],
+            config["LOCAL_MODEL_THRESHOLD"],
+            config["PRECLASSIFY_AUDIT_FILE"],
+        ))
+
+    # Resolver desde el cache todo lo que ya fue clasificado con el mismo modelo y prompt
+    cache = open_label_cache(config["CACHE_FILE"])
+    pending = deque()
+    preclassified = len(labels)
+    for idx, row in enumerate(rows):
+        if idx in labels:
+            continue
+        cached = cache.get(cache_key(config, row[config["COMMENT_COLUMN"]]))
+        if cached is not None:
+            labels[idx] = cached
+        else:
+            pending.append(idx)
+    logging.info(f"Resueltos desde cache: {len(labels) - preclassified}/{total}")
+
+    controller = None
+    if config["ADAPTIVE_BATCH"]:
+        controller = AdaptiveBatchController(
+            config["BATCH_SIZE"], config["MIN_BATCH_SIZE"], config["MAX_BATCH_SIZE"]
+        )
     processed_count = 0
 
-    with open(config["OUTPUT_CSV"], mode="w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for i in range(0, total, batch_size):
-            current_batch_rows = rows[i : i + batch_size]
-            batch_payload = [
-                {"id": r["__internal_id__"], "text": r[config["COMMENT_COLUMN"]]}
-                for r in current_batch_rows
-            ]
+    def process_batch(batch_indexes: List[int], batch_number: int) -> Dict[str, str]:
+        """Clasifica un batch; se ejecuta en un hilo del pool."""
+        current_batch_rows = [rows[idx] for idx in batch_indexes]
+        batch_payload = [
+            {"id": r["__internal_id__"], "text": r[config["COMMENT_COLUMN"]]}
+            for r in current_batch_rows
+        ]
 
-            logging.info(
-                f"Procesando batch {i//batch_size + 1}/{(total + batch_size - 1)//batch_size}..."
-            )
+        logging.info(
+            f"Procesando batch {batch_number} ({len(batch_payload)} comentarios)..."
+        )
 
+        started = time.perf_counter()
+        with METRICS.context(batch=batch_number, items=len(batch_payload)):
             classified_map = classify_batch(config, batch_payload)
-            logging.info(
-                f"Clasificados en este batch: {len(classified_map)}/{len(current_batch_rows)}"
+        if controller is not None:
+            controller.record(
+                len(batch_payload), time.perf_counter() - started, len(classified_map)
             )
-            if len(classified_map) == 0:
-                logging.warning(
-                    "Batch sin clasificaciones validas; usando fallback NEUTRAL."
-                )
 
-            for row in current_batch_rows:
-                # Buscar en el mapa, si no está o falla, poner NEUTRAL
-                internal_id = str(row["__internal_id__"]).strip()
-                row[config["APOYO_COLUMN"]] = classified_map.get(internal_id, "NEUTRAL")
+        logging.info(
+            f"Clasificados en batch {batch_number}: {len(classified_map)}/{len(current_batch_rows)}"
+        )
+        return classified_map
 
+    logging.info(f"Batches en vuelo simultáneamente: {config['MAX_WORKERS']}")
+
+    with RowWriter(config["OUTPUT_CSV"], fieldnames) as writer:
+        next_to_write = 0
+
+        def flush_ready_rows():
+            """Escribe en orden todas las filas consecutivas que ya tienen etiqueta."""
+            nonlocal next_to_write, processed_count
+            while next_to_write < total and next_to_write in labels:
+                row = rows[next_to_write]
+                row[config["APOYO_COLUMN"]] = labels[next_to_write]
                 # Limpiar columna interna antes de escribir
                 del row["__internal_id__"]
                 writer.writerow(row)
-
-            processed_count += len(current_batch_rows)
-            time.sleep(config["SLEEP_MS"] / 1000.0)
-
+                next_to_write += 1
+                processed_count += 1
+
+        flush_ready_rows()
+
+        # Los batches se arman a medida que se despachan, así el tamaño adaptativo
+        # aplica al siguiente batch y los ids sin respuesta válida se suman a los
+        # batches siguientes. Las filas se siguen escribiendo en el orden original
+        # gracias a flush_ready_rows().
+        attempts: Dict[int, int] = {}
+        requeued = 0
+        batch_number = 0
+        in_flight = {}
+        try:
+            with ThreadPoolExecutor(max_workers=config["MAX_WORKERS"]) as executor:
+                while pending or in_flight:
+                    while pending and len(in_flight) < config["MAX_WORKERS"]:
+                        size = controller.size if controller else config["BATCH_SIZE"]
+                        batch_indexes = [
+                            pending.popleft() for _ in range(min(size, len(pending)))
+                        ]
+                        batch_number += 1
+                        future = executor.submit(process_batch, batch_indexes, batch_number)
+                        in_flight[future] = batch_indexes
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        batch_indexes = in_flight.pop(future)
+                        classified_map = future.result()
+                        for idx in batch_indexes:
+                            row = rows[idx]
+                            internal_id = str(row["__internal_id__"]).strip()
+                            label = classified_map.get(internal_id)
+                            if label is not None:
+                                cache.set(cache_key(config, row[config["COMMENT_COLUMN"]]), label)
+                                labels[idx] = label
+                                continue
+                            # Sin respuesta válida: reencolar solo este id
+                            attempts[idx] = attempts.get(idx, 0) + 1
+                            if attempts[idx] < config["MAX_ATTEMPTS"]:
+                                pending.append(idx)
+                                requeued += 1
+                            else:
+                                labels[idx] = UNRESOLVED_LABEL
+
+                    flush_ready_rows()
+                    if batch_number % 10 == 0:
+                        cache.save()
+        finally:
+            cache.save()
+
+    unresolved = sum(1 for label in labels.values() if label == UNRESOLVED_LABEL)
+    METRICS.fallback(unresolved, UNRESOLVED_LABEL)
+    logging.info(
+        f"Reencolados: {requeued}; sin resolver tras {config['MAX_ATTEMPTS']} intentos: {unresolved}"
+    )
+    if controller is not None:
+        logging.info(controller.summary())
+    logging.info(cache.stats())
+    client = get_client(config["OLLAMA_HOST"])
+    logging.info(client.stats())
+    logging.info(client.limiter.stats())
+    if config["STREAM"]:
+        logging.info(STREAM_STATS.summary())
+    logging.info(METRICS.summary(cache, total))
+    METRICS.close()
     logging.info(f"Procesamiento finalizado. {processed_count} filas procesadas.")
     logging.info(f"Archivo generado en: {os.path.abspath(config['OUTPUT_CSV'])}")
 
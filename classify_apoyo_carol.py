@@ -4,15 +4,24 @@ Descripción: Clasifica la postura hacia Carol Aviaga usando Ollama local y expo
 """
 
 import os
-import csv
 import json
 import time
 import re
 import logging
+from collections import deque
 from typing import List, Dict, Any
-import requests
 from dotenv import load_dotenv
 
+from adaptive_batch import AdaptiveBatchController
+from label_cache import LabelCache, open_label_cache
+from llm_metrics import METRICS
+from ollama_client import REQUEST_ERRORS, STREAM_STATS, get_client, retry_delay
+from prompt_builder import DEFAULT_KEEP_ALIVE, PromptBuilder, comment_lines, parse_keep_alive
+from checkpoint_journal import CheckpointJournal
+from local_model import model_preclassify
+from rule_classifier import preclassify
+from table_io import read_rows, write_rows
+
 # Configuración de Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -39,6 +48,10 @@ def load_config() -> Dict[str, Any]:
         "OLLAMA_MODEL": os.getenv("OLLAMA_MODEL", "gpt-oss:20b-cloud"),
         "CLASSIFIER_CONTEXT": contexto_manual,
         "BATCH_SIZE": int(os.getenv("BATCH_SIZE", "5")),
+        "ADAPTIVE_BATCH": os.getenv("ADAPTIVE_BATCH", "0").lower() in ("1", "true", "yes"),
+        "MIN_BATCH_SIZE": int(os.getenv("MIN_BATCH_SIZE", "1")),
+        "MAX_BATCH_SIZE": int(os.getenv("MAX_BATCH_SIZE", "25")),
+        "MAX_ATTEMPTS": max(1, int(os.getenv("MAX_ATTEMPTS", "3"))),
         "TEMPERATURE": float(os.getenv("TEMPERATURE", "0.0")),
         "TOP_P": float(os.getenv("TOP_P", "0.9")),
         "INPUT_CSV": os.getenv("INPUT_CSV", "Comentarios_Limpios.csv"),
@@ -46,8 +59,25 @@ def load_config() -> Dict[str, Any]:
         "COMMENT_COLUMN": os.getenv("COMMENT_COLUMN", "Comentario"),
         "ID_COLUMN": os.getenv("ID_COLUMN", "#"),
         "APOYO_CAROL_COLUMN": "Apoyo Carol",
-        "SLEEP_MS": int(os.getenv("SLEEP_BETWEEN_BATCHES_MS", "200")),
-        "TIMEOUT": 180
+        # Ritmo compartido por todas las llamadas (0 = sin límite); reemplaza la pausa fija entre batches
+        "RPS": float(os.getenv("OLLAMA_RPS", "0")),
+        "MAX_CONCURRENCY": int(os.getenv("OLLAMA_MAX_CONCURRENCY", "0")),
+        "CACHE_FILE": os.getenv("LABEL_CACHE_FILE", "labels_cache.json"),
+        "STREAM": os.getenv("OLLAMA_STREAM", "0").lower() in ("1", "true", "yes"),
+        # Vacío = "<OUTPUT_CSV>.journal.jsonl"
+        "CHECKPOINT_FILE": os.getenv("CHECKPOINT_FILE", ""),
+        "POOL_SIZE": int(os.getenv("OLLAMA_POOL_SIZE", "10")),
+        "TIMEOUT": float(os.getenv("TIMEOUT", "180")),
+        # Tiempo que el modelo queda cargado tras cada request ("30m", "1h", -1 = siempre)
+        "KEEP_ALIVE": parse_keep_alive(os.getenv("OLLAMA_KEEP_ALIVE", DEFAULT_KEEP_ALIVE)),
+        "METRICS_FILE": os.getenv("METRICS_FILE", "llm_metrics.jsonl"),
+        # Pre-clasificador por reglas: los comentarios obvios no llegan al LLM
+        "PRECLASSIFY": os.getenv("PRECLASSIFY", "0").lower() in ("1", "true", "yes"),
+        "PRECLASSIFY_THRESHOLD": float(os.getenv("PRECLASSIFY_THRESHOLD", "0.9")),
+        "PRECLASSIFY_AUDIT_FILE": os.getenv("PRECLASSIFY_AUDIT_FILE", "rule_labels.jsonl"),
+        # Modelo local entrenado con local_model.py (vacío = desactivado)
+        "LOCAL_MODEL_FILE": os.getenv("LOCAL_MODEL_FILE_CAROL", ""),
+        "LOCAL_MODEL_THRESHOLD": float(os.getenv("LOCAL_MODEL_THRESHOLD", "0.9"))
     }
 
 def extract_json_array(text: str) -> List[Dict[str, Any]]:
@@ -82,23 +112,49 @@ def extract_json_array(text: str) -> List[Dict[str, Any]]:
 
     return []
 
-def call_ollama(config: Dict[str, Any], messages: List[Dict[str, str]]) -> List[Dict[str, Any]]:
-    url = f"{config['OLLAMA_HOST']}/api/chat"
-    payload = {
-        "model": config["OLLAMA_MODEL"],
-        "messages": messages,
-        "stream": False,
-        "options": {
-            "temperature": config["TEMPERATURE"],
-            "top_p": config["TOP_P"]
-        }
+# Marca explícita para los ids que agotaron sus intentos sin una etiqueta válida
+UNRESOLVED_LABEL = "UNRESOLVED"
+
+# Instrucciones fijas; van al final del prefijo invariante y forman parte de la clave de cache
+USER_INSTRUCTIONS = (
+    "Analiza los siguientes comentarios y devuelve SOLO JSON válido, sin texto extra.\n"
+    "Formato exacto:\n"
+    "[{\"id\":\"<id>\",\"apoyo\":\"FAVORABLE|CONTRARIO|NEUTRAL\"}]\n\n"
+    "Comentarios:\n"
+)
+
+def sampling_options(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "temperature": config["TEMPERATURE"],
+        "top_p": config["TOP_P"]
     }
-    
-    for i in range(3):
+
+def prompt_builder(config: Dict[str, Any]) -> PromptBuilder:
+    """Prefijo idéntico en todas las llamadas: contexto + instrucciones + formato."""
+    return PromptBuilder(config["CLASSIFIER_CONTEXT"] + "\n\n" + USER_INSTRUCTIONS, config["KEEP_ALIVE"])
+
+def cache_key(config: Dict[str, Any], text: str) -> str:
+    return LabelCache.make_key(
+        config["OLLAMA_MODEL"],
+        config["CLASSIFIER_CONTEXT"] + USER_INSTRUCTIONS,
+        sampling_options(config),
+        text
+    )
+
+def call_ollama(config: Dict[str, Any], payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Igual que classify_apoyo.call_ollama: reintentos con backoff y sin reintentar JSON inválido."""
+    client = get_client(
+        config["OLLAMA_HOST"], config["POOL_SIZE"], config["TIMEOUT"],
+        config["RPS"], config["MAX_CONCURRENCY"]
+    )
+    retries = 3
+    for i in range(retries):
         try:
-            response = requests.post(url, json=payload, timeout=config["TIMEOUT"])
-            response.raise_for_status()
-            content = response.json().get("message", {}).get("content", "")
+            with METRICS.context(attempt=i + 1):
+                if config["STREAM"]:
+                    content = client.stream("/api/chat", payload, "message")["content"]
+                else:
+                    content = client.post("/api/chat", payload).get("message", {}).get("content", "")
             
             results = extract_json_array(content)
             if results: return results
@@ -107,47 +163,40 @@ def call_ollama(config: Dict[str, Any], messages: List[Dict[str, str]]) -> List[
                 # Intento de objeto único convertido a lista
                 item = json.loads(content)
                 return [item] if isinstance(item, dict) else []
-            except:
-                pass
-        except Exception as e:
-            wait = 2 ** i
-            logging.warning(f"Intento {i+1} falló: {e}. Reintentando en {wait}s...")
-            time.sleep(wait)
+            except (json.JSONDecodeError, ValueError):
+                # Sin JSON utilizable: main() reencola los ids del batch
+                METRICS.parse_failure(content)
+                return []
+        except REQUEST_ERRORS as e:
+            if i + 1 == retries:
+                logging.warning(f"Error en intento {i+1}/{retries}: {e}. Sin más reintentos.")
+                break
+            delay = retry_delay(e, i + 1)
+            logging.warning(f"Error en intento {i+1}/{retries}: {e}. Reintentando en {delay:.0f}s...")
+            time.sleep(delay)
     return []
 
 def classify_batch(config: Dict[str, Any], batch: List[Dict[str, str]]) -> Dict[str, str]:
-    system_msg = config["CLASSIFIER_CONTEXT"]
-    
-    user_msg = (
-        "Analiza los siguientes comentarios y devuelve SOLO JSON válido, sin texto extra.\n"
-        "Formato exacto:\n"
-        "[{\"id\":\"<id>\",\"apoyo\":\"FAVORABLE|CONTRARIO|NEUTRAL\"}]\n\n"
-        "Comentarios:\n"
+    payload = prompt_builder(config).chat_payload(
+        config["OLLAMA_MODEL"], comment_lines(batch), sampling_options(config)
     )
-    
-    for item in batch:
-        user_msg += f"- ID: {item['id']}, Comentario: {item['text']}\n"
-    
-    messages = [
-        {"role": "system", "content": system_msg},
-        {"role": "user", "content": user_msg}
-    ]
-    
-    raw_results = call_ollama(config, messages)
+    raw_results = call_ollama(config, payload)
     
     classified_data = {}
     valid_labels = {"FAVORABLE", "CONTRARIO", "NEUTRAL"}
     for res in raw_results:
         # Normalizar ID a string y label a mayúsculas
         rid = str(res.get("id", "")).strip()
-        label = str(res.get("apoyo", "NEUTRAL")).strip().upper()
-        if rid:
-            classified_data[rid] = label if label in valid_labels else "NEUTRAL"
+        label = str(res.get("apoyo", "")).strip().upper()
+        # Una etiqueta inválida cuenta como sin respuesta (se reencola)
+        if rid and label in valid_labels:
+            classified_data[rid] = label
             
     return classified_data
 
 def main():
     config = load_config()
+    METRICS.configure(config["METRICS_FILE"], "classify_apoyo_carol")
     if not config["CLASSIFIER_CONTEXT"]:
         logging.error("CLASSIFIER_CONTEXT_CAROL es obligatorio en el .env")
         return
@@ -158,50 +207,135 @@ def main():
         return
 
     # Leer todo el archivo a memoria para permitir sobrescritura segura
-    rows = []
-    fieldnames = []
-    with open(input_path, mode='r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        fieldnames = list(reader.fieldnames) if reader.fieldnames else []
-        if config["APOYO_CAROL_COLUMN"] not in fieldnames:
-            fieldnames.append(config["APOYO_CAROL_COLUMN"])
-            
-        for idx, row in enumerate(reader):
-            # Usar el ID_COLUMN o el índice si no existe
-            rid = str(row.get(config["ID_COLUMN"], idx)).strip()
-            row["__id_internal__"] = rid
-            rows.append(row)
+    fieldnames, rows = read_rows(input_path)
+    if config["APOYO_CAROL_COLUMN"] not in fieldnames:
+        fieldnames.append(config["APOYO_CAROL_COLUMN"])
+
+    for idx, row in enumerate(rows):
+        # Usar el ID_COLUMN o el índice si no existe
+        rid = str(row.get(config["ID_COLUMN"], idx)).strip()
+        row["__id_internal__"] = rid
 
     total = len(rows)
     logging.info(f"Procesando {total} comentarios para Carol Aviaga...")
     
-    batch_size = config["BATCH_SIZE"]
+    # Reanudar: las filas registradas en el journal de una corrida anterior no se reenvían
+    output_path = config["OUTPUT_CSV"]
+    journal = CheckpointJournal(config["CHECKPOINT_FILE"] or f"{output_path}.journal.jsonl")
+    done = journal.load()
+    if done:
+        logging.info(f"Reanudando desde {journal.path}: {len(done)} filas ya etiquetadas.")
+
+    # Pre-pasada por reglas y modelo local (auditada en su propio archivo, no entra al cache ni al journal)
+    rule_labels = {}
+    if config["PRECLASSIFY"]:
+        rule_labels = preclassify(
+            "apoyo_carol",
+            ((pos, r["__id_internal__"], r[config["COMMENT_COLUMN"]]) for pos, r in enumerate(rows)
+             if r["__id_internal__"] not in done),
+            config["PRECLASSIFY_THRESHOLD"],
+            config["PRECLASSIFY_AUDIT_FILE"],
+        )
+    if config["LOCAL_MODEL_FILE"]:
+        rule_labels.update(model_preclassify(
+            "apoyo_carol",
+            ((pos, r["__id_internal__"], r[config["COMMENT_COLUMN"]]) for pos, r in enumerate(rows)
+             if r["__id_internal__"] not in done and pos not in rule_labels),
+            config["LOCAL_MODEL_FILE"],
+            config["LOCAL_MODEL_THRESHOLD"],
+            config["PRECLASSIFY_AUDIT_FILE"],
+        ))
+
+    # Las filas ya clasificadas con el mismo modelo y prompt salen del cache
+    cache = open_label_cache(config["CACHE_FILE"])
+    pending = deque()
+    for pos, r in enumerate(rows):
+        if r["__id_internal__"] in done:
+            r[config["APOYO_CAROL_COLUMN"]] = done[r["__id_internal__"]]
+            continue
+        if pos in rule_labels:
+            r[config["APOYO_CAROL_COLUMN"]] = rule_labels[pos]
+            continue
+        cached = cache.get(cache_key(config, r[config["COMMENT_COLUMN"]]))
+        if cached is not None:
+            r[config["APOYO_CAROL_COLUMN"]] = cached
+        else:
+            pending.append(r)
+    logging.info(f"Pendientes de clasificar: {len(pending)}/{total}")
+
+    controller = None
+    if config["ADAPTIVE_BATCH"]:
+        controller = AdaptiveBatchController(
+            config["BATCH_SIZE"], config["MIN_BATCH_SIZE"], config["MAX_BATCH_SIZE"]
+        )
+    attempts = {}
+    requeued = 0
+    unresolved = 0
+    batch_number = 0
     
-    for i in range(0, total, batch_size):
-        current_batch = rows[i:i + batch_size]
-        payload = [
-            {"id": r["__id_internal__"], "text": r[config["COMMENT_COLUMN"]]} 
-            for r in current_batch
-        ]
+    # Los ids sin respuesta válida vuelven al final de la cola y viajan en batches posteriores
+    try:
+        while pending:
+            batch_size = controller.size if controller else config["BATCH_SIZE"]
+            current_batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+            batch_number += 1
+            payload = [
+                {"id": r["__id_internal__"], "text": r[config["COMMENT_COLUMN"]]} 
+                for r in current_batch
+            ]
         
-        logging.info(f"Batch {i//batch_size + 1}/{(total + batch_size - 1)//batch_size}")
-        results = classify_batch(config, payload)
-        logging.info(f"Clasificados: {len(results)}/{len(current_batch)}")
+            logging.info(f"Batch {batch_number} ({len(payload)} comentarios, quedan {len(pending)})")
+            started = time.perf_counter()
+            with METRICS.context(batch=batch_number, items=len(payload)):
+                results = classify_batch(config, payload)
+            if controller is not None:
+                controller.record(len(payload), time.perf_counter() - started, len(results))
+            logging.info(f"Clasificados: {len(results)}/{len(current_batch)}")
         
-        for r in current_batch:
-            label = results.get(r["__id_internal__"], "NEUTRAL")
-            r[config["APOYO_CAROL_COLUMN"]] = label
+            labelled = {}
+            for r in current_batch:
+                rid = r["__id_internal__"]
+                label = results.get(rid)
+                if label is not None:
+                    cache.set(cache_key(config, r[config["COMMENT_COLUMN"]]), label)
+                    labelled[rid] = label
+                    r[config["APOYO_CAROL_COLUMN"]] = label
+                    continue
+                attempts[rid] = attempts.get(rid, 0) + 1
+                if attempts[rid] < config["MAX_ATTEMPTS"]:
+                    pending.append(r)
+                    requeued += 1
+                else:
+                    r[config["APOYO_CAROL_COLUMN"]] = UNRESOLVED_LABEL
+                    unresolved += 1
+            # Checkpoint del batch: solo lo que el modelo etiquetó; los UNRESOLVED se reintentan al reanudar
+            journal.append(labelled)
+            if batch_number % 10 == 0:
+                cache.save()
+    finally:
+        cache.save()
 
-    # Guardar resultados
-    output_path = config["OUTPUT_CSV"]
-    with open(output_path, mode='w', encoding='utf-8-sig', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=[fn for fn in fieldnames if fn != "__id_internal__"])
-        writer.writeheader()
-        for r in rows:
-            # Eliminar la clave temporal antes de escribir
-            data = {k: v for k, v in r.items() if k != "__id_internal__"}
-            writer.writerow(data)
+    # Guardar resultados (temporal + rename para no dejar un archivo a medio escribir)
+    write_rows(
+        output_path,
+        [fn for fn in fieldnames if fn != "__id_internal__"],
+        rows
+    )
+    journal.remove()
+
+    logging.info(f"Reencolados: {requeued}; sin resolver tras {config['MAX_ATTEMPTS']} intentos: {unresolved}")
+    METRICS.fallback(unresolved, UNRESOLVED_LABEL)
+    if controller is not None:
+        logging.info(controller.summary())
 
+    logging.info(cache.stats())
+    client = get_client(config["OLLAMA_HOST"])
+    logging.info(client.stats())
+    logging.info(client.limiter.stats())
+    if config["STREAM"]:
+        logging.info(STREAM_STATS.summary())
+    logging.info(METRICS.summary(cache, total))
+    METRICS.close()
     logging.info(f"Proceso completado. Archivo guardado en: {os.path.abspath(output_path)}")
 
 if __name__ == "__main__":
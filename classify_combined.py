@@ -0,0 +1,196 @@
+"""
+Script: classify_combined.py
+Descripción: Clasifica en una sola llamada por batch la postura hacia Daniel Ximénez,
+             la postura hacia Carol Aviaga y el tópico de cada comentario.
+             Reutiliza los contextos de classify_apoyo.py / classify_apoyo_carol.py y
+             los tópicos de classify_topics.py, y escribe las tres columnas a la vez.
+Ejecución:
+    1. Configurar .env basado en example.env (mismas variables que classify_apoyo.py)
+    2. Ejecutar: python classify_combined.py
+"""
+
+import os
+import json
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import List, Dict, Any
+
+import classify_apoyo
+import classify_apoyo_carol
+from classify_topics import TopicClassifier
+from label_cache import LabelCache, open_label_cache
+from llm_metrics import METRICS
+from ollama_client import STREAM_STATS, get_client
+from prompt_builder import PromptBuilder, comment_lines
+from table_io import RowWriter, read_rows
+
+TOPIC_COLUMN = "Topic"
+
+
+def load_config() -> Dict[str, Any]:
+    config = classify_apoyo.load_config()
+    config["CLASSIFIER_CONTEXT_DANIEL"] = config.pop("CLASSIFIER_CONTEXT")
+    config["CLASSIFIER_CONTEXT_CAROL"] = classify_apoyo_carol.load_config()["CLASSIFIER_CONTEXT"]
+    config["APOYO_CAROL_COLUMN"] = os.getenv("APOYO_CAROL_COLUMN", "Apoyo Carol")
+    return config
+
+
+def build_system_prompt(config: Dict[str, Any]) -> str:
+    """Une los tres contextos en un solo prompt de sistema."""
+    return (
+        "Para cada comentario de Facebook tenés que devolver tres etiquetas.\n\n"
+        "A) apoyo_daniel (FAVORABLE|CONTRARIO|NEUTRAL):\n"
+        f"{config['CLASSIFIER_CONTEXT_DANIEL']}\n\n"
+        "B) apoyo_carol (FAVORABLE|CONTRARIO|NEUTRAL):\n"
+        f"{config['CLASSIFIER_CONTEXT_CAROL']}\n\n"
+        "C) topic (nombre exacto de UNO de los tópicos):\n"
+        f"{TopicClassifier.TOPIC_DEFINITIONS}"
+        "Las tres etiquetas son independientes entre sí."
+    )
+
+
+USER_INSTRUCTIONS = (
+    "Devolvé SOLO JSON válido, sin texto extra.\n"
+    'Formato: [{"id":"<id>","apoyo_daniel":"FAVORABLE|CONTRARIO|NEUTRAL",'
+    '"apoyo_carol":"FAVORABLE|CONTRARIO|NEUTRAL","topic":"<tópico>"}, ...]\n\n'
+    "Comentarios:\n"
+)
+
+
+def cache_key(config: Dict[str, Any], system_msg: str, text: str) -> str:
+    return LabelCache.make_key(
+        config["OLLAMA_MODEL"],
+        system_msg + USER_INSTRUCTIONS,
+        classify_apoyo.sampling_options(config),
+        text,
+    )
+
+
+def parse_labels(res: Dict[str, Any]) -> Dict[str, str]:
+    """Normaliza una respuesta; devuelve {} si alguna de las tres etiquetas es inválida."""
+    daniel = str(res.get("apoyo_daniel", "")).strip().upper()
+    carol = str(res.get("apoyo_carol", "")).strip().upper()
+    topic = str(res.get("topic", "")).strip()
+    if (
+        daniel not in classify_apoyo.VALID_LABELS
+        or carol not in classify_apoyo.VALID_LABELS
+        or topic not in TopicClassifier.TOPICS
+    ):
+        return {}
+    return {"apoyo_daniel": daniel, "apoyo_carol": carol, "topic": topic}
+
+
+def classify_batch(
+    config: Dict[str, Any], builder: PromptBuilder, batch: List[Dict[str, str]]
+) -> Dict[str, Dict[str, str]]:
+    payload = builder.chat_payload(
+        config["OLLAMA_MODEL"], comment_lines(batch), classify_apoyo.sampling_options(config)
+    )
+
+    classified_data: Dict[str, Dict[str, str]] = {}
+    for res in classify_apoyo.call_ollama(config, payload):
+        if not isinstance(res, dict) or "id" not in res:
+            continue
+        labels = parse_labels(res)
+        if labels:
+            classified_data[str(res["id"]).strip()] = labels
+    return classified_data
+
+
+def main():
+    config = load_config()
+    METRICS.configure(config["METRICS_FILE"], "classify_combined")
+    system_msg = build_system_prompt(config)
+    # Prefijo invariante (contextos + instrucciones); cada llamada solo agrega los comentarios
+    builder = PromptBuilder(system_msg + "\n\n" + USER_INSTRUCTIONS, config["KEEP_ALIVE"])
+
+    if not os.path.exists(config["INPUT_CSV"]):
+        logging.error(f"No se encuentra el archivo de entrada: {config['INPUT_CSV']}")
+        return
+
+    fieldnames, input_rows = read_rows(config["INPUT_CSV"])
+    for col in (config["APOYO_COLUMN"], config["APOYO_CAROL_COLUMN"], TOPIC_COLUMN):
+        if col not in fieldnames:
+            fieldnames.append(col)
+    rows = [(str(row.get(config["ID_COLUMN"], idx)).strip(), row) for idx, row in enumerate(input_rows)]
+
+    total = len(rows)
+    logging.info(f"Total de filas a procesar (modo combinado): {total}")
+
+    cache = open_label_cache(config["CACHE_FILE"])
+    results: Dict[str, Dict[str, str]] = {}
+    pending = deque()
+    for rid, row in rows:
+        cached = cache.get(cache_key(config, system_msg, row[config["COMMENT_COLUMN"]]))
+        if cached is not None:
+            results[rid] = json.loads(cached)
+        else:
+            pending.append((rid, row))
+    logging.info(f"Resueltos desde cache: {len(results)}/{total}")
+
+    def process_batch(batch: List[Any], batch_number: int) -> Dict[str, Dict[str, str]]:
+        payload = [{"id": rid, "text": row[config["COMMENT_COLUMN"]]} for rid, row in batch]
+        logging.info(f"Procesando batch {batch_number} ({len(batch)} comentarios)...")
+        with METRICS.context(batch=batch_number, items=len(batch)):
+            classified = classify_batch(config, builder, payload)
+        logging.info(f"Clasificados en batch {batch_number}: {len(classified)}/{len(batch)}")
+        return classified
+
+    # Igual que classify_apoyo.py: los ids sin respuesta válida vuelven a la cola
+    attempts: Dict[str, int] = {}
+    batch_number = 0
+    in_flight = {}
+    try:
+        with ThreadPoolExecutor(max_workers=config["MAX_WORKERS"]) as executor:
+            while pending or in_flight:
+                while pending and len(in_flight) < config["MAX_WORKERS"]:
+                    batch = [
+                        pending.popleft() for _ in range(min(config["BATCH_SIZE"], len(pending)))
+                    ]
+                    batch_number += 1
+                    in_flight[executor.submit(process_batch, batch, batch_number)] = batch
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    batch = in_flight.pop(future)
+                    classified = future.result()
+                    for rid, row in batch:
+                        if rid in classified:
+                            results[rid] = classified[rid]
+                            cache.set(
+                                cache_key(config, system_msg, row[config["COMMENT_COLUMN"]]),
+                                json.dumps(classified[rid], ensure_ascii=False),
+                            )
+                            continue
+                        attempts[rid] = attempts.get(rid, 0) + 1
+                        if attempts[rid] < config["MAX_ATTEMPTS"]:
+                            pending.append((rid, row))
+    finally:
+        cache.save()
+
+    unresolved = classify_apoyo.UNRESOLVED_LABEL
+    fallback = {"apoyo_daniel": unresolved, "apoyo_carol": unresolved, "topic": unresolved}
+    logging.info(f"Sin resolver tras {config['MAX_ATTEMPTS']} intentos: {total - len(results)}")
+    METRICS.fallback(total - len(results), unresolved)
+    with RowWriter(config["OUTPUT_CSV"], fieldnames) as writer:
+        for rid, row in rows:
+            labels = results.get(rid, fallback)
+            row[config["APOYO_COLUMN"]] = labels["apoyo_daniel"]
+            row[config["APOYO_CAROL_COLUMN"]] = labels["apoyo_carol"]
+            row[TOPIC_COLUMN] = labels["topic"]
+            writer.writerow(row)
+
+    logging.info(cache.stats())
+    client = get_client(config["OLLAMA_HOST"])
+    logging.info(client.stats())
+    logging.info(client.limiter.stats())
+    if config["STREAM"]:
+        logging.info(STREAM_STATS.summary())
+    logging.info(METRICS.summary(cache, total))
+    METRICS.close()
+    logging.info(f"Archivo generado en: {os.path.abspath(config['OUTPUT_CSV'])}")
+
+
+if __name__ == "__main__":
+    main()
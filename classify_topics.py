@@ -3,11 +3,19 @@ import pandas as pd
 import requests
 import json
 import time
-import hashlib
 import logging
 import argparse
 from typing import List, Dict, Any, Optional
 
+from checkpoint_journal import CheckpointJournal
+from label_cache import LabelCache, open_label_cache
+from llm_metrics import METRICS
+from ollama_client import STREAM_STATS, get_client
+from prompt_builder import DEFAULT_KEEP_ALIVE, PromptBuilder, parse_keep_alive
+from local_model import model_preclassify
+from rule_classifier import preclassify
+from table_io import read_table, write_table
+
 # Configuración de Logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,89 +31,131 @@ class TopicClassifier:
         "No identificado"
     ]
 
-    SYSTEM_PROMPT = """Eres un experto en análisis de discurso político uruguayo. Tu tarea es analizar comentarios de Facebook sobre una denuncia JUTEP contra el intendente Daniel Ximénez (médico) por parte de Carol Aviaga.
-Devuelve SOLO un JSON válido con la clasificación del tópico. No incluyas explicaciones ni markdown.
-
-Tópicos permitidos:
+    # Definiciones de los tópicos; se reutilizan en classify_combined.py
+    TOPIC_DEFINITIONS = """Tópicos permitidos:
 1) Vocación Médica y Humanidad: Enfocado en su rol de médico, salvar vidas, ética profesional, humanidad, sanatorios. Palabras clave: doctor, cirujano, pacientes, vida.
 2) Legalidad y Compatibilidad Funcional: Enfocado en la ley, la constitución, si es legal o no trabajar en dos lugares, reglamentos. Palabras clave: constitución, ley, permitido, municipal, privado.
 3) Rechazo a la denuncia: Enfocado en criticar la denuncia misma, verla como "política barata", "circo", "oportunismo", pedir que lo dejen trabajar. Palabras clave: dejen trabajar, al pedo, política, joder, resentimiento.
 4) Crítica Política y Valores Políticos: Enfocado en críticas más generales a la gestión, valores éticos de la política en general, o ataques directos a figuras políticas sin centrarse solo en la denuncia.
 5) No identificado: Úsalo solo cuando el comentario sea demasiado corto, irrelevante, o no contenga información suficiente para asignarlo a ninguno de los tópicos anteriores.
 
-Estructura de respuesta JSON:
+"""
+
+    SYSTEM_PROMPT = """Eres un experto en análisis de discurso político uruguayo. Tu tarea es analizar comentarios de Facebook sobre una denuncia JUTEP contra el intendente Daniel Ximénez (médico) por parte de Carol Aviaga.
+Devuelve SOLO un JSON válido con la clasificación del tópico. No incluyas explicaciones ni markdown.
+
+""" + TOPIC_DEFINITIONS + """Estructura de respuesta JSON:
 {
   "topic": "<UNO de los 5 topics con el nombre exacto>"
 }
 """
 
-    def __init__(self, model: str, host: str, sleep_time: float, cache_file: str):
+    # Variante para clasificar varios comentarios por llamada (--batch_size > 1)
+    BATCH_SYSTEM_PROMPT = """Eres un experto en análisis de discurso político uruguayo. Tu tarea es analizar comentarios de Facebook sobre una denuncia JUTEP contra el intendente Daniel Ximénez (médico) por parte de Carol Aviaga.
+Vas a recibir varios comentarios, cada uno con un id numérico. Devuelve SOLO un JSON válido con el tópico de cada comentario. No incluyas explicaciones ni markdown.
+
+""" + TOPIC_DEFINITIONS + """Estructura de respuesta JSON (un elemento por cada id recibido):
+{
+  "results": [{"id": <id>, "topic": "<UNO de los 5 topics con el nombre exacto>"}]
+}
+"""
+
+    OPTIONS = {
+        "temperature": 0.1,
+        "top_p": 0.9
+    }
+
+    def __init__(self, model: str, host: str, cache_file: str, stream: bool = False,
+                 pool_size: int = 10, timeout: float = 120, rps: float = 0.0, max_concurrency: int = 0,
+                 keep_alive: Optional[str] = DEFAULT_KEEP_ALIVE):
         self.model = model
         self.host = host.rstrip('/')
-        self.sleep_time = sleep_time
+        self.stream = stream
+        # El ritmo de llamadas lo controla el rate limiter compartido del cliente
+        self.client = get_client(self.host, pool_size, timeout, rps, max_concurrency)
         self.cache_file = cache_file
-        self.cache = self._load_cache()
-
-    def _load_cache(self) -> Dict[str, Any]:
-        if os.path.exists(self.cache_file):
-            try:
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                logging.error(f"Error cargando cache: {e}")
-        return {}
+        self.cache = open_label_cache(cache_file)
+        # Prefijos invariantes: cada llamada solo agrega el/los comentarios al final
+        self.single_prompt = PromptBuilder(f"{self.SYSTEM_PROMPT}\n\nTexto a clasificar:\n", keep_alive)
+        self.batch_prompt = PromptBuilder(f"{self.BATCH_SYSTEM_PROMPT}\n\nComentarios a clasificar:\n", keep_alive)
 
     def _save_cache(self):
-        try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self.cache, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logging.error(f"Error guardando cache: {e}")
+        self.cache.save()
 
-    def get_text_hash(self, text: str) -> str:
-        return hashlib.md5(text.encode('utf-8')).hexdigest()
+    def cache_key(self, text: str) -> str:
+        """Clave compartida con los clasificadores de postura (modelo, prompt, opciones, texto)."""
+        return LabelCache.make_key(self.model, self.SYSTEM_PROMPT, self.OPTIONS, text)
+
+    def _generate_json(self, builder: PromptBuilder, suffix: str) -> Any:
+        """Llama a /api/generate con formato JSON y devuelve la respuesta ya parseada."""
+        payload = builder.generate_payload(self.model, suffix, self.OPTIONS)
+        if self.stream:
+            return json.loads(self.client.stream("/api/generate", payload, "response")["content"] or "{}")
+        result = self.client.post("/api/generate", payload)
+        return json.loads(result.get("response", "{}"))
 
     def _call_ollama(self, prompt: str, correction: bool = False) -> Optional[Dict[str, Any]]:
-        url = f"{self.host}/api/generate"
-        full_prompt = f"{self.SYSTEM_PROMPT}\n\nTexto a clasificar:\n\"{prompt}\""
+        suffix = f"\"{prompt}\""
         if correction:
-            full_prompt += "\n\nAVISO: Tu respuesta anterior no fue un JSON válido o contenía tópicos inválidos. Por favor, asegúrate de usar SOLO los tópicos de la lista y formato JSON estricto."
-
-        payload = {
-            "model": self.model,
-            "prompt": full_prompt,
-            "stream": False,
-            "format": "json",
-            "options": {
-                "temperature": 0.1,
-                "top_p": 0.9
-            }
-        }
+            suffix += "\n\nAVISO: Tu respuesta anterior no fue un JSON válido o contenía tópicos inválidos. Por favor, asegúrate de usar SOLO los tópicos de la lista y formato JSON estricto."
 
         try:
-            response = requests.post(url, json=payload, timeout=120)
-            response.raise_for_status()
-            result = response.json()
-            data = json.loads(result.get("response", "{}"))
+            with METRICS.context(attempt=2 if correction else 1):
+                data = self._generate_json(self.single_prompt, suffix)
             
             # Validar tópico
             topic = data.get("topic")
             if topic not in self.TOPICS:
+                METRICS.parse_failure(f"tópico inválido: {topic}")
                 return None
             return topic
-        except (requests.exceptions.RequestException, json.JSONDecodeError, Exception) as e:
+        except json.JSONDecodeError as e:
+            METRICS.parse_failure(str(e))
+            logging.error(f"Respuesta de Ollama sin JSON válido: {e}")
+            return None
+        except (requests.exceptions.RequestException, Exception) as e:
             logging.error(f"Error en llamada a Ollama: {e}")
             return None
 
+    def _call_ollama_batch(self, texts: List[str]) -> Dict[int, str]:
+        """Clasifica varios textos en una llamada. Devuelve {posición: tópico} solo para respuestas válidas."""
+        suffix = "".join(f"{pos}: \"{text}\"\n" for pos, text in enumerate(texts, start=1))
+
+        try:
+            with METRICS.context(items=len(texts)):
+                data = self._generate_json(self.batch_prompt, suffix)
+        except json.JSONDecodeError as e:
+            METRICS.parse_failure(str(e), items=len(texts))
+            logging.error(f"Respuesta batch de Ollama sin JSON válido: {e}")
+            return {}
+        except (requests.exceptions.RequestException, Exception) as e:
+            logging.error(f"Error en llamada batch a Ollama: {e}")
+            return {}
+
+        items = data.get("results", []) if isinstance(data, dict) else data
+        topics: Dict[int, str] = {}
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                pos = int(str(item.get("id")).strip())
+            except ValueError:
+                continue
+            topic = item.get("topic")
+            if 1 <= pos <= len(texts) and topic in self.TOPICS:
+                topics[pos - 1] = topic
+        return topics
+
     def classify(self, text: str) -> str:
-        text_hash = self.get_text_hash(text)
-        if text_hash in self.cache:
-            return self.cache[text_hash]
+        key = self.cache_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
 
         # Pre-check: si el comentario es demasiado corto
         if len(text.strip()) < 10:
             result = "No identificado"
-            self.cache[text_hash] = result
+            self.cache.set(key, result)
             return result
 
         # Intento 1
@@ -122,11 +172,44 @@ Estructura de respuesta JSON:
             medical_keywords = ['médico', 'doctor', 'paciente', 'salv', 'vida', 'human', 'curar']
             is_medical = any(word in text.lower() for word in medical_keywords)
             result = "Vocación Médica y Humanidad" if is_medical else "No identificado"
+            METRICS.fallback(1, "palabras clave")
 
-        self.cache[text_hash] = result
-        time.sleep(self.sleep_time)
+        self.cache.set(key, result)
         return result
 
+    def classify_batch(self, texts: List[str]) -> List[str]:
+        """Clasifica varios textos con una sola llamada; los ids faltantes o inválidos se reintentan de a uno."""
+        results: List[Optional[str]] = [None] * len(texts)
+        to_send: List[int] = []
+        for pos, text in enumerate(texts):
+            key = self.cache_key(text)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[pos] = cached
+            elif len(text.strip()) < 10:
+                results[pos] = "No identificado"
+                self.cache.set(key, results[pos])
+            else:
+                to_send.append(pos)
+
+        if len(to_send) > 1:
+            answered = self._call_ollama_batch([texts[pos] for pos in to_send])
+            missing = []
+            for local_pos, pos in enumerate(to_send):
+                if local_pos in answered:
+                    results[pos] = answered[local_pos]
+                    self.cache.set(self.cache_key(texts[pos]), results[pos])
+                else:
+                    missing.append(pos)
+            if missing:
+                logging.warning(f"Batch incompleto: {len(missing)}/{len(to_send)} comentarios se reintentan individualmente.")
+            to_send = missing
+
+        for pos in to_send:
+            results[pos] = self.classify(texts[pos])
+
+        return results
+
 def detect_comment_column(df: pd.DataFrame) -> str:
     candidates = ["Comentario", "comment", "texto", "text", "body"]
     for cand in candidates:
@@ -140,56 +223,148 @@ def detect_comment_column(df: pd.DataFrame) -> str:
 
 def main():
     parser = argparse.ArgumentParser(description="Detección de tópicos usando Ollama")
-    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="CSV de entrada")
-    parser.add_argument("--output", default="Topics_Clean.csv", help="CSV de salida")
+    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla de entrada (.csv, .parquet o .arrow)")
+    parser.add_argument("--output", default="Topics_Clean.csv", help="Tabla de salida (.csv, .parquet o .arrow)")
     parser.add_argument("--model", default="gpt-oss:120b-cloud", help="Modelo de Ollama")
     parser.add_argument("--host", default="http://localhost:11434", help="Host de Ollama API")
-    parser.add_argument("--sleep", type=float, default=0.2, help="Tiempo de espera entre llamadas")
-    parser.add_argument("--checkpoint_every", type=int, default=10, help="Guardar cada N comentarios")
-    parser.add_argument("--cache_file", default="topics_cache.json", help="Archivo de cache")
+    parser.add_argument("--rps", type=float, default=0.0, help="Máximo de requests por segundo a Ollama (0 = sin límite)")
+    parser.add_argument("--max_concurrency", type=int, default=0, help="Máximo de requests simultáneas (0 = sin límite)")
+    parser.add_argument("--checkpoint_every", type=int, default=10, help="Agregar al journal cada N comentarios clasificados")
+    parser.add_argument("--checkpoint_file", default="", help="Journal de checkpoints (vacío = <output>.journal.jsonl)")
+    parser.add_argument("--cache_file", default="topics_cache.db", help="Archivo de cache (.db = SQLite; .json = archivo único)")
+    parser.add_argument("--stream", action="store_true", help="Consumir la respuesta en streaming y cortar al cerrarse el JSON")
+    parser.add_argument("--pool_size", type=int, default=10, help="Conexiones keep-alive en el pool HTTP")
+    parser.add_argument("--timeout", type=float, default=120, help="Timeout por request a Ollama (segundos)")
+    parser.add_argument("--keep_alive", default=DEFAULT_KEEP_ALIVE, help='Tiempo que el modelo queda cargado ("30m", "1h", -1 = siempre, vacío = valor del servidor)')
+    parser.add_argument("--batch_size", type=int, default=1, help="Comentarios por llamada a Ollama (1 = uno por llamada)")
+    parser.add_argument("--preclassify", action="store_true", help="Etiquetar por reglas los comentarios obvios antes de llamar al LLM")
+    parser.add_argument("--preclassify_threshold", type=float, default=0.9, help="Confianza mínima de las reglas")
+    parser.add_argument("--local_model", default="", help="Modelo entrenado con local_model.py (vacío = desactivado)")
+    parser.add_argument("--local_model_threshold", type=float, default=0.9, help="Probabilidad mínima del modelo local")
+    parser.add_argument("--preclassify_audit", default="rule_labels.jsonl", help="Registro de las etiquetas puestas por reglas")
+    parser.add_argument("--metrics_file", default="llm_metrics.jsonl", help="JSONL con métricas por request (vacío = solo el resumen final)")
     
     args = parser.parse_args()
+    METRICS.configure(args.metrics_file, "classify_topics")
 
     # Cargar datos
     if not os.path.exists(args.input):
         logging.error(f"Archivo de entrada no encontrado: {args.input}")
         return
 
-    df = pd.read_csv(args.input)
+    # CSV (`,` o `;`) o Parquet/Arrow según la extensión
+    df = read_table(args.input)
     comment_col = detect_comment_column(df)
     logging.info(f"Usando columna de comentarios: '{comment_col}'")
 
-    classifier = TopicClassifier(args.model, args.host, args.sleep, args.cache_file)
+    classifier = TopicClassifier(args.model, args.host, args.cache_file, stream=args.stream,
+                                 pool_size=args.pool_size, timeout=args.timeout,
+                                 rps=args.rps, max_concurrency=args.max_concurrency,
+                                 keep_alive=parse_keep_alive(args.keep_alive))
 
     # Preparar columna nueva si no existe
     if "Topic" not in df.columns:
         df["Topic"] = None
+    else:
+        # En Parquet la columna viene categórica; se necesita editable
+        df["Topic"] = df["Topic"].astype(object)
 
     total = len(df)
     start_time = time.time()
 
     logging.info(f"Iniciando procesamiento de {total} comentarios...")
 
-    for i, row in df.iterrows():
-        # Saltar si ya está procesado y tiene datos válidos
-        if pd.notnull(row["Topic"]) and classifier.get_text_hash(str(row[comment_col])) in classifier.cache:
-            continue
+    # Reanudar: lo que una corrida interrumpida dejó en el journal (clave de cache -> tópico)
+    journal = CheckpointJournal(args.checkpoint_file or f"{args.output}.journal.jsonl")
+    resumed = journal.load()
+    for key, topic in resumed.items():
+        classifier.cache.set(key, topic)
+    if resumed:
+        logging.info(f"Reanudando desde {journal.path}: {len(resumed)} comentarios ya clasificados.")
 
-        comment = str(row[comment_col])
-        topic = classifier.classify(comment)
+    # Pre-pasada vectorizada: una clave por texto distinto y un solo cruce contra el cache
+    texts = df[comment_col].astype(str)
+    key_of = {text: classifier.cache_key(text) for text in texts.unique()}
+    keys = texts.map(key_of)
+    cached = keys.map(classifier.cache.lookup(key_of.values()))
+    df["Topic"] = cached.astype(object).where(cached.notna(), None)
+    pending = cached.isna()
+    logging.info(f"Resueltos desde cache: {total - int(pending.sum())}/{total}")
 
-        df.at[i, "Topic"] = topic
+    # Pre-pasada por reglas y modelo local sobre lo que el cache no resuelve (auditada aparte, no entra al cache)
+    ids = df["#"].astype(str) if "#" in df.columns else pd.Series(df.index.astype(str), index=df.index)
+    rule_labels = {}
+    if args.preclassify or args.local_model:
+        uncached = list(zip(df.index[pending], ids[pending], texts[pending]))
+        if args.preclassify:
+            rule_labels = preclassify("topic", uncached, args.preclassify_threshold, args.preclassify_audit)
+        if args.local_model:
+            rule_labels.update(model_preclassify(
+                "topic", [item for item in uncached if item[0] not in rule_labels],
+                args.local_model, args.local_model_threshold, args.preclassify_audit,
+            ))
+    if rule_labels:
+        df.loc[list(rule_labels), "Topic"] = pd.Series(rule_labels, dtype=object)
+        pending &= ~df.index.isin(list(rule_labels))
+
+    # Con cache SQLite también se guarda el resultado por fila (consultable durante la corrida)
+    store = classifier.cache if classifier.cache.incremental else None
+    if store is not None:
+        resolved = ~pending
+        store.store_results("topic", zip(
+            ids[resolved],
+            keys[resolved],
+            df.loc[resolved, "Topic"],
+            ["reglas" if i in rule_labels else "cache" for i in df.index[resolved]],
+        ))
+
+    # Solo se envía cada texto distinto una vez; el resultado se replica a sus duplicados
+    todo = list(dict(zip(keys[pending], texts[pending])).items())
+    ids_by_key = ids[pending].groupby(keys[pending]).agg(list).to_dict() if store is not None else {}
+    logging.info(f"Pendientes de clasificar: {int(pending.sum())} filas, {len(todo)} textos distintos")
+
+    # Checkpoints O(batch): las etiquetas nuevas se agregan al journal (o se insertan en
+    # SQLite en una transacción); la tabla se escribe una sola vez al final
+    labelled: Dict[str, str] = {}
+    unsaved: Dict[str, str] = {}
+    for start in range(0, len(todo), max(1, args.batch_size)):
+        chunk = todo[start : start + max(1, args.batch_size)]
+        with METRICS.context(batch=start // max(1, args.batch_size) + 1):
+            topics = classifier.classify_batch([text for _, text in chunk])
+        for (key, _), topic in zip(chunk, topics):
+            labelled[key] = topic
+            unsaved[key] = topic
+
+        done = start + len(chunk)
+        if len(unsaved) >= args.checkpoint_every or done == len(todo):
+            if store is not None:
+                classifier._save_cache()
+                store.store_results("topic", [
+                    (row_id, key, topic, "llm") for key, topic in unsaved.items() for row_id in ids_by_key.get(key, [])
+                ])
+            else:
+                journal.append(unsaved)
+            unsaved = {}
 
-        # Checkpoint e informe de progreso
-        if (i + 1) % args.checkpoint_every == 0 or (i + 1) == total:
-            df.to_csv(args.output, index=False, encoding='utf-8-sig')
-            classifier._save_cache()
-            
             elapsed = time.time() - start_time
-            avg_time = elapsed / (i + 1)
-            remaining = (total - (i + 1)) * avg_time
-            logging.info(f"Progreso: {i+1}/{total} | Tiempo est. restante: {remaining/60:.2f} min")
+            remaining = (len(todo) - done) * elapsed / done
+            logging.info(f"Progreso: {done}/{len(todo)} | Tiempo est. restante: {remaining/60:.2f} min")
+
+    if labelled:
+        df.loc[pending, "Topic"] = keys[pending].map(labelled)
+
+    # Materialización única de la tabla y del cache; el journal ya no hace falta
+    write_table(df, args.output)
+    classifier._save_cache()
+    journal.remove()
 
+    logging.info(classifier.cache.stats())
+    logging.info(classifier.client.stats())
+    logging.info(classifier.client.limiter.stats())
+    if args.stream:
+        logging.info(STREAM_STATS.summary())
+    logging.info(METRICS.summary(classifier.cache, total))
+    METRICS.close()
     logging.info(f"Procesamiento completado. Resultados guardados en: {args.output}")
 
 if __name__ == "__main__":
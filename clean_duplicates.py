@@ -1,6 +1,21 @@
 import csv
 import os
 import re
+import sys
+import math
+import random
+import hashlib
+import sqlite3
+import argparse
+from collections import Counter, defaultdict
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Primo de Mersenne para las permutaciones de MinHash (a*h + b) mod P
+MERSENNE_PRIME = (1 << 61) - 1
 
 def clean_text(text):
     if not text:
@@ -9,7 +24,243 @@ def clean_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
-def clean_duplicates(input_file, output_file):
+def normalize_for_similarity(text):
+    """
+    Normalización agresiva solo para comparar: sin emojis, puntuación ni risas (jajaja, jeje).
+    Una risa es una misma sílaba j/h + vocal repetida; palabras como "hijo" o "jefe" quedan.
+
+    >>> normalize_for_similarity("JAJAJA mi hijo, el jefe, jejeje!!")
+    'mi hijo el jefe'
+    >>> normalize_for_similarity("hoja de la hija jajajaj")
+    'hoja de la hija'
+    """
+    text = clean_text(text).lower()
+    text = re.sub(r'[^\w\s]', ' ', text)
+    text = re.sub(r'\b([jh][aeiou])\1+[jh]?\b', ' ', text)
+    # "buenooooo" -> "buenoo"
+    text = re.sub(r'(\w)\1{2,}', r'\1\1', text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def char_shingles(text, k=5):
+    if len(text) <= k:
+        return {text}
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class MinHasher:
+    """Firmas MinHash sobre shingles de caracteres (sin dependencias externas)."""
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = random.Random(seed)
+        self.params = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, shingles):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=8).digest(), 'little')
+            for s in shingles
+        ]
+        return tuple(min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in self.params)
+
+def cluster_near_duplicates(texts, threshold=0.8, num_perm=64, bands=16, k=5):
+    """
+    Agrupa textos casi idénticos. Devuelve, para cada posición, la posición de su representante
+    (el primer comentario del cluster). LSH por bandas propone candidatos y se confirma con el
+    Jaccard exacto contra el representante, así no hay encadenamiento de parecidos.
+    """
+    rows_per_band = max(1, num_perm // bands)
+    hasher = MinHasher(num_perm)
+    buckets = defaultdict(list)  # (banda, firma parcial) -> posiciones de representantes
+    rep_shingles = {}
+    assignment = []
+
+    for pos, text in enumerate(texts):
+        norm = normalize_for_similarity(text)
+        if not norm:
+            # Solo emojis o puntuación: no se agrupa, el sentido puede ser opuesto
+            assignment.append(pos)
+            continue
+
+        shingles = char_shingles(norm, k)
+        signature = hasher.signature(shingles)
+        keys = [
+            (band, signature[band * rows_per_band:(band + 1) * rows_per_band])
+            for band in range(bands)
+        ]
+
+        representative = None
+        checked = set()
+        for key in keys:
+            for candidate in buckets.get(key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if jaccard(shingles, rep_shingles[candidate]) >= threshold:
+                    representative = candidate
+                    break
+            if representative is not None:
+                break
+
+        if representative is None:
+            representative = pos
+            rep_shingles[pos] = shingles
+            for key in keys:
+                buckets[key].append(pos)
+        assignment.append(representative)
+
+    return assignment
+
+def print_cluster_report(assignment, texts, top=5):
+    sizes = Counter(assignment)
+    ranges = [(1, 1), (2, 2), (3, 5), (6, 10), (11, None)]
+    print(f"Clusters de casi-duplicados:")
+    print(f"- Comentarios: {len(assignment)} -> clusters a clasificar: {len(sizes)}")
+    if assignment:
+        print(f"- Llamadas al LLM evitadas: {len(assignment) - len(sizes)} ({(1 - len(sizes) / len(assignment)) * 100:.1f}%)")
+    for low, high in ranges:
+        count = sum(1 for s in sizes.values() if s >= low and (high is None or s <= high))
+        label = f"{low}" if low == high else (f"{low}-{high}" if high else f">{low - 1}")
+        print(f"  tamaño {label:>5}: {count} clusters")
+    for rep, size in sizes.most_common(top):
+        if size > 1:
+            print(f"  [{size}] {texts[rep][:80]}")
+
+def peak_rss_mb():
+    """Pico de memoria residente del proceso en MB (None si la plataforma no lo expone)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo informa en KB, macOS en bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def print_peak_rss():
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"- Pico de memoria (RSS): {peak:.1f} MB")
+
+def text_digest(text):
+    """Huella de 16 bytes del comentario normalizado: memoria fija por comentario visto."""
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+class BloomFilter:
+    """Conjunto aproximado de tamaño fijo: puede dar falsos positivos (descarta un único), nunca falsos negativos."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Doble hashing con las dos mitades del digest
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.num_hashes)]
+
+    def add(self, digest):
+        """Agrega el digest; devuelve True si (probablemente) ya estaba."""
+        present = True
+        for pos in self._positions(digest):
+            byte, bit = divmod(pos, 8)
+            if not self.bits[byte] & (1 << bit):
+                present = False
+                self.bits[byte] |= 1 << bit
+        return present
+
+class SqliteSeenSet:
+    """Conjunto de digests en disco para entradas más grandes que la RAM."""
+
+    def __init__(self, path, commit_every=10000):
+        self.path = path
+        # Un archivo que quedó de una corrida interrumpida marcaría todo como ya visto
+        if os.path.exists(path):
+            os.remove(path)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.commit_every = commit_every
+        self._pending = 0
+
+    def add(self, digest):
+        """Agrega el digest; devuelve True si ya estaba."""
+        cursor = self.conn.execute("INSERT OR IGNORE INTO seen (digest) VALUES (?)", (digest,))
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.conn.commit()
+            self._pending = 0
+        return cursor.rowcount == 0
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+        os.remove(self.path)
+
+class DigestSet:
+    """Conjunto exacto en memoria de digests de 16 bytes."""
+
+    def __init__(self):
+        self._seen = set()
+
+    def add(self, digest):
+        if digest in self._seen:
+            return True
+        self._seen.add(digest)
+        return False
+
+def clean_duplicates_streaming(input_file, output_file, seen='memory', expected_rows=10_000_000, error_rate=0.001):
+    """
+    Igual que clean_duplicates() pero escribe cada fila única en cuanto la lee y solo guarda
+    digests de 16 bytes. seen: 'memory' (exacto), 'bloom' (memoria fija, aproximado) o 'sqlite' (en disco).
+    """
+    if not os.path.exists(input_file):
+        print(f"Error: El archivo {input_file} no existe.")
+        return
+
+    if seen == 'bloom':
+        seen_set = BloomFilter(expected_rows, error_rate)
+    elif seen == 'sqlite':
+        seen_set = SqliteSeenSet(output_file + ".seen.sqlite")
+    else:
+        seen_set = DigestSet()
+
+    total_filas = 0
+    unicas = 0
+    try:
+        with open(input_file, mode='r', encoding='utf-8-sig') as f_in, \
+             open(output_file, mode='w', encoding='utf-8-sig', newline='') as f_out:
+            reader = csv.DictReader(f_in)
+            writer = csv.DictWriter(f_out, fieldnames=reader.fieldnames)
+            writer.writeheader()
+            for row in reader:
+                total_filas += 1
+                comentario_limpio = clean_text(row.get('Comentario', ''))
+                comentario_norm = comentario_limpio.lower()
+                if not comentario_norm or seen_set.add(text_digest(comentario_norm)):
+                    continue
+                unicas += 1
+                row['Comentario'] = comentario_limpio
+                row['#'] = unicas
+                writer.writerow(row)
+    finally:
+        if isinstance(seen_set, SqliteSeenSet):
+            seen_set.close()
+
+    print(f"Limpieza completada (streaming, conjunto de vistos: {seen}):")
+    print(f"- Filas procesadas: {total_filas}")
+    print(f"- Comentarios duplicados o vacíos eliminados: {total_filas - unicas}")
+    print(f"- Filas únicas resultantes: {unicas}")
+    if seen == 'bloom':
+        print(f"- Filtro de Bloom: {len(seen_set.bits) / (1024 * 1024):.1f} MB, tasa de falsos positivos objetivo {error_rate}")
+    print_peak_rss()
+    print(f"- Archivo guardado como: {output_file}")
+
+def clean_duplicates(input_file, output_file, near=False, threshold=0.8, clusters_file=None, num_perm=64):
     if not os.path.exists(input_file):
         print(f"Error: El archivo {input_file} no existe.")
         return
@@ -24,14 +275,14 @@ def clean_duplicates(input_file, output_file):
         fieldnames = reader.fieldnames
         for row in reader:
             total_filas += 1
-            
+
             # Limpiamos el texto del comentario para la comparación y para el resultado
             comentario_original = row.get('Comentario', '')
             comentario_limpio = clean_text(comentario_original)
-            
+
             # Normalizamos para la detección de duplicados (minúsculas)
             comentario_norm = comentario_limpio.lower()
-            
+
             if comentario_norm and comentario_norm not in comentarios_vistos:
                 comentarios_vistos.add(comentario_norm)
                 # Actualizamos la fila con el texto limpio y el nuevo índice
@@ -41,19 +292,104 @@ def clean_duplicates(input_file, output_file):
             else:
                 duplicados += 1
 
+    filas_salida = filas_limpias
+    if near:
+        # Solo el representante de cada cluster se clasifica; el resto se completa con expand_clusters()
+        textos = [row['Comentario'] for row in filas_limpias]
+        assignment = cluster_near_duplicates(textos, threshold=threshold, num_perm=num_perm)
+        cluster_ids = {}
+        filas_salida = []
+        for pos, rep in enumerate(assignment):
+            if rep == pos:
+                cluster_ids[pos] = len(filas_salida) + 1
+                representante = dict(filas_limpias[pos])
+                representante['#'] = cluster_ids[pos]
+                filas_salida.append(representante)
+            filas_limpias[pos]['Representante'] = cluster_ids[rep]
+
+        clusters_file = clusters_file or os.path.splitext(output_file)[0] + "_clusters.csv"
+        with open(clusters_file, mode='w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(fieldnames) + ['Representante'])
+            writer.writeheader()
+            writer.writerows(filas_limpias)
+        print_cluster_report(assignment, textos)
+
     # Guardamos el archivo limpio
     with open(output_file, mode='w', encoding='utf-8-sig', newline='') as f:
         writer = csv.DictWriter(f, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(filas_limpias)
-    
+        writer.writerows(filas_salida)
+
     print(f"Limpieza completada:")
     print(f"- Filas procesadas: {total_filas}")
     print(f"- Comentarios duplicados o vacíos eliminados: {duplicados}")
     print(f"- Filas únicas resultantes: {len(filas_limpias)}")
+    if near:
+        print(f"- Representantes a clasificar: {len(filas_salida)}")
+        print(f"- Mapa de clusters guardado como: {clusters_file}")
+    print_peak_rss()
+    print(f"- Archivo guardado como: {output_file}")
+
+def expand_clusters(labeled_file, clusters_file, output_file):
+    """Copia las etiquetas de cada representante clasificado a todos los miembros de su cluster."""
+    with open(labeled_file, mode='r', encoding='utf-8-sig') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        delimiter = ';' if sample.count(';') > sample.count(',') else ','
+        reader = csv.DictReader(f, delimiter=delimiter)
+        labeled_fields = reader.fieldnames or []
+        etiquetas = {str(row['#']).strip(): row for row in reader}
+
+    with open(clusters_file, mode='r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        member_fields = [c for c in reader.fieldnames if c != 'Representante']
+        label_columns = [c for c in labeled_fields if c not in member_fields]
+        filas = []
+        sin_etiqueta = 0
+        for row in reader:
+            rep = etiquetas.get(str(row.pop('Representante')).strip())
+            if rep is None:
+                sin_etiqueta += 1
+            for col in label_columns:
+                row[col] = rep.get(col, '') if rep else ''
+            filas.append(row)
+
+    with open(output_file, mode='w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=member_fields + label_columns, delimiter=delimiter)
+        writer.writeheader()
+        writer.writerows(filas)
+
+    print(f"Expansión completada:")
+    print(f"- Filas con etiquetas del representante: {len(filas) - sin_etiqueta}/{len(filas)}")
+    print(f"- Columnas copiadas: {', '.join(label_columns)}")
     print(f"- Archivo guardado como: {output_file}")
 
 if __name__ == "__main__":
-    input_csv = "comentarios_fb.csv"
-    output_csv = "comentarios_fb_limpios.csv"
-    clean_duplicates(input_csv, output_csv)
+    parser = argparse.ArgumentParser(description="Elimina comentarios duplicados (exactos o casi idénticos)")
+    parser.add_argument("--input", default="comentarios_fb.csv", help="CSV de entrada")
+    parser.add_argument("--output", default="comentarios_fb_limpios.csv", help="CSV de salida")
+    parser.add_argument("--near", action="store_true", help="Agrupar casi-duplicados (MinHash/LSH) y dejar un representante por cluster")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Jaccard mínimo entre shingles para considerar casi-duplicado")
+    parser.add_argument("--num_perm", type=int, default=64, help="Permutaciones de MinHash")
+    parser.add_argument("--clusters_file", default=None, help="Mapa de clusters (por defecto <salida>_clusters.csv)")
+    parser.add_argument("--stream", action="store_true", help="Deduplicar en streaming con memoria acotada (no combinable con --near)")
+    parser.add_argument("--seen", choices=["memory", "bloom", "sqlite"], default="memory",
+                        help="Conjunto de vistos en modo --stream: digests en memoria, filtro de Bloom o SQLite en disco")
+    parser.add_argument("--expected_rows", type=int, default=10_000_000, help="Filas esperadas (dimensiona el filtro de Bloom)")
+    parser.add_argument("--error_rate", type=float, default=0.001, help="Falsos positivos tolerados por el filtro de Bloom")
+    parser.add_argument("--expand", metavar="CSV_CLASIFICADO", default=None,
+                        help="En lugar de limpiar, copia las etiquetas de los representantes a todo su cluster")
+    args = parser.parse_args()
+
+    if args.expand:
+        if not args.clusters_file:
+            parser.error("--expand requiere --clusters_file")
+        expand_clusters(args.expand, args.clusters_file, args.output)
+    elif args.stream:
+        if args.near:
+            parser.error("--stream no se puede combinar con --near")
+        clean_duplicates_streaming(args.input, args.output, seen=args.seen,
+                                   expected_rows=args.expected_rows, error_rate=args.error_rate)
+    else:
+        clean_duplicates(args.input, args.output, near=args.near, threshold=args.threshold,
+                         clusters_file=args.clusters_file, num_perm=args.num_perm)
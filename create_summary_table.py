@@ -1,30 +1,41 @@
 import pandas as pd
+import argparse
 import matplotlib.pyplot as plt
 
-def generate_summary():
-    # Load the CSV
-    df = pd.read_csv('Analítica_Datos_Daniel_Carol.csv')
-    
-    # Columns to analyze
-    figures = {
-        "Daniel Ximénez": "Apoyo Daniel",
-        "Carol Aviaga": "Apoyo Carol"
-    }
-    
-    # Sentiments to count
-    sentiments = ["FAVORABLE", "CONTRARIO", "NEUTRAL"]
-    
+from table_io import read_table
+
+# Columns to analyze
+FIGURES = {
+    "Daniel Ximénez": "Apoyo Daniel",
+    "Carol Aviaga": "Apoyo Carol"
+}
+
+# Sentiments to count
+SENTIMENTS = ["FAVORABLE", "CONTRARIO", "NEUTRAL"]
+
+# Rows the classifiers could not label after all retries (see classify_apoyo.py)
+UNRESOLVED_LABEL = "UNRESOLVED"
+
+def count_labels(df):
+    """Raw value counts per figure column; totals only cover SENTIMENTS so percentages add up to 100."""
+    counts = {}
+    totals = {}
+    for col_name in FIGURES.values():
+        column = df[col_name] if col_name in df.columns else pd.Series(dtype=object)
+        counts[col_name] = {str(k): int(v) for k, v in column.value_counts().items()}
+        totals[col_name] = sum(counts[col_name].get(sentiment, 0) for sentiment in SENTIMENTS)
+    return counts, totals
+
+def build_summary(counts, totals):
     results = []
     
-    for display_name, col_name in figures.items():
-        # Count values for the current figure
-        counts = df[col_name].value_counts()
-        total = len(df[col_name].dropna())
+    for display_name, col_name in FIGURES.items():
+        total = totals[col_name]
         
         row = {"Figura": display_name}
         
-        for sentiment in sentiments:
-            count = counts.get(sentiment, 0)
+        for sentiment in SENTIMENTS:
+            count = counts[col_name].get(sentiment, 0)
             percentage = (count / total * 100) if total > 0 else 0
             row[sentiment] = f"{count} ({percentage:.1f}%)".replace('.', ',')
         
@@ -35,12 +46,9 @@ def generate_summary():
     summary_df = pd.DataFrame(results)
     
     # Rename columns to match the image
-    summary_df = summary_df[["Figura", "FAVORABLE", "CONTRARIO", "NEUTRAL", "Total"]]
-    
-    # Print the table
-    print("\n2. Resultados cuantitativos\n")
-    print(summary_df.to_string(index=False))
+    return summary_df[["Figura", "FAVORABLE", "CONTRARIO", "NEUTRAL", "Total"]]
 
+def render_summary_table(summary_df, output_image='resultados_cuantitativos.png'):
     # Save as Image
     fig, ax = plt.subplots(figsize=(10, 2))
     ax.axis('off')
@@ -66,11 +74,31 @@ def generate_summary():
     
     plt.title("2. Resultados cuantitativos", loc='left', fontsize=16, fontweight='bold', pad=20)
     
-    output_image = 'resultados_cuantitativos.png'
     plt.savefig(output_image, bbox_inches='tight', dpi=300)
+    plt.close(fig)
+    return output_image
+
+def generate_summary(input_file='Analítica_Datos_Daniel_Carol.csv'):
+    # Load only the label columns (CSV, Parquet or Arrow)
+    df = read_table(input_file, columns=list(FIGURES.values()))
+    counts, totals = count_labels(df)
+    summary_df = build_summary(counts, totals)
+    
+    # Print the table
+    print("\n2. Resultados cuantitativos\n")
+    print(summary_df.to_string(index=False))
+    for display_name, col_name in FIGURES.items():
+        unresolved = counts[col_name].get(UNRESOLVED_LABEL, 0)
+        if unresolved:
+            print(f"{display_name}: {unresolved} comentarios {UNRESOLVED_LABEL} excluidos del total")
+
+    output_image = render_summary_table(summary_df)
     print(f"\nImagen guardada como: {output_image}")
     
     return summary_df
 
 if __name__ == "__main__":
-    generate_summary()
+    parser = argparse.ArgumentParser(description="Tabla de resultados cuantitativos")
+    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla de analítica (.csv, .parquet o .arrow)")
+    args = parser.parse_args()
+    generate_summary(args.input)
@@ -0,0 +1,280 @@
+"""
+Script: fake_ollama_server.py
+Descripción: Servidor local que imita /api/chat y /api/generate de Ollama para medir los
+             clasificadores sin un modelo real. Soporta "stream" (NDJSON) y "format": "json",
+             latencias configurables, slots paralelos, JSON malformado, ids omitidos y 429.
+
+Uso:
+    python fake_ollama_server.py --port 11500 --latency lognormal:0.3:0.4 --slots 4 --malformed 0.02 --throttle 0.01
+
+Las etiquetas son deterministas (hash del texto), así dos corridas sobre los mismos datos
+devuelven lo mismo. GET /stats devuelve contadores y latencias; POST /stats/reset los reinicia.
+prompt_eval_count imita la reutilización del KV cache: solo cuenta los caracteres (/4) que
+siguen al prefijo común con el prompt anterior.
+"""
+
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from classify_apoyo import VALID_LABELS
+from classify_topics import TopicClassifier
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STANCE_LABELS = sorted(VALID_LABELS)
+CHAT_ITEM_RE = re.compile(r"^- ID: (.+?), Comentario: (.*)$", re.MULTILINE)
+BATCH_TOPIC_RE = re.compile(r'^(\d+): "(.*)"$', re.MULTILINE)
+
+
+def parse_latency(spec: str):
+    """'fixed:0.2', 'uniform:0.1:0.5' o 'lognormal:<mediana>:<sigma>' -> función sin argumentos."""
+    kind, *params = spec.split(":")
+    values = [float(p) for p in params]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "lognormal":
+        import math
+        mu = math.log(values[0])
+        return lambda: random.lognormvariate(mu, values[1])
+    raise ValueError(f"Distribución de latencia desconocida: {spec}")
+
+
+def pick(options: List[str], text: str, salt: str) -> str:
+    digest = hashlib.md5(f"{salt}:{text}".encode("utf-8")).digest()
+    return options[digest[0] % len(options)]
+
+
+class FakeOllama:
+    def __init__(self, latency: str, per_item: float, slots: int, malformed: float,
+                 drop: float, throttle: float, seed: Optional[int] = None):
+        self.latency = parse_latency(latency)
+        self.per_item = per_item
+        self.slots = threading.Semaphore(max(1, slots))
+        self.malformed = malformed
+        self.drop = drop
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {"requests": 0, "throttled": 0, "malformed": 0, "items": 0, "dropped": 0,
+                          "prompt_tokens": 0, "prompt_tokens_total": 0}
+            self.latencies: List[float] = []
+            self.last_prompt = ""
+
+    def roll(self, probability: float) -> bool:
+        with self._lock:
+            return self.random.random() < probability
+
+    def record(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data = dict(self.stats)
+            data["latencies"] = list(self.latencies)
+            return data
+
+    def prompt_eval(self, body: Dict[str, Any]) -> int:
+        """Tokens "evaluados": los que no comparten prefijo con el prompt anterior."""
+        if "messages" in body:
+            prompt = "".join(f"<{m.get('role')}>{m.get('content', '')}" for m in body["messages"])
+        else:
+            prompt = body.get("prompt", "")
+        with self._lock:
+            common = 0
+            limit = min(len(prompt), len(self.last_prompt))
+            while common < limit and prompt[common] == self.last_prompt[common]:
+                common += 1
+            self.last_prompt = prompt
+            evaluated = (len(prompt) - common) // 4 + 1
+            self.stats["prompt_tokens"] += evaluated
+            self.stats["prompt_tokens_total"] += len(prompt) // 4 + 1
+        return evaluated
+
+    def answer(self, path: str, body: Dict[str, Any]) -> str:
+        """Arma el texto que "generaría" el modelo para la petición."""
+        if path == "/api/chat":
+            user_msg = body.get("messages", [{}])[-1].get("content", "")
+            system_msg = body.get("messages", [{}])[0].get("content", "")
+            items = CHAT_ITEM_RE.findall(user_msg)
+            combined = "apoyo_daniel" in system_msg + user_msg
+            out = []
+            for rid, text in items:
+                if self.roll(self.drop):
+                    self.record("dropped")
+                    continue
+                if combined:
+                    out.append({
+                        "id": rid,
+                        "apoyo_daniel": pick(STANCE_LABELS, text, "daniel"),
+                        "apoyo_carol": pick(STANCE_LABELS, text, "carol"),
+                        "topic": pick(TopicClassifier.TOPICS, text, "topic"),
+                    })
+                else:
+                    out.append({"id": rid, "apoyo": pick(STANCE_LABELS, text, system_msg[:40])})
+            self.record("items", len(items))
+            return json.dumps(out, ensure_ascii=False)
+
+        prompt = body.get("prompt", "")
+        batch_items = BATCH_TOPIC_RE.findall(prompt)
+        if batch_items:
+            results = []
+            for pos, text in batch_items:
+                if self.roll(self.drop):
+                    self.record("dropped")
+                    continue
+                results.append({"id": int(pos), "topic": pick(TopicClassifier.TOPICS, text, "topic")})
+            self.record("items", len(batch_items))
+            return json.dumps({"results": results}, ensure_ascii=False)
+        self.record("items")
+        return json.dumps({"topic": pick(TopicClassifier.TOPICS, prompt[-200:], "topic")}, ensure_ascii=False)
+
+
+def make_handler(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status: int, data: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+            payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(200, fake.snapshot())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if self.path == "/stats/reset":
+                fake.reset()
+                self._send_json(200, {"ok": True})
+                return
+            if self.path not in ("/api/chat", "/api/generate"):
+                self._send_json(404, {"error": "not found"})
+                return
+
+            fake.record("requests")
+            if fake.roll(fake.throttle):
+                fake.record("throttled")
+                self._send_json(429, {"error": "server busy"}, {"Retry-After": "1"})
+                return
+
+            started = time.perf_counter()
+            with fake.slots:
+                content = fake.answer(self.path, body)
+                n_items = max(1, content.count('"id"'))
+                time.sleep(max(0.0, fake.latency()) + fake.per_item * n_items)
+            if fake.roll(fake.malformed):
+                fake.record("malformed")
+                content = content[: max(1, len(content) // 2)]
+            elapsed = time.perf_counter() - started
+            with fake._lock:
+                fake.latencies.append(elapsed)
+
+            prompt_tokens = fake.prompt_eval(body)
+            final = {
+                "model": body.get("model", "fake"),
+                "done": True,
+                "total_duration": int(elapsed * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_tokens * 0.0002 * 1e9),
+                "eval_count": len(content) // 4,
+                "eval_duration": int(elapsed * 0.8 * 1e9),
+            }
+            field = "message" if self.path == "/api/chat" else "response"
+
+            if not body.get("stream", True):
+                final[field] = {"role": "assistant", "content": content} if field == "message" else content
+                self._send_json(200, final)
+                return
+
+            # Streaming NDJSON en chunks de pocos caracteres, como los tokens de Ollama
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for start in range(0, len(content), 8):
+                    piece = content[start : start + 8]
+                    chunk = {"done": False}
+                    chunk[field] = {"role": "assistant", "content": piece} if field == "message" else piece
+                    self._write_chunk(chunk)
+                final[field] = {"role": "assistant", "content": ""} if field == "message" else ""
+                self._write_chunk(final)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # El cliente cortó al recibir el JSON completo
+                pass
+
+        def _write_chunk(self, data: Dict[str, Any]):
+            line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n" % len(line) + line + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def serve(host: str, port: int, fake: FakeOllama) -> ThreadingHTTPServer:
+    """Arranca el servidor en un hilo y lo devuelve (llamar a shutdown() para detenerlo)."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", default="fixed:0.05", help="fixed:S | uniform:A:B | lognormal:MEDIANA:SIGMA")
+    parser.add_argument("--per_item", type=float, default=0.005, help="Segundos extra por comentario del batch")
+    parser.add_argument("--slots", type=int, default=4, help="Requests atendidas en paralelo (OLLAMA_NUM_PARALLEL)")
+    parser.add_argument("--malformed", type=float, default=0.0, help="Probabilidad de devolver JSON truncado")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probabilidad de omitir cada id en la respuesta")
+    parser.add_argument("--throttle", type=float, default=0.0, help="Probabilidad de responder 429")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla para las inyecciones de fallas")
+
+
+def fake_from_args(args: argparse.Namespace) -> FakeOllama:
+    return FakeOllama(args.latency, args.per_item, args.slots, args.malformed, args.drop, args.throttle, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor Ollama simulado para benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, fake_from_args(args))
+    logging.info(f"Ollama simulado escuchando en http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Módulo: label_cache.py
+Descripción: Cache persistente de etiquetas compartido por los clasificadores
+             (classify_apoyo.py, classify_apoyo_carol.py y classify_topics.py).
+
+La clave de cada entrada combina modelo, hash del prompt de sistema, opciones de
+muestreo y el texto normalizado. Así, editar un prompt invalida solo las entradas
+generadas con ese prompt y volver a correr sobre los mismos datos no hace llamadas HTTP.
+
+Si el archivo termina en .db/.sqlite se usa SqliteLabelCache (SQLite en modo WAL): no se
+carga nada al arrancar, cada guardado inserta solo las entradas nuevas en una transacción
+y se puede leer (por ejemplo para reportes) mientras la clasificación sigue escribiendo.
+Además guarda el resultado por fila de cada clasificador (tabla `results`).
+
+Migrar un cache JSON existente (las claves de formato anterior, que nunca coincidirían, se
+descartan):
+    python label_cache.py --db topics_cache.db --migrate topics_cache.json
+Ver el avance de una clasificación en curso:
+    python label_cache.py --db topics_cache.db --summary topic
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def normalize_text(text: str) -> str:
+    """Colapsa espacios y pasa a minúsculas para que variaciones triviales compartan clave."""
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+# Claves generadas por make_key(); los caches anteriores usaban md5 y no vuelven a coincidir
+KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class LabelCache:
+    # Guardar reescribe el archivo completo (ver SqliteLabelCache para guardados incrementales)
+    incremental = False
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> Dict[str, str]:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except Exception as e:
+                logging.error(f"Error cargando cache {self.path}: {e}")
+        return {}
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, options: Dict[str, Any], text: str) -> str:
+        material = json.dumps(
+            [model, prompt_hash(system_prompt), options, normalize_text(text)],
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            label = self._entries.get(key)
+            if label is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return label
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, str]:
+        """
+        Cruce en bloque: devuelve solo las claves presentes. Cuenta los aciertos; los
+        fallos se cuentan cuando las claves pendientes pasan por get() al clasificarse.
+        """
+        with self._lock:
+            found = {key: self._entries[key] for key in keys if key in self._entries}
+            self.hits += len(found)
+        return found
+
+    def set(self, key: str, label: str):
+        with self._lock:
+            self._entries[key] = label
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def save(self):
+        """Escribe a un temporal y renombra, para no dejar el cache a medio escribir."""
+        with self._lock:
+            snapshot = dict(self._entries)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logging.error(f"Error guardando cache {self.path}: {e}")
+
+    def stats(self) -> str:
+        return f"cache: {self.hits} aciertos, {self.misses} fallos, {len(self)} entradas"
+
+
+class SqliteLabelCache:
+    """Misma interfaz que LabelCache, sobre SQLite (WAL) con upserts por lote."""
+
+    incremental = True
+    # Máximo de parámetros por consulta IN (...)
+    LOOKUP_CHUNK = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Etiquetas todavía no guardadas: save() las escribe en una sola transacción
+        self._dirty: Dict[str, str] = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS labels ("
+            "key TEXT PRIMARY KEY, label TEXT NOT NULL, updated_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "target TEXT NOT NULL, row_id TEXT NOT NULL, key TEXT, label TEXT NOT NULL, "
+            "source TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (target, row_id)) WITHOUT ROWID"
+        )
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, options: Dict[str, Any], text: str) -> str:
+        return LabelCache.make_key(model, system_prompt, options, text)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            label = self._dirty.get(key)
+            if label is None:
+                row = self.conn.execute("SELECT label FROM labels WHERE key = ?", (key,)).fetchone()
+                label = row[0] if row else None
+            if label is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return label
+
+    def lookup(self, keys: Iterable[str]) -> Dict[str, str]:
+        """Cruce en bloque por índice; cuenta los aciertos (los fallos se cuentan en get())."""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, str] = {}
+        with self._lock:
+            for start in range(0, len(keys), self.LOOKUP_CHUNK):
+                chunk = keys[start : start + self.LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self.conn.execute(
+                    f"SELECT key, label FROM labels WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            wanted = set(keys)
+            found.update({key: label for key, label in self._dirty.items() if key in wanted})
+            self.hits += len(found)
+        return found
+
+    def set(self, key: str, label: str):
+        with self._lock:
+            self._dirty[key] = label
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            if key in self._dirty:
+                return True
+            return self.conn.execute("SELECT 1 FROM labels WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        with self._lock:
+            stored = self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+            new = sum(
+                1 for key in self._dirty
+                if self.conn.execute("SELECT 1 FROM labels WHERE key = ?", (key,)).fetchone() is None
+            )
+            return stored + new
+
+    def _upsert_labels(self, items: List[Tuple[str, str]]):
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO labels (key, label, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET label = excluded.label, updated_at = excluded.updated_at",
+                [(key, label, now) for key, label in items],
+            )
+
+    def save(self):
+        """Escribe solo las entradas nuevas o cambiadas, en una transacción."""
+        with self._lock:
+            if not self._dirty:
+                return
+            items = list(self._dirty.items())
+            try:
+                self._upsert_labels(items)
+                self._dirty.clear()
+            except sqlite3.Error as e:
+                logging.error(f"Error guardando cache {self.path}: {e}")
+
+    def store_results(self, target: str, rows: Iterable[Tuple[str, Optional[str], str, str]]):
+        """Upsert transaccional de resultados por fila: (row_id, clave, etiqueta, origen)."""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO results (target, row_id, key, label, source, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(target, row_id) DO UPDATE SET key = excluded.key, label = excluded.label, "
+                "source = excluded.source, updated_at = excluded.updated_at",
+                [(target, str(row_id), key, label, source, now) for row_id, key, label, source in rows],
+            )
+
+    def migrate_json(self, json_path: str) -> int:
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        valid = [(key, label) for key, label in entries.items() if KEY_RE.match(key)]
+        if len(valid) < len(entries):
+            logging.warning(f"{len(entries) - len(valid)} entradas de {json_path} con claves de formato anterior descartadas")
+        with self._lock:
+            self._upsert_labels(valid)
+        return len(valid)
+
+    def stats(self) -> str:
+        return f"cache: {self.hits} aciertos, {self.misses} fallos, {len(self)} entradas"
+
+    def close(self):
+        self.save()
+        self.conn.close()
+
+
+def open_label_cache(path: str):
+    """LabelCache (JSON) o SqliteLabelCache según la extensión del archivo."""
+    if os.path.splitext(path)[1].lower() in SQLITE_EXTENSIONS:
+        return SqliteLabelCache(path)
+    return LabelCache(path)
+
+
+def results_summary(db_path: str, target: str) -> Counter:
+    """Conteo por etiqueta y origen; abre su propia conexión de solo lectura (seguro en paralelo)."""
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    try:
+        rows = conn.execute(
+            "SELECT label, source, COUNT(*) FROM results WHERE target = ? GROUP BY label, source", (target,)
+        ).fetchall()
+    finally:
+        conn.close()
+    return Counter({(label, source): n for label, source, n in rows})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cache de etiquetas en SQLite: migración y resumen")
+    parser.add_argument("--db", required=True, help="Archivo SQLite del cache (.db)")
+    parser.add_argument("--migrate", default="", help="Cache JSON a importar")
+    parser.add_argument("--summary", default="", help="Mostrar los resultados por fila de este clasificador (ej. topic)")
+    args = parser.parse_args()
+
+    if args.migrate:
+        cache = SqliteLabelCache(args.db)
+        migrated = cache.migrate_json(args.migrate)
+        logging.info(f"{migrated} entradas importadas de {args.migrate}; {len(cache)} en {args.db}")
+        cache.close()
+    if args.summary:
+        counts = results_summary(args.db, args.summary)
+        total = sum(counts.values())
+        print(f"{args.summary}: {total} filas")
+        for (label, source), n in sorted(counts.items(), key=lambda kv: -kv[1]):
+            print(f"  {label:<40} {source:<12} {n:>7}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,192 @@
+"""
+Módulo: llm_metrics.py
+Descripción: Métricas por request de todas las llamadas a Ollama. Cada request (y cada
+             fallo de parseo o fallback de un clasificador) se agrega como una línea JSON a
+             METRICS_FILE, y al final de la corrida se informa un resumen: latencia
+             p50/p95/p99, tokens/seg, tokens de prompt, reintentos, fallos de parseo, tasa de
+             aciertos del cache y tasa de fallback.
+
+Las llamadas pasan por ollama_client.OllamaClient, que registra cada request. Los
+clasificadores agregan contexto (batch, comentarios, intento) con METRICS.context(...).
+
+Resumir un archivo de métricas ya escrito (por ejemplo, de varias corridas):
+    python llm_metrics.py llm_metrics.jsonl
+"""
+
+import json
+import time
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional
+
+from adaptive_batch import percentile
+
+
+class LLMMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self.script = ""
+        self.reset()
+
+    def reset(self):
+        self.latencies: List[float] = []
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.parse_failures = 0
+        self.fallbacks = 0
+        self.prompt_tokens = 0
+        self.eval_tokens = 0
+        self.eval_seconds = 0.0
+        self.prompt_seconds = 0.0
+        self.load_seconds = 0.0
+        self.with_counts = 0
+
+    def configure(self, path: str, script: str):
+        """Abre el JSONL de métricas (append). path vacío = solo el resumen en memoria."""
+        self.close()
+        self.script = script
+        if path:
+            self._file = open(path, "a", encoding="utf-8")
+
+    @contextmanager
+    def context(self, **fields):
+        """Campos que se agregan a cada línea registrada por este hilo (batch, items, attempt...)."""
+        previous = getattr(self._local, "fields", {})
+        self._local.fields = {**previous, **fields}
+        try:
+            yield
+        finally:
+            self._local.fields = previous
+
+    def _write(self, entry: Dict[str, Any]):
+        if self._file is None:
+            return
+        entry = {"ts": round(time.time(), 3), "script": self.script, **getattr(self._local, "fields", {}), **entry}
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def record_request(
+        self,
+        endpoint: str,
+        latency: float,
+        response: Optional[Dict[str, Any]] = None,
+        error: Optional[str] = None,
+        **extra,
+    ):
+        response = response or {}
+        fields = getattr(self._local, "fields", {})
+        entry = {
+            "event": "request",
+            "endpoint": endpoint,
+            "latency_s": round(latency, 4),
+            "ok": error is None,
+            "prompt_eval_count": response.get("prompt_eval_count"),
+            "eval_count": response.get("eval_count"),
+            "total_duration_s": (response.get("total_duration") or 0) / 1e9 or None,
+            "prompt_eval_duration_s": (response.get("prompt_eval_duration") or 0) / 1e9 or None,
+            "eval_duration_s": (response.get("eval_duration") or 0) / 1e9 or None,
+            "load_duration_s": (response.get("load_duration") or 0) / 1e9 or None,
+            **extra,
+        }
+        if error is not None:
+            entry["error"] = error[:300]
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.errors += int(error is not None)
+            self.retries += int(fields.get("attempt", 1) > 1)
+            if response.get("eval_count") is not None:
+                self.with_counts += 1
+                self.prompt_tokens += int(response.get("prompt_eval_count") or 0)
+                self.eval_tokens += int(response["eval_count"])
+                # Sin eval_duration (servidores viejos) se usa la duración total
+                self.eval_seconds += (response.get("eval_duration") or response.get("total_duration") or 0) / 1e9
+                self.prompt_seconds += (response.get("prompt_eval_duration") or 0) / 1e9
+                self.load_seconds += (response.get("load_duration") or 0) / 1e9
+            self._write(entry)
+
+    def parse_failure(self, detail: str = "", **extra):
+        with self._lock:
+            self.parse_failures += 1
+            self._write({"event": "parse_failure", "detail": detail[:300], **extra})
+
+    def fallback(self, count: int = 1, reason: str = "", **extra):
+        """Comentarios que terminaron sin etiqueta del modelo (UNRESOLVED o fallback por palabras clave)."""
+        if count <= 0:
+            return
+        with self._lock:
+            self.fallbacks += count
+            self._write({"event": "fallback", "count": count, "reason": reason, **extra})
+
+    def summary(self, cache=None, comments: Optional[int] = None) -> str:
+        with self._lock:
+            if not self.requests:
+                lines = ["métricas LLM: sin requests"]
+            else:
+                tokens_per_sec = self.eval_tokens / self.eval_seconds if self.eval_seconds else float("nan")
+                n = self.with_counts or 1
+                lines = [
+                    f"métricas LLM: {self.requests} requests ({self.errors} con error, {self.retries} reintentos, "
+                    f"{self.parse_failures} fallos de parseo, {self.fallbacks} comentarios en fallback)",
+                    f"  latencia p50 {percentile(self.latencies, 50):.2f}s | p95 {percentile(self.latencies, 95):.2f}s | "
+                    f"p99 {percentile(self.latencies, 99):.2f}s",
+                    f"  tokens: {self.prompt_tokens / n:.0f} de prompt y {self.eval_tokens / n:.0f} generados por request, "
+                    f"{tokens_per_sec:.1f} tokens/seg; evaluación del prompt prom. {self.prompt_seconds / n * 1000:.0f} ms, "
+                    f"carga del modelo prom. {self.load_seconds / n * 1000:.0f} ms",
+                ]
+            if cache is not None:
+                lookups = cache.hits + cache.misses
+                rate = cache.hits / lookups * 100 if lookups else 0.0
+                lines.append(f"  cache: {rate:.1f}% de aciertos ({cache.hits}/{lookups})")
+            if comments:
+                lines.append(f"  fallback: {self.fallbacks / comments * 100:.1f}% ({self.fallbacks}/{comments} comentarios)")
+            return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+METRICS = LLMMetrics()
+
+
+def summarize_file(path: str, entries: Optional[Iterable[Dict[str, Any]]] = None) -> str:
+    """Rearma el resumen desde un JSONL de métricas, agrupado por script."""
+    if entries is None:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    by_script: Dict[str, LLMMetrics] = {}
+    for entry in entries:
+        metrics = by_script.setdefault(entry.get("script", ""), LLMMetrics())
+        with metrics.context(attempt=entry.get("attempt", 1)):
+            if entry.get("event") == "request":
+                response = {
+                    key: int(entry[f"{key}_s"] * 1e9) if entry.get(f"{key}_s") else None
+                    for key in ("total_duration", "prompt_eval_duration", "eval_duration", "load_duration")
+                }
+                response["prompt_eval_count"] = entry.get("prompt_eval_count")
+                response["eval_count"] = entry.get("eval_count")
+                metrics.record_request(entry.get("endpoint", ""), entry["latency_s"], response, entry.get("error"))
+            elif entry.get("event") == "parse_failure":
+                metrics.parse_failure()
+            elif entry.get("event") == "fallback":
+                metrics.fallback(entry.get("count", 1))
+    return "\n".join(f"[{script or '?'}]\n{metrics.summary()}" for script, metrics in by_script.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resumen de un archivo de métricas de llamadas a Ollama")
+    parser.add_argument("path", nargs="?", default="llm_metrics.jsonl", help="JSONL de métricas")
+    args = parser.parse_args()
+    print(summarize_file(args.path))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
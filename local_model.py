@@ -0,0 +1,249 @@
+"""
+Módulo: local_model.py
+Descripción: Modelo local liviano (TF-IDF de n-gramas de caracteres + regresión logística)
+             entrenado con las etiquetas que ya puso el LLM. Predice postura y tópico en CPU
+             en microsegundos por comentario; solo las filas con baja confianza van a Ollama.
+
+Requiere scikit-learn (opcional: pip install scikit-learn).
+
+Entrenar (reporta exactitud y cobertura por umbral sobre un 20% reservado):
+    python local_model.py train --input Analítica_Datos_Daniel_Carol.csv --target apoyo_daniel
+    python local_model.py train --input Topics_Clean.csv --target topic
+
+Predecir sobre un scrape nuevo (las filas bajo el umbral quedan vacías para el LLM):
+    python local_model.py predict --input Comentarios_Limpios.csv --output pre.csv --target apoyo_daniel
+
+En los clasificadores se activa con LOCAL_MODEL_FILE (o --local_model en classify_topics.py).
+Los modelos son pickles: cargar solo archivos generados por este script.
+"""
+
+import os
+import time
+import pickle
+import logging
+import argparse
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from rule_classifier import TARGET_COLUMNS, RuleAudit, RuleResult
+
+# Etiquetas que no sirven como ejemplo de entrenamiento
+IGNORED_LABELS = {"", "nan", "<NA>", "UNRESOLVED"}
+
+
+def _require_sklearn():
+    try:
+        import sklearn  # noqa: F401
+    except ImportError:
+        raise ImportError("El modelo local requiere scikit-learn: pip install scikit-learn")
+
+
+def default_model_file(target: str) -> str:
+    return f"local_model_{target}.pkl"
+
+
+def training_examples(df, column: str, text_column: str = "Comentario") -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for text, label in zip(df[text_column].tolist(), df[column].tolist()):
+        label = str(label).strip()
+        if label in IGNORED_LABELS:
+            continue
+        texts.append(str(text))
+        labels.append(label)
+    return texts, labels
+
+
+class LocalModel:
+    def __init__(self, target: str, pipeline: Any, trained_on: int):
+        self.target = target
+        self.pipeline = pipeline
+        self.trained_on = trained_on
+
+    @classmethod
+    def fit(cls, target: str, texts: List[str], labels: List[str], C: float = 20.0) -> "LocalModel":
+        _require_sklearn()
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.pipeline import make_pipeline
+
+        pipeline = make_pipeline(
+            TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 5), lowercase=True,
+                            strip_accents="unicode", sublinear_tf=True, min_df=2),
+            # C alto: con pocos cientos de ejemplos la regularización por defecto deja todas las
+            # probabilidades cerca del azar y ninguna fila supera el umbral
+            LogisticRegression(max_iter=2000, class_weight="balanced", C=C),
+        )
+        pipeline.fit(texts, labels)
+        return cls(target, pipeline, len(texts))
+
+    @property
+    def labels(self) -> List[str]:
+        return list(self.pipeline.classes_)
+
+    def predict(self, texts: List[str]) -> List[Tuple[str, float]]:
+        """(etiqueta, probabilidad) por comentario, en un solo paso vectorizado."""
+        if not texts:
+            return []
+        probabilities = self.pipeline.predict_proba([str(t) for t in texts])
+        classes = self.pipeline.classes_
+        best = probabilities.argmax(axis=1)
+        return [(str(classes[b]), float(probabilities[i, b])) for i, b in enumerate(best)]
+
+    def save(self, path: str):
+        import sklearn
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"target": self.target, "pipeline": self.pipeline, "trained_on": self.trained_on,
+                         "sklearn_version": sklearn.__version__}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalModel":
+        _require_sklearn()
+        import sklearn
+
+        with open(path, "rb") as f:
+            data = pickle.load(f)
+        if data.get("sklearn_version") != sklearn.__version__:
+            logging.warning(f"{path} se entrenó con scikit-learn {data.get('sklearn_version')}; conviene reentrenar")
+        return cls(data["target"], data["pipeline"], data["trained_on"])
+
+
+def model_preclassify(
+    target: str,
+    items: Iterable[Tuple[Any, str, str]],
+    model_file: str,
+    threshold: float,
+    audit_file: Optional[str] = None,
+) -> Dict[Any, str]:
+    """
+    Igual que rule_classifier.preclassify pero con el modelo local. items: (clave, id, texto).
+    Devuelve clave -> etiqueta para las filas con probabilidad >= threshold.
+    """
+    model = LocalModel.load(model_file)
+    if model.target != target:
+        logging.warning(f"{model_file} fue entrenado para '{model.target}', no para '{target}'")
+    items = list(items)
+    started = time.perf_counter()
+    predictions = model.predict([text for _, _, text in items])
+    elapsed = time.perf_counter() - started
+
+    audit = RuleAudit(audit_file, target) if audit_file else None
+    labels: Dict[Any, str] = {}
+    for (key, row_id, text), (label, probability) in zip(items, predictions):
+        if probability < threshold:
+            continue
+        labels[key] = label
+        if audit is not None:
+            audit.record(row_id, text, RuleResult(label, probability, ["modelo_local"]))
+    if audit is not None:
+        audit.close()
+    per_comment = elapsed / len(items) * 1e6 if items else 0.0
+    logging.info(
+        f"Modelo local ({target}, umbral {threshold}): {len(labels)}/{len(items)} resueltos, "
+        f"{per_comment:.0f} µs por comentario; el resto va al LLM"
+    )
+    return labels
+
+
+def evaluate(model: LocalModel, texts: List[str], labels: List[str], thresholds: List[float]):
+    """Exactitud y cobertura por umbral sobre ejemplos no vistos."""
+    predictions = model.predict(texts)
+    total = len(labels)
+    print(f"Evaluación sobre {total} comentarios reservados:")
+    print(f"{'umbral':>8}{'locales':>10}{'cobertura':>11}{'exactitud':>11}")
+    for threshold in thresholds:
+        local = [(p, l) for (p, prob), l in zip(predictions, labels) if prob >= threshold]
+        correct = sum(1 for p, l in local if p == l)
+        coverage = len(local) / total * 100 if total else 0.0
+        accuracy = correct / len(local) * 100 if local else float("nan")
+        print(f"{threshold:>8.2f}{len(local):>10}{coverage:>10.1f}%{accuracy:>10.1f}%")
+
+
+def train_command(args):
+    from table_io import read_table
+
+    column = args.column or TARGET_COLUMNS[args.target]
+    df = read_table(args.input, columns=["Comentario", column])
+    if column not in df.columns:
+        logging.error(f"La tabla no tiene la columna '{column}'")
+        return
+    texts, labels = training_examples(df, column)
+    logging.info(f"{len(texts)} ejemplos etiquetados: {dict(Counter(labels))}")
+
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    if args.holdout > 0:
+        _require_sklearn()
+        from sklearn.model_selection import train_test_split
+
+        counts = Counter(labels)
+        stratify = labels if min(counts.values()) >= 2 else None
+        train_texts, test_texts, train_labels, test_labels = train_test_split(
+            texts, labels, test_size=args.holdout, random_state=42, stratify=stratify
+        )
+        evaluate(LocalModel.fit(args.target, train_texts, train_labels, C=args.C), test_texts, test_labels, thresholds)
+
+    # El modelo final se entrena con todos los ejemplos
+    started = time.perf_counter()
+    model = LocalModel.fit(args.target, texts, labels, C=args.C)
+    model_file = args.model_file or default_model_file(args.target)
+    model.save(model_file)
+    logging.info(f"Modelo guardado en {model_file} ({time.perf_counter() - started:.2f}s de entrenamiento)")
+
+
+def predict_command(args):
+    from table_io import read_table, write_table
+
+    model_file = args.model_file or default_model_file(args.target)
+    model = LocalModel.load(model_file)
+    df = read_table(args.input)
+    column = args.column or TARGET_COLUMNS[args.target]
+
+    started = time.perf_counter()
+    predictions = model.predict(df["Comentario"].astype(str).tolist())
+    elapsed = time.perf_counter() - started
+
+    df[column] = [label if prob >= args.threshold else "" for label, prob in predictions]
+    df[f"{column} (confianza)"] = [round(prob, 3) for _, prob in predictions]
+    write_table(df, args.output)
+    routed = sum(1 for _, prob in predictions if prob < args.threshold)
+    logging.info(
+        f"{len(df)} comentarios en {elapsed:.3f}s ({elapsed / max(len(df), 1) * 1e6:.0f} µs c/u); "
+        f"{routed} bajo el umbral {args.threshold} quedan para el LLM. Guardado en {args.output}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modelo local (TF-IDF + regresión logística) entrenado con las etiquetas del LLM")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train = sub.add_parser("train", help="Entrenar con una tabla ya etiquetada")
+    train.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla etiquetada (.csv, .parquet o .arrow)")
+    train.add_argument("--holdout", type=float, default=0.2, help="Fracción reservada para evaluar (0 = no evaluar)")
+    train.add_argument("--C", type=float, default=20.0, help="Inversa de la regularización de la regresión logística")
+    train.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9", help="Umbrales de confianza a evaluar")
+
+    predict = sub.add_parser("predict", help="Etiquetar una tabla con el modelo local")
+    predict.add_argument("--input", default="Comentarios_Limpios.csv", help="Tabla de comentarios")
+    predict.add_argument("--output", default="Prediccion_Local.csv", help="Tabla de salida")
+    predict.add_argument("--threshold", type=float, default=0.8, help="Probabilidad mínima para aceptar la etiqueta")
+
+    for p in (train, predict):
+        p.add_argument("--target", choices=sorted(TARGET_COLUMNS), default="apoyo_daniel")
+        p.add_argument("--column", default=None, help="Columna de la etiqueta (por defecto la del objetivo)")
+        p.add_argument("--model_file", default=None, help="Archivo del modelo (por defecto local_model_<target>.pkl)")
+
+    args = parser.parse_args()
+    if not os.path.exists(args.input):
+        logging.error(f"Archivo de entrada no encontrado: {args.input}")
+        return
+    if args.command == "train":
+        train_command(args)
+    else:
+        predict_command(args)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
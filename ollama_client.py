@@ -0,0 +1,322 @@
+"""
+Módulo: ollama_client.py
+Descripción: Cliente compartido para las llamadas a Ollama de los clasificadores.
+
+Todas las llamadas pasan por una requests.Session con pool de conexiones keep-alive,
+así cada batch reutiliza la conexión TCP en lugar de abrir una nueva. Con streaming, la respuesta NDJSON se consume a medida que llega y se corta en cuanto
+el primer valor JSON (objeto o array) queda cerrado: el resto de la generación se
+cancela cerrando la conexión. Se reportan el tiempo al primer token y al resultado.
+Cada request queda registrado en llm_metrics.METRICS (latencia, tokens, errores).
+"""
+
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from llm_metrics import METRICS
+from rate_limiter import RateLimiter
+
+# Respuestas que indican saturación del servidor y activan el backoff compartido
+THROTTLE_STATUS = {429, 503}
+
+# Errores que post()/stream() dejan pasar al llamador
+REQUEST_ERRORS = (requests.exceptions.RequestException, RuntimeError, ValueError)
+
+# Pausa entre reintentos de los errores que no pasan por el backoff compartido
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 8.0
+
+
+def is_throttle_error(error: Exception) -> bool:
+    """429/503, conexión caída o timeout: el rate limiter ya aplicó el backoff compartido."""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        return error.response.status_code in THROTTLE_STATUS
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def retry_delay(error: Exception, attempt: int) -> float:
+    """
+    Segundos a esperar antes de reintentar tras el intento `attempt` (1, 2, ...). Los errores
+    de saturación ya frenan a todos los hilos en el rate limiter (0); el resto (HTTP 500,
+    respuesta cortada...) usa un backoff exponencial acotado propio.
+    """
+    if is_throttle_error(error):
+        return 0.0
+    return min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+
+
+class JsonCompletionScanner:
+    """Detecta incrementalmente el cierre del primer valor JSON de nivel superior."""
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """Agrega texto; devuelve el JSON completo en cuanto se cierra, si no None."""
+        self.buffer += chunk
+        while self._pos < len(self.buffer):
+            ch = self.buffer[self._pos]
+            self._pos += 1
+            if self._start == -1:
+                if ch in "[{":
+                    self._start = self._pos - 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return self.buffer[self._start : self._pos]
+        return None
+
+
+class StreamStats:
+    """Acumula las métricas de streaming de toda la corrida (seguro entre hilos)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ttfts: List[float] = []
+        self.results: List[float] = []
+        self.early_stops = 0
+
+    def record(self, ttft: Optional[float], time_to_result: float, early_stop: bool):
+        with self._lock:
+            if ttft is not None:
+                self.ttfts.append(ttft)
+            self.results.append(time_to_result)
+            self.early_stops += int(early_stop)
+
+    def summary(self) -> str:
+        with self._lock:
+            if not self.results:
+                return "streaming: sin llamadas"
+            avg_ttft = sum(self.ttfts) / len(self.ttfts) if self.ttfts else float("nan")
+            avg_result = sum(self.results) / len(self.results)
+            return (
+                f"streaming: {len(self.results)} llamadas, primer token prom. {avg_ttft:.2f}s, "
+                f"resultado prom. {avg_result:.2f}s, cortes tempranos {self.early_stops}"
+            )
+
+
+STREAM_STATS = StreamStats()
+
+
+def stream_request(
+    url: str,
+    payload: Dict[str, Any],
+    timeout: float,
+    content_field: str,
+    session: Optional[requests.Session] = None,
+) -> Dict[str, Any]:
+    """
+    Envía el payload con "stream": true y acumula el texto de cada chunk NDJSON.
+    content_field: "message" para /api/chat, "response" para /api/generate.
+    Devuelve {"content", "ttft", "time_to_result", "early_stop"} (tiempos en segundos).
+    """
+    http = session or requests
+    payload = dict(payload, stream=True)
+    scanner = JsonCompletionScanner()
+    started = time.perf_counter()
+    ttft = None
+    early_stop = False
+    content = None
+    final: Dict[str, Any] = {}
+
+    with http.post(url, json=payload, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise RuntimeError(chunk["error"])
+            if content_field == "message":
+                piece = chunk.get("message", {}).get("content", "")
+            else:
+                piece = chunk.get("response", "")
+            if piece and ttft is None:
+                ttft = time.perf_counter() - started
+            content = scanner.feed(piece)
+            if content is not None:
+                # Cerrar la respuesta aborta la generación en el servidor
+                early_stop = not chunk.get("done", False)
+                break
+            if chunk.get("done"):
+                final = chunk
+                break
+
+    elapsed = time.perf_counter() - started
+    STREAM_STATS.record(ttft, elapsed, early_stop)
+    metrics = {
+        "content": content if content is not None else scanner.buffer,
+        "ttft": ttft,
+        "time_to_result": elapsed,
+        "early_stop": early_stop,
+        # Último chunk (done): trae prompt_eval_count, eval_count y duraciones; vacío si se cortó antes
+        "final": final,
+    }
+    logging.debug(
+        f"Stream {url}: primer token {ttft if ttft is not None else float('nan'):.2f}s, "
+        f"resultado {elapsed:.2f}s, corte temprano={early_stop}"
+    )
+    return metrics
+
+
+class OllamaClient:
+    """Sesión HTTP compartida (keep-alive) contra un host de Ollama."""
+
+    def __init__(
+        self,
+        host: str,
+        pool_size: int = 10,
+        timeout: float = 180,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.host = host.rstrip("/")
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter()
+        self.session = requests.Session()
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        # Cuenta cada socket abierto, incluidas las reconexiones que urllib3 hace sin
+        # contarlas en num_connections (p. ej. tras cortar un stream antes de tiempo)
+        self._connects = 0
+        self._lock = threading.Lock()
+        self._adapter.poolmanager.pool_classes_by_scheme = self._counting_pool_classes()
+        self.session.mount("http://", self._adapter)
+        self.session.mount("https://", self._adapter)
+
+    def _counting_pool_classes(self) -> Dict[str, type]:
+        client = self
+
+        def counted(connection_cls: type) -> type:
+            class CountingConnection(connection_cls):
+                def connect(self):
+                    super().connect()
+                    with client._lock:
+                        client._connects += 1
+
+            return CountingConnection
+
+        class CountingPool(HTTPConnectionPool):
+            ConnectionCls = counted(HTTPConnection)
+
+        class CountingHTTPSPool(HTTPSConnectionPool):
+            ConnectionCls = counted(HTTPSConnection)
+
+        return {"http": CountingPool, "https": CountingHTTPSPool}
+
+    def _throttled(self, error: Exception):
+        """Activa el backoff compartido si el error indica saturación o caída del servidor."""
+        if not is_throttle_error(error):
+            return
+        retry_after = None
+        if isinstance(error, requests.exceptions.HTTPError):
+            retry_after = error.response.headers.get("Retry-After")
+        try:
+            self.limiter.backoff(float(retry_after) if retry_after else None)
+        except ValueError:
+            self.limiter.backoff()
+
+    def post(self, path: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        with self.limiter.slot():
+            started = time.perf_counter()
+            try:
+                response = self.session.post(
+                    f"{self.host}{path}", json=payload, timeout=timeout or self.timeout
+                )
+                response.raise_for_status()
+                data = response.json()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                METRICS.record_request(path, time.perf_counter() - started, error=str(e))
+                if isinstance(e, requests.exceptions.RequestException):
+                    self._throttled(e)
+                raise
+        METRICS.record_request(path, time.perf_counter() - started, data)
+        self.limiter.success()
+        return data
+
+    def stream(
+        self, path: str, payload: Dict[str, Any], content_field: str, timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        with self.limiter.slot():
+            started = time.perf_counter()
+            try:
+                result = stream_request(
+                    f"{self.host}{path}", payload, timeout or self.timeout, content_field, session=self.session
+                )
+            except (requests.exceptions.RequestException, RuntimeError, ValueError) as e:
+                METRICS.record_request(path, time.perf_counter() - started, error=str(e), stream=True)
+                if isinstance(e, requests.exceptions.RequestException):
+                    self._throttled(e)
+                raise
+        METRICS.record_request(
+            path, result["time_to_result"], result["final"], stream=True,
+            ttft_s=round(result["ttft"], 4) if result["ttft"] is not None else None,
+            early_stop=result["early_stop"],
+        )
+        self.limiter.success()
+        return result
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Sockets TCP abiertos (contados en connect()) vs requests enviadas por el pool de urllib3."""
+        sent = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                sent += pool.num_requests
+        with self._lock:
+            connections = self._connects
+        return {"requests": sent, "connections": connections, "reused": max(sent - connections, 0)}
+
+    def stats(self) -> str:
+        s = self.connection_stats()
+        return (
+            f"conexiones: {s['connections']} abiertas para {s['requests']} requests "
+            f"({s['reused']} reutilizadas)"
+        )
+
+    def close(self):
+        self.session.close()
+
+
+_clients: Dict[str, OllamaClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(
+    host: str,
+    pool_size: int = 10,
+    timeout: float = 180,
+    rps: float = 0.0,
+    max_concurrency: int = 0,
+) -> OllamaClient:
+    """Devuelve el cliente compartido para el host (se crea en el primer uso, con su limitador)."""
+    key = host.rstrip("/")
+    with _clients_lock:
+        if key not in _clients:
+            limiter = RateLimiter(rps=rps, burst=max(1, int(rps)), max_concurrency=max_concurrency)
+            _clients[key] = OllamaClient(key, pool_size=pool_size, timeout=timeout, limiter=limiter)
+        return _clients[key]
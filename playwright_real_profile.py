@@ -1,10 +1,13 @@
 import asyncio
 import os
+import time
 import random
-import csv
+from typing import List, Tuple
 from playwright.async_api import async_playwright
 import logging
 
+from checkpoint_journal import AppendOnlyCsv
+
 # Configuración básica de logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -14,11 +17,100 @@ USER_DATA_DIR = './fb_session'
 # URL del post a scrapear
 POST_URL = "https://www.facebook.com/100064865195272/posts/1355079436664217/?mibextid=rS40aB7S9Ucbxw6v"
 
+# Salida: se agregan filas al final y se reanuda desde lo ya guardado
+CSV_FILE = 'comentarios_fb.csv'
+CSV_FIELDNAMES = ['#', 'Autor', 'Comentario']
+# Segundos entre fsync del CSV (el flush se hace en cada pasada)
+FSYNC_INTERVAL = 30
+
+# Cada comentario es un div[role="article"]; el autor es el primer nodo de texto y el
+# cuerpo el más largo de los siguientes
+ARTICLE_SELECTOR = 'div[role="article"]'
+TEXT_SELECTOR = 'div[dir="auto"], span[dir="auto"]'
+# Marca que se pone en el DOM a los artículos ya extraídos para no recorrerlos de nuevo
+SEEN_ATTRIBUTE = 'data-scraped'
+
+# Botón que Facebook pone al final de un comentario largo mostrado recortado
+SEE_MORE_PATTERN = '^(ver más|see more)$'
+
+# Funciones compartidas por los scripts en página: un artículo está recortado si tiene
+# su propio botón "Ver más" (no el de una respuesta anidada)
+_ARTICLE_HELPERS_JS = """
+const ownSeeMore = (article, articleSelector, seeMore) =>
+    [...article.querySelectorAll('[role="button"]')].filter(button =>
+        button.closest(articleSelector) === article && seeMore.test((button.textContent || '').trim()));
+"""
+
+# Expande en una sola llamada los "Ver más" de los artículos todavía sin extraer
+EXPAND_TRUNCATED_JS = """
+([articleSelector, seenAttribute, seeMorePattern]) => {
+""" + _ARTICLE_HELPERS_JS + """
+    const seeMore = new RegExp(seeMorePattern, 'i');
+    let clicked = 0;
+    for (const article of document.querySelectorAll(`${articleSelector}:not([${seenAttribute}])`)) {
+        for (const button of ownSeeMore(article, articleSelector, seeMore)) {
+            button.click();
+            clicked++;
+        }
+    }
+    return clicked;
+}
+"""
+
+# Extracción en una sola llamada a page.evaluate: recorre dentro de la página solo los
+# artículos sin marcar y devuelve [autor, comentario] de cada uno. Los artículos con
+# menos de dos nodos de texto (todavía cargando) o que siguen recortados ("Ver más") no
+# se marcan y se reintentan en la próxima pasada; con includeTruncated (última pasada)
+# se devuelven igual, recortados, antes que perderlos.
+EXTRACT_ARTICLES_JS = """
+([articleSelector, textSelector, seenAttribute, seeMorePattern, includeTruncated]) => {
+""" + _ARTICLE_HELPERS_JS + """
+    const seeMore = new RegExp(seeMorePattern, 'i');
+    const found = [];
+    for (const article of document.querySelectorAll(`${articleSelector}:not([${seenAttribute}])`)) {
+        if (!includeTruncated && ownSeeMore(article, articleSelector, seeMore).length) continue;
+        const parts = [];
+        for (const node of article.querySelectorAll(textSelector)) {
+            const content = (node.textContent || '').trim();
+            if (content) parts.push(content);
+        }
+        if (parts.length < 2) continue;
+        let body = parts[1];
+        for (const part of parts.slice(2)) {
+            if (part.length > body.length) body = part;
+        }
+        article.setAttribute(seenAttribute, '1');
+        found.push([parts[0], body]);
+    }
+    return found;
+}
+"""
+
+
+async def expand_truncated(page) -> int:
+    """Hace clic en los "Ver más" de los comentarios sin extraer; devuelve cuántos expandió."""
+    return await page.evaluate(EXPAND_TRUNCATED_JS, [ARTICLE_SELECTOR, SEEN_ATTRIBUTE, SEE_MORE_PATTERN])
+
+
+async def extract_articles(page, include_truncated: bool = False) -> List[Tuple[str, str]]:
+    """(autor, comentario) de los artículos nuevos desde la última pasada, en un solo round-trip."""
+    rows = await page.evaluate(
+        EXTRACT_ARTICLES_JS,
+        [ARTICLE_SELECTOR, TEXT_SELECTOR, SEEN_ATTRIBUTE, SEE_MORE_PATTERN, include_truncated],
+    )
+    return [(author, body) for author, body in rows]
+
 async def main():
     # Nos aseguramos de que el directorio de sesión exista
     if not os.path.exists(USER_DATA_DIR):
         os.makedirs(USER_DATA_DIR)
 
+    # Reanudar: lo ya guardado no se reescribe ni se duplica
+    writer = AppendOnlyCsv(CSV_FILE, CSV_FIELDNAMES, fsync_interval=FSYNC_INTERVAL)
+    existing_rows = writer.load()
+    if existing_rows:
+        logging.info(f"Reanudando: {len(existing_rows)} comentarios ya guardados en {CSV_FILE}")
+
     async with async_playwright() as p:
         logging.info(f"Lanzando navegador con contexto persistente en: {USER_DATA_DIR}")
         
@@ -104,52 +196,44 @@ async def main():
             logging.warning(f"Error al cambiar filtro: {e}")
 
         # --- EXTRACCIÓN PROGRESIVA ---
-        extracted_data = []
-        seen_comments = set()
-        csv_file = 'comentarios_fb.csv'
+        seen_comments = {f"{row['Autor']}_{row['Comentario']}" for row in existing_rows}
+        saved_count = len(existing_rows)
 
-        async def extract_and_save():
-            nonlocal extracted_data, seen_comments
+        async def extract_and_save(final: bool = False):
+            nonlocal saved_count
             try:
-                elements = await page.locator('div[role="article"]').all()
-                new_found = 0
-                for el in elements:
-                    try:
-                        text_nodes = el.locator('div[dir="auto"], span[dir="auto"]')
-                        node_count = await text_nodes.count()
-                        parts = []
-                        for i in range(node_count):
-                            content = await text_nodes.nth(i).text_content()
-                            if content: parts.append(content.strip())
-                        
-                        if len(parts) >= 2:
-                            author = parts[0]
-                            # Buscamos la parte que probablemente sea el comentario (más larga)
-                            comment_body = max(parts[1:], key=len)
-                            unique_key = f"{author}_{comment_body}"
-                            
-                            if unique_key not in seen_comments:
-                                extracted_data.append({
-                                    '#': len(extracted_data) + 1,
-                                    'Autor': author,
-                                    'Comentario': comment_body
-                                })
-                                seen_comments.add(unique_key)
-                                new_found += 1
-                    except: continue
+                # Primero se expanden los comentarios recortados, para guardar el texto completo
+                if await expand_truncated(page):
+                    await asyncio.sleep(1)
+                started = time.perf_counter()
+                articles = await extract_articles(page, include_truncated=final)
+                elapsed = time.perf_counter() - started
+                new_rows = []
+                for author, comment_body in articles:
+                    # Si Facebook vuelve a renderizar un comentario pierde la marca: se deduplica igual
+                    unique_key = f"{author}_{comment_body}"
+                    if unique_key not in seen_comments:
+                        new_rows.append({
+                            '#': saved_count + len(new_rows) + 1,
+                            'Autor': author,
+                            'Comentario': comment_body
+                        })
+                        seen_comments.add(unique_key)
+                new_found = len(new_rows)
+                logging.info(f"Extracción: {len(articles)} artículos nuevos en {elapsed * 1000:.0f} ms")
                 
                 if new_found > 0:
-                    with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
-                        writer = csv.DictWriter(f, fieldnames=['#', 'Autor', 'Comentario'])
-                        writer.writeheader()
-                        writer.writerows(extracted_data)
-                    logging.info(f"PROGRESO: {len(extracted_data)} comentarios guardados (Nuevos: {new_found})")
+                    # Solo se agregan las filas nuevas; flush por pasada y fsync periódico
+                    writer.write(new_rows)
+                    writer.flush()
+                    saved_count += new_found
+                    logging.info(f"PROGRESO: {saved_count} comentarios guardados (Nuevos: {new_found})")
             except Exception as e:
                 logging.error(f"Error en extracción progresiva: {e}")
 
         # Lógica de Scroll y Carga de Comentarios (MODO ENGAÑO + PROGRESIVO)
         logging.info("Iniciando carga profunda con guardado progresivo...")
-        last_found_count = 0
+        last_found_count = saved_count
         no_change_count = 0
         total_actions = 0
         
@@ -160,7 +244,7 @@ async def main():
             # Extraer lo que hay hasta ahora
             await extract_and_save()
             
-            current_count = len(extracted_data)
+            current_count = saved_count
             if current_count > last_found_count:
                 last_found_count = current_count
                 no_change_count = 0
@@ -224,7 +308,10 @@ async def main():
             
             if total_actions > 400: break # Límite de seguridad
 
-        logging.info(f"Scraping finalizado. Total: {len(extracted_data)}")
+        # Última pasada: los que no se pudieron expandir se guardan recortados
+        await extract_and_save(final=True)
+        writer.close()
+        logging.info(f"Scraping finalizado. Total: {saved_count}")
         await context.close()
 
 if __name__ == '__main__':
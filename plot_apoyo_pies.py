@@ -1,7 +1,10 @@
 import os
+import argparse
 import pandas as pd
 import matplotlib.pyplot as plt
 
+from table_io import read_table
+
 """
 Genera dos gráficos de torta (Apoyo Daniel, Apoyo Carol) y los guarda en un solo PNG.
 """
@@ -54,13 +57,34 @@ def make_pie(ax, counts, title, colors):
     ax.axis('equal')
 
 
+def render_pies(counts_daniel, counts_carol, out_png='apoyo_pie_charts.png'):
+    """Dibuja las dos donas a partir de conteos ya calculados (ver load_counts)."""
+    # Colores elegantes: Daniel (verde, rojo, gris), Carol (blue, orange, grey)
+    colors_daniel = ['#2E8B57', '#D9534F', '#9E9E9E']
+    colors_carol = ['#0072B2', '#FF7F0E', '#9E9E9E']
+
+    fig, axes = plt.subplots(1, 2, figsize=(14, 7))
+    make_pie(axes[0], counts_daniel, 'Distribución - Apoyo Daniel', colors_daniel)
+    make_pie(axes[1], counts_carol, 'Distribución - Apoyo Carol', colors_carol)
+
+    plt.suptitle('Distribución de Etiquetas (FAVORABLE / CONTRARIO / NEUTRAL)', fontsize=16, y=0.98)
+    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
+
+    plt.savefig(out_png, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+    return out_png
+
+
 if __name__ == '__main__':
-    input_csv = 'Analítica_Datos_Daniel_Carol.csv'
+    parser = argparse.ArgumentParser(description='Gráficos de torta de Apoyo Daniel / Apoyo Carol')
+    parser.add_argument('--input', default='Analítica_Datos_Daniel_Carol.csv', help='Tabla de analítica (.csv, .parquet o .arrow)')
+    input_csv = parser.parse_args().input
     if not os.path.exists(input_csv):
         print(f"Archivo no encontrado: {input_csv}")
         raise SystemExit(1)
 
-    df = pd.read_csv(input_csv, encoding='utf-8-sig')
+    # Solo las columnas de etiquetas
+    df = read_table(input_csv, columns=['Apoyo Daniel', 'Apoyo Carol'])
 
     # Asegurar que existan las columnas esperadas
     for col in ['Apoyo Daniel', 'Apoyo Carol']:
@@ -71,17 +95,5 @@ if __name__ == '__main__':
     counts_daniel = load_counts(df, 'Apoyo Daniel')
     counts_carol = load_counts(df, 'Apoyo Carol')
 
-    # Colores elegantes: Daniel (verde, rojo, gris), Carol (blue, orange, grey)
-    colors_daniel = ['#2E8B57', '#D9534F', '#9E9E9E']
-    colors_carol = ['#0072B2', '#FF7F0E', '#9E9E9E']
-
-    fig, axes = plt.subplots(1, 2, figsize=(14, 7))
-    make_pie(axes[0], counts_daniel, 'Distribución - Apoyo Daniel', colors_daniel)
-    make_pie(axes[1], counts_carol, 'Distribución - Apoyo Carol', colors_carol)
-
-    plt.suptitle('Distribución de Etiquetas (FAVORABLE / CONTRARIO / NEUTRAL)', fontsize=16, y=0.98)
-    plt.tight_layout(rect=[0, 0.03, 1, 0.95])
-
-    out_png = 'apoyo_pie_charts.png'
-    plt.savefig(out_png, dpi=300, bbox_inches='tight')
+    out_png = render_pies(counts_daniel, counts_carol, 'apoyo_pie_charts.png')
     print(f"Guardado: {os.path.abspath(out_png)}")
@@ -16,13 +16,16 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import logging
 
+from table_io import read_table, table_columns
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+TOPIC_COLUMN_CANDIDATES = ["Topic", "Topics", "topic", "topics", "Tópico", "Topico", "Topic Principal", "topic_principal"]
+
 
 def detect_topic_column(df: pd.DataFrame) -> str:
     """Detecta la columna que contiene el tópico (preferencias explícitas)."""
-    candidates = ["Topic", "Topics", "topic", "topics", "Tópico", "Topico", "Topic Principal", "topic_principal"]
-    for c in candidates:
+    for c in TOPIC_COLUMN_CANDIDATES:
         if c in df.columns:
             return c
     # Fallback: buscar columna con pocas categorías y valores cortos
@@ -106,7 +109,7 @@ def plot_distribution(counts: pd.Series, title: str, output_path: str, other_thr
 
 def main():
     parser = argparse.ArgumentParser(description='Genera la distribución de tópicos desde un CSV')
-    parser.add_argument('--input', default='Topics_Clean.csv', help='CSV de entrada que contiene la columna Topic')
+    parser.add_argument('--input', default='Topics_Clean.csv', help='Tabla de entrada (.csv, .parquet o .arrow) con la columna Topic')
     parser.add_argument('--output', default='topics_distribution_final.png', help='Ruta de la imagen de salida')
     parser.add_argument('--title', default='Análisis de Tópicos', help='Título del gráfico')
     parser.add_argument('--other_threshold', type=float, default=0.0, help='Umbral (0-1) para agrupar categorías pequeñas')
@@ -117,12 +120,10 @@ def main():
         logging.error(f"Archivo de entrada no encontrado: {args.input}")
         return
 
-    # Detección automática de delimitador
-    with open(args.input, 'r', encoding='utf-8-sig') as f:
-        first_line = f.readline()
-        sep = ';' if ';' in first_line else ','
-    
-    df = pd.read_csv(args.input, encoding='utf-8-sig', sep=sep)
+    # Solo se carga la columna de tópicos si se reconoce por nombre (delimitador/formato los resuelve table_io)
+    columns = table_columns(args.input)
+    known = [c for c in TOPIC_COLUMN_CANDIDATES if c in columns]
+    df = read_table(args.input, columns=known[:1] or None)
 
     try:
         topic_col = detect_topic_column(df)
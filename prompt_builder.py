@@ -0,0 +1,65 @@
+"""
+Módulo: prompt_builder.py
+Descripción: Arma los prompts de todos los clasificadores en dos partes: un prefijo con todo
+             lo invariante (contexto, instrucciones y formato de respuesta), idéntico byte a
+             byte entre llamadas, y un sufijo con lo único que cambia (los comentarios).
+
+Ollama reutiliza el KV cache del prefijo que coincide con la llamada anterior, así cada
+request solo evalúa los tokens de los comentarios. En /api/chat el prefijo completo va en
+el mensaje de sistema y el mensaje de usuario lleva solo los comentarios; en
+/api/generate el prompt es prefijo + sufijo.
+
+Cada payload incluye `keep_alive` para que el modelo no se descargue entre batches (por
+defecto Ollama lo descarga a los 5 minutos). Los tiempos de evaluación del prompt que
+devuelve el servidor se acumulan en llm_metrics.METRICS.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+
+DEFAULT_KEEP_ALIVE = "30m"
+
+
+def parse_keep_alive(value: Optional[str]) -> Optional[Union[str, int]]:
+    """'30m', '1h' o segundos ('-1' = no descargar nunca); vacío = valor del servidor."""
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def comment_lines(batch: List[Dict[str, str]]) -> str:
+    """Sufijo de los clasificadores de postura: una línea por comentario."""
+    return "".join(f"- ID: {item['id']}, Comentario: {item['text']}\n" for item in batch)
+
+
+class PromptBuilder:
+    def __init__(self, prefix: str, keep_alive: Optional[Union[str, int]] = DEFAULT_KEEP_ALIVE):
+        self.prefix = prefix
+        self.keep_alive = keep_alive
+
+    def _payload(self, model: str, options: Dict[str, Any], **fields) -> Dict[str, Any]:
+        payload = {"model": model, **fields, "stream": False, "options": options}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def chat_payload(self, model: str, suffix: str, options: Dict[str, Any]) -> Dict[str, Any]:
+        return self._payload(
+            model,
+            options,
+            messages=[
+                {"role": "system", "content": self.prefix},
+                {"role": "user", "content": suffix},
+            ],
+        )
+
+    def generate_payload(
+        self, model: str, suffix: str, options: Dict[str, Any], fmt: Optional[str] = "json"
+    ) -> Dict[str, Any]:
+        payload = self._payload(model, options, prompt=self.prefix + suffix)
+        if fmt:
+            payload["format"] = fmt
+        return payload
@@ -0,0 +1,94 @@
+"""
+Módulo: rate_limiter.py
+Descripción: Limitador compartido por todas las llamadas a Ollama: token bucket de
+             requests por segundo, tope de requests simultáneas y backoff común
+             ante HTTP 429/503 o errores de conexión.
+
+Reemplaza las pausas fijas entre batches: si el servidor tiene capacidad no se espera
+nada; cuando responde 429/503 todos los hilos frenan juntos hasta que pase el backoff.
+"""
+
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rps: float = 0.0,
+        burst: int = 1,
+        max_concurrency: int = 0,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        """rps <= 0 y max_concurrency <= 0 significan sin límite."""
+        self.rps = rps
+        self.burst = max(1, burst)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._tokens = float(self.burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._lock = threading.Lock()
+        self._semaphore = threading.BoundedSemaphore(max_concurrency) if max_concurrency > 0 else None
+        self.waited = 0.0
+        self.backoffs = 0
+
+    def _take_token(self) -> float:
+        """Consume un token; devuelve cuánto hay que esperar antes de reintentar (0 = ya se puede enviar)."""
+        now = time.monotonic()
+        with self._lock:
+            if self._blocked_until > now:
+                return self._blocked_until - now
+            if self.rps > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rps)
+                self._last_refill = now
+                if self._tokens < 1:
+                    return (1 - self._tokens) / self.rps
+                self._tokens -= 1
+            return 0.0
+
+    def acquire(self):
+        if self._semaphore is not None:
+            self._semaphore.acquire()
+        while True:
+            wait = self._take_token()
+            if wait <= 0:
+                return
+            with self._lock:
+                self.waited += wait
+            time.sleep(wait)
+
+    def release(self):
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """Frena a todos los hilos: usa Retry-After si vino, si no backoff exponencial."""
+        with self._lock:
+            self._failures += 1
+            self.backoffs += 1
+            delay = retry_after if retry_after is not None else min(
+                self.max_backoff, self.base_backoff * 2 ** (self._failures - 1)
+            )
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        logging.warning(f"Servidor saturado o sin respuesta; pausa compartida de {delay:.1f}s.")
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+
+    def stats(self) -> str:
+        return f"rate limiter: {self.waited:.1f}s de espera total, {self.backoffs} backoffs"
@@ -0,0 +1,286 @@
+"""
+Script: report.py
+Descripción: Genera todos los informes (tabla de resultados cuantitativos, tortas de apoyo,
+             dona de tópicos, nube de palabras y sorteo de casos) leyendo la tabla de analítica
+             una sola vez. Las etiquetas se normalizan a categóricas, los agregados se calculan
+             en una pasada y cada figura se dibuja desde esos datos en memoria.
+
+Uso:
+    python report.py
+    python report.py --analytics Analítica.parquet --topics Topics_Clean.parquet --force
+
+Las figuras cuyos datos de entrada (y código de dibujo) no cambiaron desde la corrida anterior
+se saltean; las huellas se guardan en .report_state.json. Las figuras pendientes se dibujan
+en paralelo (un proceso por figura, backend Agg) y cada archivo se escribe de forma atómica.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import matplotlib
+# Sin ventana: los procesos del pool solo escriben archivos
+matplotlib.use("Agg")
+import pandas as pd
+
+import create_summary_table
+import plot_apoyo_pies
+import plot_topics_distribution
+import sorteo_casos
+import wordcloud_gen
+from table_io import read_table, table_columns
+from term_index import strip_accents, update_index_from_table
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+APOYO_COLUMNS = ["Apoyo Daniel", "Apoyo Carol"]
+
+
+def load_analytics(path: str) -> pd.DataFrame:
+    """Lee la tabla una vez y normaliza las columnas de etiquetas a categóricas."""
+    df = read_table(path)
+    for col in APOYO_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("string").str.strip().str.upper().astype("category")
+    return df
+
+
+def load_topic_counts(df: pd.DataFrame, topics_path: Optional[str]) -> Optional[pd.Series]:
+    """Conteo de tópicos: de la misma tabla si ya trae la columna, si no solo esa columna de la tabla de tópicos."""
+    known = [c for c in plot_topics_distribution.TOPIC_COLUMN_CANDIDATES if c in df.columns]
+    if known:
+        topics = df[known[0]]
+    elif topics_path and os.path.exists(topics_path):
+        columns = [c for c in plot_topics_distribution.TOPIC_COLUMN_CANDIDATES if c in table_columns(topics_path)]
+        if not columns:
+            logging.warning(f"No hay columna de tópicos en {topics_path}; se omite la dona de tópicos.")
+            return None
+        topics = read_table(topics_path, columns=columns[:1])[columns[0]]
+    else:
+        return None
+    return topics.fillna('No identificado').astype(str).value_counts()
+
+
+def compute_aggregates(df: pd.DataFrame, topic_counts: Optional[pd.Series], args: argparse.Namespace) -> Dict[str, Any]:
+    """Todos los agregados que necesitan las figuras, en una sola pasada sobre la tabla en memoria."""
+    counts, totals = create_summary_table.count_labels(df)
+    # Las nubes salen del índice incremental: solo se tokenizan los comentarios nuevos
+    index = update_index_from_table(df, args.wordcloud_index) if "Comentario" in df.columns else None
+    for label in args.wordcloud_labels:
+        if index is not None and label not in index.counts:
+            logging.warning(f"Etiqueta sin comentarios en el índice, se omite su nube: {label}")
+    aggregates: Dict[str, Any] = {
+        "summary": create_summary_table.build_summary(counts, totals),
+        # Las tortas usan los mismos conteos (las etiquetas ya vienen normalizadas)
+        "pies": {
+            col: {k: counts[col].get(k, 0) for k in create_summary_table.SENTIMENTS}
+            for col in APOYO_COLUMNS
+        },
+        "topics": topic_counts,
+        "wordclouds": {
+            label: index.frequencies(label or None)
+            for label in [""] + args.wordcloud_labels
+            if index is not None and (not label or label in index.counts)
+        },
+        "sample": sorteo_casos.sample_cases(df),
+    }
+    return aggregates
+
+
+def write_sample(sample: pd.DataFrame, output_file: str) -> str:
+    sample.to_csv(output_file, index=False, encoding='utf-8-sig')
+    return output_file
+
+
+def build_figures(aggregates: Dict[str, Any], args: argparse.Namespace) -> List[Dict[str, Any]]:
+    """Cada figura: función de dibujo top-level + argumentos ya agregados."""
+    figures = [
+        {
+            "output": args.summary_output,
+            "fn": create_summary_table.render_summary_table,
+            "output_arg": "output_image",
+            "kwargs": {"summary_df": aggregates["summary"], "output_image": args.summary_output},
+        },
+        {
+            "output": args.pies_output,
+            "fn": plot_apoyo_pies.render_pies,
+            "output_arg": "out_png",
+            "kwargs": {
+                "counts_daniel": aggregates["pies"]["Apoyo Daniel"],
+                "counts_carol": aggregates["pies"]["Apoyo Carol"],
+                "out_png": args.pies_output,
+            },
+        },
+        {
+            "output": args.sample_output,
+            "fn": write_sample,
+            "output_arg": "output_file",
+            "kwargs": {"sample": aggregates["sample"], "output_file": args.sample_output},
+        },
+    ]
+    if aggregates["topics"] is not None:
+        figures.append({
+            "output": args.topics_output,
+            "fn": plot_topics_distribution.plot_distribution,
+            "output_arg": "output_path",
+            "kwargs": {
+                "counts": aggregates["topics"],
+                "title": args.topics_title,
+                "output_path": args.topics_output,
+                "other_threshold": args.other_threshold,
+            },
+        })
+    for label, frequencies in aggregates["wordclouds"].items():
+        output = args.wordcloud_output if not label else wordcloud_output_for(args.wordcloud_output, label)
+        figures.append({
+            "output": output,
+            "fn": wordcloud_gen.render_wordcloud,
+            "output_arg": "output_image",
+            "kwargs": {"frequencies": frequencies, "output_image": output},
+        })
+    return figures
+
+
+def wordcloud_output_for(base_output: str, label: str) -> str:
+    """nube_comentarios.png + "Apoyo Daniel=CONTRARIO" -> nube_comentarios_apoyo_daniel_contrario.png"""
+    base, ext = os.path.splitext(base_output)
+    slug = re.sub(r"[^a-z0-9]+", "_", strip_accents(label).lower()).strip("_")
+    return f"{base}_{slug}{ext}"
+
+
+def render_figure(fn: Callable, kwargs: Dict[str, Any], output_arg: str) -> Tuple[str, float]:
+    """
+    Dibuja una figura en un temporal con la misma extensión y lo renombra al final:
+    un proceso cortado nunca deja una imagen a medio escribir. Devuelve (salida, segundos).
+    """
+    output = kwargs[output_arg]
+    base, ext = os.path.splitext(output)
+    tmp_path = f"{base}.tmp{ext}"
+    started = time.perf_counter()
+    try:
+        fn(**dict(kwargs, **{output_arg: tmp_path}))
+        os.replace(tmp_path, output)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output, time.perf_counter() - started
+
+
+def fingerprint(fn: Callable, kwargs: Dict[str, Any]) -> str:
+    """Huella de los datos de entrada y del código del módulo que dibuja la figura."""
+    digest = hashlib.sha256()
+    with open(inspect.getsourcefile(fn), "rb") as f:
+        digest.update(f.read())
+    digest.update(fn.__name__.encode("utf-8"))
+    for key in sorted(kwargs):
+        value = kwargs[key]
+        if isinstance(value, pd.DataFrame):
+            value = value.to_csv(index=False)
+        elif isinstance(value, pd.Series):
+            value = value.to_dict()
+        digest.update(key.encode("utf-8"))
+        digest.update(json.dumps(value, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_state(path: str) -> Dict[str, str]:
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError):
+            logging.warning(f"Estado de reportes ilegible ({path}); se regeneran todas las figuras.")
+    return {}
+
+
+def save_state(path: str, state: Dict[str, str]):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera todos los informes desde una sola lectura de la analítica")
+    parser.add_argument("--analytics", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla de analítica (.csv, .parquet o .arrow)")
+    parser.add_argument("--topics", default="Topics_Clean.csv", help="Tabla con la columna Topic (si la analítica no la trae)")
+    parser.add_argument("--summary_output", default="resultados_cuantitativos.png")
+    parser.add_argument("--pies_output", default="apoyo_pie_charts.png")
+    parser.add_argument("--topics_output", default="topics_distribution_final.png")
+    parser.add_argument("--wordcloud_output", default="nube_comentarios.png")
+    parser.add_argument("--sample_output", default="Casos_Sorteados.csv")
+    parser.add_argument("--wordcloud_index", default="wordcloud_index.json", help="Índice persistente de frecuencias de términos")
+    parser.add_argument("--wordcloud_labels", default="", help='Nubes extra por etiqueta, separadas por ";" (ej. "Apoyo Daniel=FAVORABLE;Apoyo Daniel=CONTRARIO")')
+    parser.add_argument("--topics_title", default="Análisis de Tópicos", help="Título de la dona de tópicos")
+    parser.add_argument("--other_threshold", type=float, default=0.0, help="Umbral (0-1) para agrupar tópicos pequeños")
+    parser.add_argument("--state_file", default=".report_state.json", help="Huellas de la última corrida")
+    parser.add_argument("--force", action="store_true", help="Regenerar todo aunque los datos no hayan cambiado")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesos para dibujar en paralelo (1 = secuencial)")
+    args = parser.parse_args()
+    args.wordcloud_labels = [l.strip() for l in args.wordcloud_labels.split(";") if l.strip()]
+
+    if not os.path.exists(args.analytics):
+        logging.error(f"Archivo de entrada no encontrado: {args.analytics}")
+        return
+
+    df = load_analytics(args.analytics)
+    logging.info(f"Analítica cargada: {len(df)} filas, {len(df.columns)} columnas")
+    aggregates = compute_aggregates(df, load_topic_counts(df, args.topics), args)
+
+    print("\n2. Resultados cuantitativos\n")
+    print(aggregates["summary"].to_string(index=False))
+
+    state = load_state(args.state_file)
+    timings: Dict[str, Any] = {}
+    to_render = []
+    for figure in build_figures(aggregates, args):
+        # La huella no incluye la ruta de salida (ya es la clave del estado)
+        inputs = {k: v for k, v in figure["kwargs"].items() if k != figure["output_arg"]}
+        figure["fingerprint"] = fingerprint(figure["fn"], inputs)
+        output = figure["output"]
+        if not args.force and state.get(output) == figure["fingerprint"] and os.path.exists(output):
+            timings[output] = None
+            continue
+        to_render.append(figure)
+
+    started = time.perf_counter()
+    workers = max(1, min(args.workers, len(to_render)))
+    if workers == 1:
+        for figure in to_render:
+            output, elapsed = render_figure(figure["fn"], figure["kwargs"], figure["output_arg"])
+            timings[output] = elapsed
+            state[output] = figure["fingerprint"]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(render_figure, figure["fn"], figure["kwargs"], figure["output_arg"]): figure
+                for figure in to_render
+            }
+            for future in as_completed(futures):
+                figure = futures[future]
+                try:
+                    output, elapsed = future.result()
+                except Exception as e:
+                    logging.error(f"Falló {figure['output']}: {e}")
+                    continue
+                timings[output] = elapsed
+                state[output] = figure["fingerprint"]
+    wall = time.perf_counter() - started
+    save_state(args.state_file, state)
+
+    print("\nTiempos por figura:")
+    for output, elapsed in timings.items():
+        print(f"  {output:<35} {'sin cambios' if elapsed is None else f'{elapsed:6.2f}s'}")
+    rendered = [t for t in timings.values() if t is not None]
+    print(f"  {'total (pared)':<35} {wall:6.2f}s  (suma de figuras {sum(rendered):.2f}s, {workers} procesos)")
+    logging.info(f"Reporte completo: {len(rendered)} archivos generados, {len(timings) - len(rendered)} sin cambios.")
+
+if __name__ == "__main__":
+    main()
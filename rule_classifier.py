@@ -0,0 +1,239 @@
+"""
+Módulo: rule_classifier.py
+Descripción: Pre-clasificador offline por reglas (frases disparadoras de los prompts de
+             classify_apoyo.py / classify_apoyo_carol.py y palabras clave de los tópicos).
+             Los comentarios vacíos o con reglas de alta confianza se etiquetan localmente,
+             registrando qué reglas dispararon; los ambiguos siguen yendo al modelo.
+
+Todas las reglas de un objetivo se compilan en una sola regex (grupos con nombre) y se
+evalúan sobre el texto en minúsculas y sin tildes. Confianza = peso de la etiqueta
+ganadora / peso total disparado (una proporción de pesos, no una probabilidad calibrada:
+1.0 solo dice que no hubo reglas en contra); se aplica solo si supera el umbral y el peso
+mínimo del objetivo (DEFAULT_MIN_WEIGHT).
+
+Medir la concordancia contra las etiquetas del LLM para ajustar el umbral:
+    python rule_classifier.py --input Analítica_Datos_Daniel_Carol.csv --target apoyo_daniel
+"""
+
+import os
+import re
+import json
+import logging
+import argparse
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from term_index import strip_accents
+
+TOPIC_UNKNOWN = "No identificado"
+
+# (nombre, etiqueta, patrón sobre texto sin tildes en minúsculas, peso)
+RULES: Dict[str, List[Tuple[str, str, str, float]]] = {
+    "apoyo_daniel": [
+        ("ley_permite", "FAVORABLE", r"\bla ley (?:lo |se )?(?:permite|ampara)", 3),
+        ("no_lo_impide", "FAVORABLE", r"\bno (?:se )?lo impide\b|\bnada (?:se )?lo impide\b", 3),
+        ("no_es_ilegal", "FAVORABLE", r"\bno (?:es|tiene nada de) ilegal\b", 3),
+        ("dejen_trabajar", "FAVORABLE", r"\bdej(?:en|alo|enlo|ar)(?:lo)? trabajar\b", 3),
+        ("salvar_vidas", "FAVORABLE", r"\bsalv(?:ar|a|o|ando) (?:vidas|la vida|una vida)\b", 3),
+        ("mientras_cumpla", "FAVORABLE", r"\bmientras cumpla", 2),
+        ("no_jodan", "FAVORABLE", r"\bno jod(?:an|as)\b|\bque jode\b", 2),
+        ("no_hay_problema", "FAVORABLE", r"\bno hay (?:ningun )?problema\b", 2),
+        ("mutualista_privada", "FAVORABLE", r"\bmutualista privada\b|\bno depende de la intendencia\b", 2),
+        ("tabare", "FAVORABLE", r"\btabare(?: vazquez)?\b", 2),
+        ("gran_medico", "FAVORABLE", r"\b(?:excelente|gran|buen) (?:medico|doctor|cirujano|profesional)\b", 2),
+        ("admiracion", "FAVORABLE", r"\badmir(?:o|a|acion)\b", 1),
+        ("circo", "FAVORABLE", r"\bcirco\b|\bpolitica barata\b|\bal pedo\b", 1),
+        ("incompatible", "CONTRARIO", r"\bincompatib(?:le|ilidad)\b", 2),
+        ("conflicto_interes", "CONTRARIO", r"\bconflicto de interes", 3),
+        ("que_renuncie", "CONTRARIO", r"\bque renuncie\b|\btiene que renunciar\b", 3),
+        ("que_investiguen", "CONTRARIO", r"\bque (?:lo )?investiguen\b", 3),
+        ("ilegal", "CONTRARIO", r"\bilegal\b", 1),
+        ("corrupcion", "CONTRARIO", r"\bcorrup(?:cion|to)\b", 2),
+        ("sancion", "CONTRARIO", r"\bsancion", 1),
+        ("dos_sueldos", "CONTRARIO", r"\bdos sueldos\b|\bdoble sueldo\b", 2),
+    ],
+    "apoyo_carol": [
+        ("insulto", "CONTRARIO", r"\b(?:envidiosa|resentida|loca|ignorante|histerica|payasa|bruta)\b", 3),
+        ("busca_camara", "CONTRARIO", r"\bbusca(?:ndo)? (?:camara|prensa|figuretti|protagonismo)\b", 3),
+        ("cocina", "CONTRARIO", r"\ba la cocina\b|\banda a lavar\b", 3),
+        ("nada_que_hacer", "CONTRARIO", r"\bno tiene nada (?:mejor )?que hacer\b", 3),
+        ("aprenda_ley", "CONTRARIO", r"\baprend(?:e|a) la ley\b", 2),
+        ("politiqueria", "CONTRARIO", r"\bpolitiquer(?:ia|a)\b|\bpersecucion\b|\bcirco\b", 2),
+        ("mujer_denunciante", "CONTRARIO", r"\b(?:esa|la) (?:mujer|senora|edila?|denunciante)\b", 1),
+        ("apoyo_carol", "FAVORABLE", r"\b(?:bien|bravo|excelente|muy bien) carol\b|\bapoyo a carol\b|\bfuerza carol\b", 3),
+        ("gracias_carol", "FAVORABLE", r"\bgracias carol\b|\bcarol tiene razon\b", 3),
+    ],
+    "topic": [
+        ("medico", "Vocación Médica y Humanidad", r"\b(?:medico|doctor|cirujano|pacientes?|sanatorio|operar|opero)\b", 1),
+        ("vidas", "Vocación Médica y Humanidad", r"\bsalv(?:ar|a|o|ando) (?:vidas|la vida)\b|\bhumanidad\b|\bvocacion\b", 2),
+        ("ley", "Legalidad y Compatibilidad Funcional", r"\bconstitucion\b|\bla ley\b|\breglamento\b|\bincompatib", 2),
+        ("legal", "Legalidad y Compatibilidad Funcional", r"\b(?:i?legal|permitido|municipal|privado)\b", 1),
+        ("rechazo", "Rechazo a la denuncia", r"\bdej(?:en|alo|enlo)(?:lo)? trabajar\b|\bal pedo\b|\bcirco\b|\bpolitica barata\b|\bresentimiento\b", 2),
+        ("joder", "Rechazo a la denuncia", r"\bjod(?:er|an|e)\b", 1),
+        ("gestion", "Crítica Política y Valores Políticos", r"\bgestion\b|\bpartido\b|\bfrente amplio\b|\bblancos?\b|\bcolorados?\b|\bvotos?\b", 1),
+    ],
+}
+
+# Peso mínimo por objetivo. Concordancia con las etiquetas del LLM con estos valores y
+# umbral 0.9 (rule_classifier.py sobre Analítica_Datos_Daniel_Carol.csv / Topics_Clean.csv):
+#   apoyo_daniel  2.0 -> 12.2% de cobertura, 82.1% de concordancia
+#   apoyo_carol   2.0 ->  4.1% de cobertura, 84.2% de concordancia
+#   topic         3.0 ->  1.0% de cobertura, 100% (2/2); con 2.0 una sola regla alcanzaba
+#                        ("salvar vidas" en comentarios de rechazo) y la concordancia era 60%
+DEFAULT_MIN_WEIGHT = {"apoyo_daniel": 2.0, "apoyo_carol": 2.0, "topic": 3.0}
+
+# Etiqueta para comentarios sin contenido (vacíos, solo emojis o puntuación)
+EMPTY_LABELS = {"apoyo_daniel": "NEUTRAL", "apoyo_carol": "NEUTRAL", "topic": TOPIC_UNKNOWN}
+
+# Columna con la etiqueta del LLM para el reporte de concordancia
+TARGET_COLUMNS = {"apoyo_daniel": "Apoyo Daniel", "apoyo_carol": "Apoyo Carol", "topic": "Topic"}
+
+
+class RuleResult(NamedTuple):
+    label: Optional[str]
+    confidence: float
+    rules: List[str]
+
+
+class RuleClassifier:
+    def __init__(self, target: str, threshold: float = 0.9, min_weight: Optional[float] = None):
+        if target not in RULES:
+            raise ValueError(f"Objetivo desconocido: {target} (opciones: {', '.join(RULES)})")
+        self.target = target
+        self.threshold = threshold
+        self.min_weight = DEFAULT_MIN_WEIGHT[target] if min_weight is None else min_weight
+        self._rules = {f"r{i}": rule for i, rule in enumerate(RULES[target])}
+        self._regex = re.compile("|".join(f"(?P<{name}>{rule[2]})" for name, rule in self._rules.items()))
+
+    def score(self, text: str) -> RuleResult:
+        """Evalúa las reglas sin aplicar el umbral (label None si no disparó ninguna)."""
+        normalized = strip_accents(str(text).lower())
+        if len(re.sub(r"[^\w]", "", normalized)) < 3:
+            return RuleResult(EMPTY_LABELS[self.target], 1.0, ["vacio"])
+
+        weights: Dict[str, float] = defaultdict(float)
+        fired: List[str] = []
+        for match in self._regex.finditer(normalized):
+            name, label, _, weight = self._rules[match.lastgroup]
+            if name not in fired:
+                fired.append(name)
+                weights[label] += weight
+        if not weights:
+            return RuleResult(None, 0.0, [])
+        label, top = max(weights.items(), key=lambda kv: kv[1])
+        if top < self.min_weight:
+            return RuleResult(label, 0.0, fired)
+        return RuleResult(label, top / sum(weights.values()), fired)
+
+    def classify(self, text: str) -> RuleResult:
+        """Devuelve la etiqueta solo si la confianza alcanza el umbral; si no, label None (va al LLM)."""
+        result = self.score(text)
+        if result.label is None or result.confidence < self.threshold:
+            return RuleResult(None, result.confidence, result.rules)
+        return result
+
+
+class RuleAudit:
+    """Registro JSONL (append) de cada etiqueta puesta por reglas: id, etiqueta, confianza y reglas."""
+
+    def __init__(self, path: str, target: str):
+        self.target = target
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, row_id: str, text: str, result: RuleResult):
+        entry = {
+            "id": row_id,
+            "target": self.target,
+            "label": result.label,
+            "confidence": round(result.confidence, 3),
+            "rules": result.rules,
+            "text": str(text)[:200],
+        }
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+
+def preclassify(
+    target: str,
+    items: Iterable[Tuple[Any, str, str]],
+    threshold: float,
+    audit_file: Optional[str] = None,
+) -> Dict[Any, str]:
+    """
+    Pre-pasada de los clasificadores. items: (clave, id, texto). Devuelve clave -> etiqueta
+    para los comentarios resueltos por reglas; el resto queda para el LLM.
+    """
+    classifier = RuleClassifier(target, threshold=threshold)
+    audit = RuleAudit(audit_file, target) if audit_file else None
+    labels: Dict[Any, str] = {}
+    fired: Counter = Counter()
+    for key, row_id, text in items:
+        result = classifier.classify(text)
+        if result.label is None:
+            continue
+        labels[key] = result.label
+        fired.update(result.rules)
+        if audit is not None:
+            audit.record(row_id, text, result)
+    if audit is not None:
+        audit.close()
+    top = ", ".join(f"{name}={n}" for name, n in fired.most_common(5))
+    logging.info(f"Pre-clasificados por reglas ({target}, umbral {threshold}): {len(labels)}" + (f" [{top}]" if top else ""))
+    return labels
+
+
+def agreement_report(texts: List[str], llm_labels: List[str], target: str, min_weight: Optional[float],
+                     thresholds: List[float]) -> None:
+    """Cobertura y concordancia con las etiquetas del LLM para cada umbral, y concordancia por regla."""
+    classifier = RuleClassifier(target, threshold=0.0, min_weight=min_weight)
+    scored = [(classifier.score(t), str(l).strip()) for t, l in zip(texts, llm_labels)]
+    scored = [(r, l) for r, l in scored if l and l not in ("nan", "UNRESOLVED")]
+    total = len(scored)
+    print(f"Concordancia reglas vs LLM ({target}, peso mínimo {classifier.min_weight}, {total} comentarios con etiqueta):")
+    print(f"{'umbral':>8}{'locales':>10}{'cobertura':>11}{'concord.':>10}")
+    for threshold in thresholds:
+        local = [(r, l) for r, l in scored if r.label is not None and r.confidence >= threshold]
+        agree = sum(1 for r, l in local if r.label == l)
+        coverage = len(local) / total * 100 if total else 0.0
+        rate = agree / len(local) * 100 if local else float("nan")
+        print(f"{threshold:>8.2f}{len(local):>10}{coverage:>10.1f}%{rate:>9.1f}%")
+
+    per_rule: Dict[str, Counter] = defaultdict(Counter)
+    for r, l in scored:
+        for name in r.rules:
+            per_rule[name]["disparos"] += 1
+            per_rule[name]["acuerdos"] += int(r.label == l)
+    print("\nPor regla (acuerdo de la etiqueta final cuando la regla disparó):")
+    for name, c in sorted(per_rule.items(), key=lambda kv: -kv[1]["disparos"]):
+        print(f"  {name:<22} {c['disparos']:>5} disparos, {c['acuerdos'] / c['disparos'] * 100:5.1f}% de acuerdo")
+
+
+def main():
+    from table_io import read_table
+
+    parser = argparse.ArgumentParser(description="Concordancia del pre-clasificador por reglas con las etiquetas del LLM")
+    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla ya clasificada por el LLM")
+    parser.add_argument("--target", choices=sorted(RULES), default="apoyo_daniel")
+    parser.add_argument("--column", default=None, help="Columna con la etiqueta del LLM (por defecto la del objetivo)")
+    parser.add_argument("--min_weight", type=float, default=None, help="Peso mínimo de reglas para etiquetar (por defecto el del objetivo)")
+    parser.add_argument("--thresholds", default="0.5,0.6,0.7,0.8,0.9,1.0", help="Umbrales de confianza a evaluar")
+    args = parser.parse_args()
+
+    column = args.column or TARGET_COLUMNS[args.target]
+    if not os.path.exists(args.input):
+        logging.error(f"Archivo de entrada no encontrado: {args.input}")
+        return
+    df = read_table(args.input, columns=["Comentario", column])
+    if column not in df.columns:
+        logging.error(f"La tabla no tiene la columna '{column}'")
+        return
+    thresholds = [float(t) for t in args.thresholds.split(",") if t.strip()]
+    agreement_report(df["Comentario"].astype(str).tolist(), df[column].astype(str).tolist(),
+                     args.target, args.min_weight, thresholds)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -1,28 +1,35 @@
-import pandas as pd
 import os
+import argparse
 
-def sortear_casos():
-    input_file = 'Analítica_Datos_Daniel_Carol.csv'
-    output_file = 'Casos_Sorteados.csv'
+from table_io import read_table
+
+def sortear_casos(input_file='Analítica_Datos_Daniel_Carol.csv', output_file='Casos_Sorteados.csv'):
     
     if not os.path.exists(input_file):
         print(f"Error: No se encontró el archivo {input_file}")
         return
 
     # Cargar los datos
-    df = pd.read_csv(input_file)
+    df = read_table(input_file)
     total_casos = len(df)
     
     print(f"Total de casos disponibles: {total_casos}")
     
-    # Sortear 200 casos (o todos si hay menos de 200)
-    n_sorteo = min(200, total_casos)
-    df_sorteados = df.sample(n=n_sorteo, random_state=42) # random_state para reproducibilidad
+    df_sorteados = sample_cases(df)
     
     # Guardar los sorteados
     df_sorteados.to_csv(output_file, index=False, encoding='utf-8-sig')
     
-    print(f"¡Sorteo completado! Se han guardado {n_sorteo} casos en '{output_file}'.")
+    print(f"¡Sorteo completado! Se han guardado {len(df_sorteados)} casos en '{output_file}'.")
+
+def sample_cases(df, n=200):
+    # Sortear 200 casos (o todos si hay menos de 200)
+    n_sorteo = min(n, len(df))
+    return df.sample(n=n_sorteo, random_state=42) # random_state para reproducibilidad
 
 if __name__ == "__main__":
-    sortear_casos()
+    parser = argparse.ArgumentParser(description="Sorteo de casos para revisión manual")
+    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla de analítica (.csv, .parquet o .arrow)")
+    parser.add_argument("--output", default="Casos_Sorteados.csv", help="CSV de salida")
+    args = parser.parse_args()
+    sortear_casos(args.input, args.output)
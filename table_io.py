@@ -0,0 +1,186 @@
+"""
+Módulo: table_io.py
+Descripción: Lectura y escritura de las tablas del pipeline (comentarios limpios, analítica,
+             tópicos) en CSV o en formato columnar según la extensión del archivo:
+             .parquet (Parquet) o .arrow / .feather (Arrow IPC).
+
+En formato columnar las columnas de etiquetas se guardan como categóricas y los lectores
+cargan solo las columnas que necesitan. En CSV el delimitador (`,` o `;`) se detecta solo.
+Parquet/Arrow requieren `pyarrow` (opcional: pip install pyarrow).
+
+Exportar a CSV para Excel (paso final explícito):
+    python table_io.py Topics_Clean.parquet Topics_Clean.csv --delimiter ";"
+"""
+
+import os
+import csv
+import logging
+import argparse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from checkpoint_journal import write_csv_atomic
+
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+ARROW_EXTENSIONS = (".arrow", ".feather", ".ipc")
+# Columnas de etiquetas que se guardan como categóricas
+LABEL_COLUMNS = ("Apoyo Daniel", "Apoyo Carol", "Topic")
+
+
+def table_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in PARQUET_EXTENSIONS:
+        return "parquet"
+    if ext in ARROW_EXTENSIONS:
+        return "arrow"
+    return "csv"
+
+
+def is_columnar(path: str) -> bool:
+    return table_format(path) != "csv"
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError("Parquet/Arrow requiere pyarrow: pip install pyarrow")
+
+
+def sniff_delimiter(path: str) -> str:
+    with open(path, "r", encoding="utf-8-sig") as f:
+        first_line = f.readline()
+    return ";" if first_line.count(";") > first_line.count(",") else ","
+
+
+def table_columns(path: str) -> List[str]:
+    """Nombres de columnas sin cargar los datos."""
+    fmt = table_format(path)
+    if fmt == "parquet":
+        _require_pyarrow()
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(path).names)
+    if fmt == "arrow":
+        _require_pyarrow()
+        import pyarrow.ipc as ipc
+        with ipc.open_file(path) as reader:
+            return list(reader.schema.names)
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f, delimiter=sniff_delimiter(path)), [])
+
+
+def read_table(path: str, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Carga la tabla. Si se pasan `columns`, solo se leen esas (las que no existan se omiten,
+    así los lectores pueden pedir columnas opcionales).
+    """
+    if columns is not None:
+        available = table_columns(path)
+        columns = [c for c in columns if c in available]
+    fmt = table_format(path)
+    if fmt == "parquet":
+        _require_pyarrow()
+        return pd.read_parquet(path, columns=columns)
+    if fmt == "arrow":
+        _require_pyarrow()
+        return pd.read_feather(path, columns=columns)
+    return pd.read_csv(path, sep=sniff_delimiter(path), encoding="utf-8-sig", usecols=columns)
+
+
+def with_label_categories(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.copy()
+    for col in LABEL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def write_table(df: pd.DataFrame, path: str, delimiter: str = ","):
+    """Escribe la tabla (temporal + rename, nunca queda un archivo a medio escribir)."""
+    fmt = table_format(path)
+    tmp_path = f"{path}.tmp"
+    if fmt == "csv":
+        df.to_csv(tmp_path, index=False, encoding="utf-8-sig", sep=delimiter)
+    else:
+        _require_pyarrow()
+        typed = with_label_categories(df)
+        if fmt == "parquet":
+            typed.to_parquet(tmp_path, index=False)
+        else:
+            typed.reset_index(drop=True).to_feather(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_rows(path: str) -> Tuple[List[str], List[Dict[str, str]]]:
+    """Filas como diccionarios de strings (lo que esperan los clasificadores basados en csv)."""
+    if is_columnar(path):
+        df = read_table(path).astype("string").fillna("")
+        return list(df.columns), [{k: str(v) for k, v in row.items()} for row in df.to_dict("records")]
+    with open(path, mode="r", encoding="utf-8-sig", newline="") as f:
+        reader = csv.DictReader(f, delimiter=sniff_delimiter(path))
+        fieldnames = list(reader.fieldnames) if reader.fieldnames else []
+        return fieldnames, list(reader)
+
+
+def write_rows(path: str, fieldnames: List[str], rows: Iterable[Dict[str, str]]):
+    """Escritura atómica de filas ya completas, en CSV o columnar según la extensión."""
+    if is_columnar(path):
+        write_table(pd.DataFrame([{k: row.get(k, "") for k in fieldnames} for row in rows], columns=fieldnames), path)
+    else:
+        write_csv_atomic(path, fieldnames, rows)
+
+
+class RowWriter:
+    """
+    Escritor incremental: en CSV cada fila se escribe al llegar (como antes); en
+    Parquet/Arrow las filas se acumulan y la tabla se escribe al cerrar.
+    """
+
+    def __init__(self, path: str, fieldnames: List[str]):
+        self.path = path
+        self.fieldnames = fieldnames
+        self._rows: List[Dict[str, str]] = []
+        self._file = None
+        self._writer = None
+        if not is_columnar(path):
+            self._file = open(path, mode="w", encoding="utf-8-sig", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=fieldnames)
+            self._writer.writeheader()
+
+    def writerow(self, row: Dict[str, str]):
+        if self._writer is not None:
+            self._writer.writerow(row)
+        else:
+            self._rows.append(dict(row))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        else:
+            write_rows(self.path, self.fieldnames, self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convierte tablas del pipeline entre CSV, Parquet y Arrow")
+    parser.add_argument("source", help="Tabla de origen (.csv, .parquet, .arrow/.feather)")
+    parser.add_argument("target", help="Tabla de destino; el formato sale de la extensión")
+    parser.add_argument("--delimiter", default=";", help="Delimitador si el destino es CSV (';' para Excel en español)")
+    parser.add_argument("--columns", default="", help="Exportar solo estas columnas (separadas por coma)")
+    args = parser.parse_args()
+
+    columns = [c.strip() for c in args.columns.split(",") if c.strip()] or None
+    df = read_table(args.source, columns=columns)
+    write_table(df, args.target, delimiter=args.delimiter)
+    logging.info(f"{len(df)} filas exportadas de {args.source} a {args.target}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,243 @@
+"""
+Módulo: term_index.py
+Descripción: Índice persistente de frecuencias de términos para las nubes de palabras.
+             Cada comentario se tokeniza una sola vez: las corridas siguientes solo suman
+             los comentarios nuevos (o los que cambiaron de etiqueta), restan los que ya no
+             están en la tabla y la nube se dibuja con WordCloud.generate_from_frequencies,
+             sin volver a unir y re-contar todo el corpus.
+
+Los términos se agrupan sin tildes ni mayúsculas ("médico" y "medico" cuentan juntos) y se
+muestran con la forma más frecuente. Además del conteo global se guarda uno por etiqueta
+("Apoyo Daniel=FAVORABLE", "Topic=Rechazo a la denuncia", ...) para nubes por etiqueta.
+
+Uso:
+    python term_index.py --input Analítica_Datos_Daniel_Carol.csv --index wordcloud_index.json
+    python term_index.py --index wordcloud_index.json --list_labels
+
+El índice queda sincronizado con la última tabla indexada: los comentarios borrados o
+editados se descuentan solos (un comentario editado cuenta como borrado + nuevo).
+"""
+
+import os
+import re
+import json
+import hashlib
+import logging
+import argparse
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from table_io import read_table
+
+# Lista extendida de Stopwords en Español
+SPANISH_STOPWORDS = {
+    'de', 'la', 'que', 'el', 'en', 'y', 'a', 'los', 'del', 'se', 'las', 'por', 'un', 'para', 'con',
+    'no', 'una', 'su', 'al', 'lo', 'como', 'más', 'pero', 'sus', 'le', 'ya', 'o', 'este', 'sí',
+    'porque', 'esta', 'entre', 'cuando', 'muy', 'sin', 'sobre', 'también', 'me', 'hasta', 'hay',
+    'donde', 'quien', 'desde', 'todo', 'nos', 'durante', 'todos', 'uno', 'les', 'ni', 'contra',
+    'otros', 'ese', 'eso', 'ante', 'ellos', 'e', 'esto', 'mí', 'antes', 'algunos', 'qué', 'unos',
+    'yo', 'otro', 'otras', 'otra', 'él', 'tanto', 'esa', 'estos', 'mucho', 'quienes', 'nada',
+    'muchos', 'cual', 'poco', 'ella', 'estar', 'estas', 'algunas', 'algo', 'nosotros', 'mi',
+    'mis', 'tú', 'te', 'ti', 'tu', 'tus', 'si', 'ser', 'es', 'era', 're', 'tan', 'va', 've', 'son',
+    'ha', 'han', 'hace', 'hacer', 'puede', 'pueden', 'ver', 'comentarios', 'facebook', 'post', 'https', 'comentario'
+}
+
+LABEL_COLUMNS = ["Apoyo Daniel", "Apoyo Carol", "Topic"]
+ALL = "*"
+TOKEN_RE = re.compile(r"[^\W\d_]{2,}")
+INDEX_VERSION = 2
+
+
+def strip_accents(text: str) -> str:
+    decomposed = unicodedata.normalize("NFD", text)
+    return "".join(ch for ch in decomposed if unicodedata.category(ch) != "Mn")
+
+
+STOPWORD_KEYS = {strip_accents(w) for w in SPANISH_STOPWORDS}
+
+
+def tokenize(text: str) -> List[Tuple[str, str]]:
+    """Lista de (clave sin tildes, forma en minúsculas) sin stopwords ni números."""
+    tokens = []
+    for match in TOKEN_RE.finditer(str(text).lower()):
+        form = match.group(0)
+        key = strip_accents(form)
+        if key not in STOPWORD_KEYS:
+            tokens.append((key, form))
+    return tokens
+
+
+class TermIndex:
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        # digest del comentario -> {"labels": etiquetas con las que se contó, "forms": forma -> conteo}
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        # etiqueta (o "*") -> clave -> conteo
+        self.counts: Dict[str, Counter] = {ALL: Counter()}
+        # clave -> forma -> conteo (para mostrar la forma más usada)
+        self.forms: Dict[str, Counter] = {}
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != INDEX_VERSION:
+            # Los índices anteriores no guardaban los términos de cada comentario y no se pueden descontar
+            logging.warning(f"Índice {self.path} con formato anterior: se vuelve a contar desde cero")
+            return
+        self.entries = data.get("entries", {})
+        self.counts = {label: Counter(c) for label, c in data.get("counts", {}).items()}
+        self.counts.setdefault(ALL, Counter())
+        self.forms = {key: Counter(f) for key, f in data.get("forms", {}).items()}
+
+    @staticmethod
+    def comment_key(row_id: str, text: str) -> str:
+        return hashlib.blake2b(f"{row_id}\x00{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+    def _apply(self, forms: Dict[str, int], labels: Iterable[str], sign: int):
+        keys = Counter()
+        for form, n in forms.items():
+            keys[strip_accents(form)] += n
+        for label in labels:
+            bucket = self.counts.setdefault(label, Counter())
+            for key, n in keys.items():
+                bucket[key] += sign * n
+                if bucket[key] <= 0:
+                    del bucket[key]
+
+    def _forget(self, digest: str):
+        entry = self.entries.pop(digest)
+        self._apply(entry["forms"], [ALL] + entry["labels"], -1)
+        for form, n in entry["forms"].items():
+            key = strip_accents(form)
+            bucket = self.forms.get(key)
+            if bucket is None:
+                continue
+            bucket[form] -= n
+            if bucket[form] <= 0:
+                del bucket[form]
+            if not bucket:
+                del self.forms[key]
+
+    def update(self, rows: Iterable[Tuple[str, str, List[str]]]) -> Tuple[int, int, int]:
+        """
+        rows: la tabla completa como (id, texto, etiquetas). Solo tokeniza comentarios nuevos;
+        a los que cambiaron de etiqueta les mueve los conteos y los que no vienen en `rows`
+        (borrados o editados) se descuentan. Devuelve (nuevos, reetiquetados, descontados).
+
+        >>> index = TermIndex()
+        >>> index.update([("1", "Gran médico", ["Topic=A"]), ("2", "medico trucho", [])])
+        (2, 0, 0)
+        >>> index.frequencies()
+        {'gran': 1, 'médico': 2, 'trucho': 1}
+        >>> index.update([("1", "Gran médico", ["Topic=B"]), ("3", "Intendente", [])])
+        (1, 1, 1)
+        >>> index.frequencies(), index.frequencies("Topic=A"), index.frequencies("Topic=B")
+        ({'gran': 1, 'médico': 1, 'intendente': 1}, {}, {'gran': 1, 'médico': 1})
+        >>> index.update([("1", "Gran intendente", ["Topic=B"])])
+        (1, 0, 2)
+        >>> index.frequencies(), index.forms
+        ({'gran': 1, 'intendente': 1}, {'gran': Counter({'gran': 1}), 'intendente': Counter({'intendente': 1})})
+        """
+        added = relabelled = 0
+        current = set()
+        for row_id, text, labels in rows:
+            digest = self.comment_key(row_id, text)
+            current.add(digest)
+            labels = sorted(labels)
+            entry = self.entries.get(digest)
+            if entry is None:
+                forms = Counter(form for _, form in tokenize(text))
+                self._apply(forms, [ALL] + labels, +1)
+                for form, n in forms.items():
+                    self.forms.setdefault(strip_accents(form), Counter())[form] += n
+                self.entries[digest] = {"labels": labels, "forms": dict(forms)}
+                added += 1
+            elif entry["labels"] != labels:
+                previous = entry["labels"]
+                self._apply(entry["forms"], [l for l in previous if l not in labels], -1)
+                self._apply(entry["forms"], [l for l in labels if l not in previous], +1)
+                entry["labels"] = labels
+                relabelled += 1
+        stale = [digest for digest in self.entries if digest not in current]
+        for digest in stale:
+            self._forget(digest)
+        return added, relabelled, len(stale)
+
+    def labels(self) -> List[str]:
+        return sorted(label for label in self.counts if label != ALL)
+
+    def frequencies(self, label: Optional[str] = None) -> Dict[str, int]:
+        """Frecuencias listas para generate_from_frequencies, con la forma más frecuente de cada término."""
+        bucket = self.counts.get(label or ALL, Counter())
+        return {
+            self.forms[key].most_common(1)[0][0] if key in self.forms else key: n
+            for key, n in bucket.items()
+        }
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "entries": self.entries,
+                    "counts": {label: dict(c) for label, c in self.counts.items()},
+                    "forms": {key: dict(f) for key, f in self.forms.items()},
+                },
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp_path, self.path)
+
+
+def rows_from_table(df, id_column: str = "#", text_column: str = "Comentario") -> Iterable[Tuple[str, str, List[str]]]:
+    """Adapta una tabla (pandas) al formato de TermIndex.update()."""
+    label_columns = [c for c in LABEL_COLUMNS if c in df.columns]
+    ids = df[id_column].tolist() if id_column in df.columns else list(df.index)
+    label_values = [df[col].tolist() for col in label_columns]
+    for pos, (row_id, text) in enumerate(zip(ids, df[text_column].tolist())):
+        labels = []
+        for col, values in zip(label_columns, label_values):
+            value = values[pos]
+            if value is not None and str(value).strip() not in ("", "nan", "<NA>"):
+                labels.append(f"{col}={str(value).strip()}")
+        yield str(row_id), str(text), labels
+
+
+def update_index_from_table(df, index_path: str, rebuild: bool = False) -> TermIndex:
+    if rebuild and os.path.exists(index_path):
+        os.remove(index_path)
+    index = TermIndex(index_path)
+    added, relabelled, removed = index.update(rows_from_table(df))
+    index.save()
+    logging.info(
+        f"Índice de términos: {added} comentarios nuevos, {relabelled} reetiquetados, "
+        f"{removed} descontados, {len(index.entries)} en total"
+    )
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Actualiza el índice de frecuencias para las nubes de palabras")
+    parser.add_argument("--input", default="Analítica_Datos_Daniel_Carol.csv", help="Tabla de comentarios (.csv, .parquet o .arrow)")
+    parser.add_argument("--index", default="wordcloud_index.json", help="Archivo del índice")
+    parser.add_argument("--rebuild", action="store_true", help="Descartar el índice y volver a contar todo")
+    parser.add_argument("--list_labels", action="store_true", help="Mostrar las etiquetas disponibles y salir")
+    args = parser.parse_args()
+
+    if args.list_labels:
+        index = TermIndex(args.index)
+        for label in index.labels():
+            print(f"{label}: {sum(index.counts[label].values())} términos")
+        return
+
+    df = read_table(args.input, columns=["#", "Comentario"] + LABEL_COLUMNS)
+    update_index_from_table(df, args.index, rebuild=args.rebuild)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
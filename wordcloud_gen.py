@@ -1,35 +1,30 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 from wordcloud import WordCloud, STOPWORDS
 import os
+import argparse
 
-def create_wordcloud(input_file, output_image):
+from table_io import read_table
+from term_index import LABEL_COLUMNS, update_index_from_table
+
+def create_wordcloud(input_file, output_image, index_file="wordcloud_index.json", label=None):
     if not os.path.exists(input_file):
         print(f"Error: El archivo {input_file} no existe.")
         return
 
     # Cargar los datos
     print(f"Leyendo {input_file}...")
-    df = pd.read_csv(input_file)
-    
-    # Combinar todos los comentarios en un solo texto
-    text = " ".join(cat for cat in df.Comentario.astype(str))
-    
-    # Lista extendida de Stopwords en Español
-    spanish_stopwords = {
-        'de', 'la', 'que', 'el', 'en', 'y', 'a', 'los', 'del', 'se', 'las', 'por', 'un', 'para', 'con', 
-        'no', 'una', 'su', 'al', 'lo', 'como', 'más', 'pero', 'sus', 'le', 'ya', 'o', 'este', 'sí', 
-        'porque', 'esta', 'entre', 'cuando', 'muy', 'sin', 'sobre', 'también', 'me', 'hasta', 'hay', 
-        'donde', 'quien', 'desde', 'todo', 'nos', 'durante', 'todos', 'uno', 'les', 'ni', 'contra', 
-        'otros', 'ese', 'eso', 'ante', 'ellos', 'e', 'esto', 'mí', 'antes', 'algunos', 'qué', 'unos', 
-        'yo', 'otro', 'otras', 'otra', 'él', 'tanto', 'esa', 'estos', 'mucho', 'quienes', 'nada', 
-        'muchos', 'cual', 'poco', 'ella', 'estar', 'estas', 'algunas', 'algo', 'nosotros', 'mi', 
-        'mis', 'tú', 'te', 'ti', 'tu', 'tus', 'si', 'ser', 'es', 'era', 're', 'tan', 'va', 've', 'son',
-        'ha', 'han', 'hace', 'hacer', 'puede', 'pueden', 'ver', 'comentarios', 'facebook', 'post', 'https', 'comentario'
-    }
-    
-    # Combinar con las stopwords de la librería
-    all_stopwords = set(STOPWORDS).union(spanish_stopwords)
+    df = read_table(input_file, columns=['#', 'Comentario'] + LABEL_COLUMNS)
+
+    # El índice solo tokeniza los comentarios que no había visto
+    index = update_index_from_table(df, index_file)
+    if label and label not in index.counts:
+        print(f"Error: la etiqueta '{label}' no está en el índice. Disponibles: {', '.join(index.labels())}")
+        return
+    render_wordcloud(index.frequencies(label), output_image)
+
+def render_wordcloud(frequencies, output_image):
+    # Las stopwords en español ya se filtran en el índice; acá se suman las de la librería
+    frequencies = {w: n for w, n in frequencies.items() if w not in STOPWORDS}
 
     print("Generando nube de palabras...")
     
@@ -39,15 +34,12 @@ def create_wordcloud(input_file, output_image):
         height=800,
         background_color='white',
         colormap='viridis',      # Colores vibrantes (puedes probar 'plasma', 'magma', 'inferno')
-        stopwords=all_stopwords,
         min_font_size=10,
         max_words=200,
         contour_width=3,
         contour_color='steelblue',
-        collocations=False,       # Evita que se repitan palabras combinadas
-        include_numbers=False,
         random_state=42
-    ).generate(text)
+    ).generate_from_frequencies(frequencies)
 
     # Mostrar y guardar
     plt.figure(figsize=(20, 10), facecolor=None)
@@ -57,12 +49,17 @@ def create_wordcloud(input_file, output_image):
     
     # Guardar imagen
     plt.savefig(output_image, format="png", dpi=300)
+    plt.close()
     print(f"¡Éxito! Nube de palabras guardada como '{output_image}'")
     
     # Opcional: mostrar en pantalla si tienes interfaz gráfica
     # plt.show()
 
 if __name__ == "__main__":
-    input_csv = "comentarios_fb_limpios.csv"
-    output_png = "nube_comentarios.png"
-    create_wordcloud(input_csv, output_png)
+    parser = argparse.ArgumentParser(description="Nube de palabras de los comentarios")
+    parser.add_argument("--input", default="comentarios_fb_limpios.csv", help="Tabla de comentarios (.csv, .parquet o .arrow)")
+    parser.add_argument("--output", default="nube_comentarios.png", help="Imagen de salida")
+    parser.add_argument("--index", default="wordcloud_index.json", help="Índice persistente de frecuencias")
+    parser.add_argument("--label", default=None, help='Nube de una sola etiqueta, ej. "Apoyo Daniel=CONTRARIO" o "Topic=Rechazo a la denuncia"')
+    args = parser.parse_args()
+    create_wordcloud(args.input, args.output, index_file=args.index, label=args.label)